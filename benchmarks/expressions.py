@@ -0,0 +1,222 @@
+#
+#  This file is part of Bakefile (http://bakefile.org)
+#
+#  Copyright (C) 2013 Vaclav Slavik
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to
+#  deal in the Software without restriction, including without limitation the
+#  rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#  sell copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#  IN THE SOFTWARE.
+#
+
+"""
+Micro-benchmarks of the expression visitors.
+
+Usage::
+
+    python benchmarks/expressions.py -o results.json
+    python benchmarks/expressions.py --baseline=results.json
+
+Every benchmark runs a visitor over an expression of a typical shape, e.g. a
+long list built by repeated ``+=``, deeply nested ``if`` expressions created
+by conditional blocks or long conjunctions. The results use the same format
+as :mod:`benchmarks.runner` and can be compared with a baseline in the same
+way.
+"""
+
+import sys
+import os
+import os.path
+import json
+from optparse import OptionParser
+
+if __name__ == "__main__":
+    # make both bkl and this package importable when ran as a script:
+    _root = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    sys.path = [os.path.join(_root, "src"), _root] + sys.path
+
+from bkl.expr import (Visitor, RewritingVisitor, NullExpr, LiteralExpr, ListExpr,
+                      ConcatExpr, PlaceholderExpr, PathExpr, BoolExpr, IfExpr,
+                      ANCHOR_SRCDIR)
+from bkl.interpreter.simplify import BasicSimplifier, ConditionalsSimplifier
+
+from benchmarks.runner import PhaseTimer, compare_results, format_results
+
+
+def _cond(i):
+    return BoolExpr(BoolExpr.EQUAL, PlaceholderExpr("config"), LiteralExpr("Config%d" % (i % 4)))
+
+def list_shape(size):
+    """Long flat list, as created by many ``+=`` appends."""
+    return ListExpr([LiteralExpr("item%d" % i) for i in range(size)])
+
+def conditional_list_shape(size):
+    """List of items appended inside ``if`` blocks."""
+    return ListExpr([IfExpr(_cond(i), LiteralExpr("item%d" % i), NullExpr())
+                     for i in range(size)])
+
+def nested_if_shape(size):
+    """Deeply nested ``if`` expressions, e.g. from long ``elif``-like chains."""
+    e = LiteralExpr("default")
+    for i in range(size):
+        e = IfExpr(_cond(i), ListExpr([LiteralExpr("item%d" % i), e]), NullExpr())
+    return e
+
+def concat_shape(size):
+    """Long string concatenation."""
+    return ConcatExpr([PlaceholderExpr("config") if i % 2 else LiteralExpr("-x%d" % i)
+                       for i in range(size)])
+
+def paths_shape(size):
+    """List of paths, such as sources of a target."""
+    return ListExpr([PathExpr([LiteralExpr("dir%d" % (i % 10)), LiteralExpr("file%d.cpp" % i)],
+                              ANCHOR_SRCDIR)
+                     for i in range(size)])
+
+def conjunction_shape(size):
+    """Long chain of ``&&`` operators."""
+    e = _cond(0)
+    for i in range(1, size):
+        e = BoolExpr(BoolExpr.AND, e, BoolExpr(BoolExpr.NOT_EQUAL, PlaceholderExpr("arch%d" % i), LiteralExpr("x86")))
+    return e
+
+
+SHAPES = [
+    ("list", list_shape),
+    ("conditional_list", conditional_list_shape),
+    ("nested_if", nested_if_shape),
+    ("concat", concat_shape),
+    ("paths", paths_shape),
+    ("conjunction", conjunction_shape),
+]
+
+
+class _WalkingVisitor(Visitor):
+    # Visitor that only walks the expression, like many analysis passes do.
+    literal = Visitor.noop
+    bool_value = Visitor.noop
+    null = Visitor.noop
+    reference = Visitor.noop
+    placeholder = Visitor.noop
+    concat = Visitor.visit_children
+    list = Visitor.visit_children
+    path = Visitor.visit_children
+    bool = Visitor.visit_children
+    if_ = Visitor.visit_children
+
+
+VISITORS = [
+    ("walk", _WalkingVisitor),
+    ("rewrite", RewritingVisitor),
+    ("simplify", BasicSimplifier),
+    ("simplify_conditionals", ConditionalsSimplifier),
+]
+
+# Some visitors still recurse in their handlers, this is the maximal size they
+# are ran on for shapes nested proportionally to the size.
+MAX_RECURSIVE_SIZE = 100
+_DEEP_SHAPES = ("nested_if", "conjunction")
+_RECURSIVE_VISITORS = ("simplify", "simplify_conditionals")
+
+
+def run_benchmark(size=1000, repeat=3, number=10):
+    """
+    Runs all visitors on all expression shapes of given *size*. Every
+    measurement is done *repeat* times and the fastest one is used; it is
+    the time needed for *number* visits. Returns results in the form that
+    is saved into JSON files.
+    """
+    timer = PhaseTimer()
+    for shape_name, shape in SHAPES:
+        for visitor_name, visitor_class in VISITORS:
+            n = size
+            if shape_name in _DEEP_SHAPES and visitor_name in _RECURSIVE_VISITORS:
+                n = min(size, MAX_RECURSIVE_SIZE)
+            e = shape(n)
+            def work():
+                for i in range(number):
+                    visitor_class().visit(e)
+            for i in range(repeat):
+                timer.run("%s/%s" % (shape_name, visitor_name), work)
+
+    return {
+        "params": {"size": size, "number": number},
+        "repeat": repeat,
+        "phases": timer.as_list(),
+    }
+
+
+def main(argv):
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option(
+            "-s", "--size",
+            action="store", type="int", dest="size", default=1000,
+            help="number of items in the expressions (default: %default)")
+    parser.add_option(
+            "-n", "--number",
+            action="store", type="int", dest="number", default=10,
+            help="number of visits per measurement (default: %default)")
+    parser.add_option(
+            "-r", "--repeat",
+            action="store", type="int", dest="repeat", default=3,
+            help="number of measurements, the fastest one is used (default: %default)")
+    parser.add_option(
+            "-o", "--output",
+            action="store", dest="output", default=None,
+            metavar="FILE",
+            help="save results as JSON into FILE")
+    parser.add_option(
+            "-b", "--baseline",
+            action="store", dest="baseline", default=None,
+            metavar="FILE",
+            help="compare results with baseline saved in FILE")
+    parser.add_option(
+            "", "--threshold",
+            action="store", type="float", dest="threshold", default=0.2,
+            help="relative slowdown considered a regression (default: %default)")
+
+    options, args = parser.parse_args(argv)
+    if args:
+        parser.error("unexpected arguments")
+
+    baseline = None
+    if options.baseline:
+        with open(options.baseline, "rt") as f:
+            baseline = json.load(f)
+
+    results = run_benchmark(options.size, options.repeat, options.number)
+    print format_results(results, baseline)
+
+    if options.output:
+        with open(options.output, "wt") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if baseline:
+        if baseline["params"] != results["params"]:
+            sys.stderr.write("error: baseline was measured with different parameters (%s)\n" %
+                             ", ".join("%s=%s" % x for x in sorted(baseline["params"].items())))
+            return 3
+        regressions = compare_results(results, baseline, options.threshold, min_time=0.001)
+        if regressions:
+            sys.stderr.write("performance regressions detected:\n")
+            for r in regressions:
+                sys.stderr.write("  %s\n" % r)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
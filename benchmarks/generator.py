@@ -0,0 +1,260 @@
+#
+#  This file is part of Bakefile (http://bakefile.org)
+#
+#  Copyright (C) 2013 Vaclav Slavik
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to
+#  deal in the Software without restriction, including without limitation the
+#  rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#  sell copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#  IN THE SOFTWARE.
+#
+
+"""
+Generator of synthetic bakefiles used for benchmarking.
+
+The generated project consists of the top-level ``main.bkl`` file, which
+declares toolsets and settings, one submodule per module (``modN/modN.bkl``)
+and a chain of imported files (``common0.bkl`` importing ``common1.bkl`` and so
+on) with shared variables and templates. Every module contains a number of
+libraries and one program linked with them and with a library from the
+previous module. Targets use templates and conditional statements testing
+``config``, ``toolset`` and settings values.
+"""
+
+import os
+import os.path
+
+#: Toolsets the generated projects are written for.
+ALL_TOOLSETS = ["gnu",
+                "vs2010", "vs2012", "vs2013", "vs2015", "vs2017", "vs2019", "vs2022"]
+
+
+class ProjectParams(object):
+    """
+    Parameters of the generated project.
+
+    .. attribute:: modules
+
+       Number of modules (submodules of the top-level bakefile).
+
+    .. attribute:: targets
+
+       Number of targets per module, including the program.
+
+    .. attribute:: sources
+
+       Number of source files per target.
+
+    .. attribute:: templates
+
+       Number of templates, each derived from the previous one.
+
+    .. attribute:: conditionals
+
+       Number of conditional statements per target.
+
+    .. attribute:: settings
+
+       Number of settings tested in conditional statements.
+
+    .. attribute:: import_depth
+
+       Length of the chain of files imported by every module.
+    """
+    def __init__(self, modules=10, targets=10, sources=20, templates=4,
+                 conditionals=4, settings=2, import_depth=2):
+        self.modules = modules
+        self.targets = targets
+        self.sources = sources
+        self.templates = templates
+        self.conditionals = conditionals
+        self.settings = settings
+        self.import_depth = import_depth
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+    def __str__(self):
+        return ", ".join("%s=%d" % kv for kv in sorted(self.__dict__.items()))
+
+
+#: Predefined project sizes.
+PRESETS = {
+    "tiny":   ProjectParams(modules=2,  targets=2,  sources=3,   templates=2,
+                            conditionals=3, settings=1, import_depth=1),
+    "small":  ProjectParams(modules=5,  targets=5,  sources=10,  templates=2,
+                            conditionals=3, settings=1, import_depth=1),
+    "medium": ProjectParams(modules=10, targets=10, sources=20,  templates=4,
+                            conditionals=4, settings=2, import_depth=2),
+    "large":  ProjectParams(modules=20, targets=25, sources=100, templates=6,
+                            conditionals=6, settings=3, import_depth=3),
+}
+
+
+def _module_name(m):
+    return "mod%d" % m
+
+def _target_name(m, t, params):
+    if t == params.targets - 1:
+        return "mod%d_app" % m
+    else:
+        return "mod%d_lib%d" % (m, t)
+
+def _setting_name(s):
+    return "BENCH_SETTING_%d" % s
+
+
+def _write_file(filename, lines):
+    dirname = os.path.dirname(filename)
+    if dirname and not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    with open(filename, "wt") as f:
+        f.write("// This file was generated by benchmarks/generator.py.\n\n")
+        f.write("\n".join(lines))
+        f.write("\n")
+
+
+def _gen_solutionfiles(name, toolsets):
+    # Solutions (and, consequently, projects) for different Visual Studio
+    # versions must be put into separate directories so that they can coexist:
+    lines = ["%s.solutionfile = %s/%s.sln;" % (t, t, name)
+             for t in toolsets if t.startswith("vs")]
+    if lines:
+        lines.append("")
+    return lines
+
+
+def _gen_templates(params):
+    lines = []
+    for i in range(params.templates):
+        bases = " : bench_t%d" % (i - 1) if i > 0 else ""
+        lines += ["template bench_t%d%s {" % (i, bases),
+                  "    defines += BENCH_TEMPLATE_%d;" % i,
+                  "    includedirs += include/t%d;" % i,
+                  "}",
+                  ""]
+    return lines
+
+
+def _gen_common(params, depth):
+    lines = []
+    if depth + 1 < params.import_depth:
+        lines += ["import common%d.bkl;" % (depth + 1), ""]
+    lines += ["bench_common%d_defines = BENCH_COMMON_%d $(bench_common%d_defines);" % (depth, depth, depth + 1)
+              if depth + 1 < params.import_depth else
+              "bench_common%d_defines = BENCH_COMMON_%d;" % (depth, depth),
+              ""]
+    if depth == params.import_depth - 1:
+        lines += _gen_templates(params)
+    return lines
+
+
+def _gen_conditional(params, name, i):
+    kind = i % 3
+    if kind == 0 or params.settings == 0:
+        cond = "$(config) == Debug"
+    elif kind == 1:
+        cond = "$(toolset) == gnu"
+    else:
+        s = (i // 3) % params.settings
+        cond = "$(%s) == value%d" % (_setting_name(s), s)
+    return ["    if ( %s ) {" % cond,
+            "        defines += %s_COND_%d;" % (name.upper(), i),
+            "    }"]
+
+
+def _gen_target(params, m, t):
+    name = _target_name(m, t, params)
+    is_program = (t == params.targets - 1)
+
+    header = "program" if is_program else "library"
+    header += " %s" % name
+    if params.templates:
+        header += " : bench_t%d" % (t % params.templates)
+    lines = [header + " {"]
+
+    if is_program:
+        deps = [_target_name(m, i, params) for i in range(params.targets - 1)]
+        if m > 0 and params.targets > 1:
+            deps.append(_target_name(m - 1, 0, params))
+        if deps:
+            lines.append("    deps = %s;" % " ".join(deps))
+
+    defines = "%s" % name.upper()
+    if params.import_depth:
+        defines += " $(bench_common0_defines)"
+    lines.append("    defines += %s;" % defines)
+    lines.append("    includedirs += include;")
+
+    for i in range(params.conditionals):
+        lines += _gen_conditional(params, name, i)
+
+    lines.append("    sources {")
+    for s in range(params.sources):
+        lines.append("        src/%s/file%d.cpp" % (name, s))
+    lines.append("    }")
+    lines.append("}")
+    lines.append("")
+    return lines
+
+
+def _gen_module(params, m, toolsets):
+    lines = _gen_solutionfiles(_module_name(m), toolsets)
+    if params.import_depth:
+        lines += ["import ../common0.bkl;", ""]
+    for t in range(params.targets):
+        lines += _gen_target(params, m, t)
+    return lines
+
+
+def _gen_main(params, toolsets):
+    lines = ["toolsets = %s;" % " ".join(toolsets), ""]
+    lines += _gen_solutionfiles("main", toolsets)
+    for s in range(params.settings):
+        lines += ["setting %s {" % _setting_name(s),
+                  "    help = 'Benchmark setting %d';" % s,
+                  "    default = value%d;" % s,
+                  "}",
+                  "",
+                  "// Visual Studio projects are not configurable by settings:",
+                  "if ( $(toolset) != gnu )",
+                  "    %s = value%d;" % (_setting_name(s), s),
+                  ""]
+    if params.import_depth == 0:
+        lines += _gen_templates(params)
+    for m in range(params.modules):
+        name = _module_name(m)
+        lines.append("submodule %s/%s.bkl;" % (name, name))
+    return lines
+
+
+def generate_project(outdir, params, toolsets=ALL_TOOLSETS):
+    """
+    Writes synthetic project described by *params* (see
+    :class:`ProjectParams`) into directory *outdir*.
+
+    Returns the filename of the top-level bakefile.
+    """
+    main = os.path.join(outdir, "main.bkl")
+    _write_file(main, _gen_main(params, toolsets))
+    for d in range(params.import_depth):
+        _write_file(os.path.join(outdir, "common%d.bkl" % d),
+                    _gen_common(params, d))
+    for m in range(params.modules):
+        name = _module_name(m)
+        _write_file(os.path.join(outdir, name, "%s.bkl" % name),
+                    _gen_module(params, m, toolsets))
+    return main
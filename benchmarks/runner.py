@@ -0,0 +1,409 @@
+#
+#  This file is part of Bakefile (http://bakefile.org)
+#
+#  Copyright (C) 2013 Vaclav Slavik
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to
+#  deal in the Software without restriction, including without limitation the
+#  rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#  sell copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#  IN THE SOFTWARE.
+#
+
+"""
+Runs Bakefile on a synthetic project and measures how long the individual
+processing phases take and how much memory the process needs.
+
+Usage::
+
+    python benchmarks/runner.py --preset=large -o results.json
+    python benchmarks/runner.py --preset=large --baseline=baseline.json
+
+The measured phases are parsing of all input files, building of the model,
+its finalization and, for every toolset, preparing of the toolset-specific
+model and generating of the output (no files are written); total times of
+the interpreter passes done while finalizing are recorded as well. Results
+are saved as JSON and may be compared with a previously saved baseline; the
+runner exits with non-zero status if any phase or the peak memory of the
+process regressed by more than the given threshold.
+
+Memory is only measured as the peak of the whole process so far, because
+that's all the OS reports. The value recorded for every phase is therefore
+the peak up to the end of the phase, not the memory used by the phase alone.
+"""
+
+import sys
+import os
+import os.path
+import json
+import shutil
+import tempfile
+import logging
+from optparse import OptionParser
+from time import time
+
+try:
+    import resource
+except ImportError:
+    resource = None # not available on Windows
+
+if __name__ == "__main__":
+    # make both bkl and this package importable when ran as a script:
+    _root = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    sys.path = [os.path.join(_root, "src"), _root] + sys.path
+
+import bkl.api
+import bkl.interpreter.passes
+import bkl.io
+import bkl.parallel
+import bkl.parser
+import bkl.utils
+from bkl.interpreter import Interpreter
+
+from benchmarks.generator import ProjectParams, PRESETS, ALL_TOOLSETS, generate_project
+
+
+def peak_memory():
+    """
+    Returns peak memory usage of the process so far, in kilobytes, or
+    :const:`None` if it can't be determined on this platform.
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        rss /= 1024 # OS X reports the value in bytes
+    return rss
+
+
+class PhaseTimer(object):
+    """
+    Collects timings of named phases, keeping the fastest time if a phase is
+    run more than once, and the peak memory of the process up to the end of
+    every phase (see :func:`peak_memory`).
+    """
+    def __init__(self):
+        self.names = []
+        self.times = {}
+        self.memory = {}
+        self.pass_names = []
+        self.pass_times = {}
+
+    def run(self, name, func, *args):
+        start = time()
+        retval = func(*args)
+        duration = time() - start
+        mem = peak_memory()
+        if name not in self.times:
+            self.names.append(name)
+            self.times[name] = duration
+        else:
+            self.times[name] = min(self.times[name], duration)
+        self.memory[name] = max(self.memory.get(name), mem)
+        return retval
+
+    def add_passes(self, timings):
+        """
+        Records total times of interpreter passes from one run (see
+        :func:`bkl.interpreter.passes.pass_timings`), keeping the fastest.
+        """
+        for name, duration in timings.iteritems():
+            if name not in self.pass_times:
+                self.pass_names.append(name)
+                self.pass_times[name] = duration
+            else:
+                self.pass_times[name] = min(self.pass_times[name], duration)
+
+    def as_list(self):
+        return [{"phase": n, "time": self.times[n], "peak_memory": self.memory[n]}
+                for n in self.names]
+
+    def passes_as_list(self):
+        return [{"pass": n, "time": self.pass_times[n]} for n in self.pass_names]
+
+
+def _reset_global_state():
+    # Bakefile keeps some state at module level for the duration of the
+    # process; it has to be reset so that repeated runs measure the same work.
+    bkl.utils.reset_caches()
+    bkl.utils.reset_cache_stats()
+    bkl.interpreter.passes.reset_pass_timings()
+    bkl.io._all_written_files.clear()
+
+
+def _parse_all(topdir):
+    for dirpath, dirnames, filenames in os.walk(topdir):
+        dirnames.sort()
+        for f in sorted(filenames):
+            if f.endswith(".bkl"):
+                bkl.parser.parse_file(os.path.relpath(os.path.join(dirpath, f)))
+
+
+def _generate(model, toolset):
+    for step in bkl.api.CustomStep.all():
+        step.generate(model)
+    bkl.api.Toolset.get(toolset).generate(model)
+    bkl.utils.reset_caches(bkl.utils.CACHE_SCOPE_TOOLSET)
+
+
+def run_once(timer, main_file, toolsets):
+    """
+    Processes bakefile *main_file* for all *toolsets*, recording timings into
+    *timer* (see :class:`PhaseTimer`). Must be called with the directory of
+    *main_file* as the current directory.
+    """
+    _reset_global_state()
+    timer.run("parse", _parse_all, ".")
+
+    intr = Interpreter()
+    timer.run("build", intr.add_module, bkl.parser.parse_file(main_file), intr.model)
+    timer.run("finalize", intr.finalize)
+
+    for toolset in toolsets:
+        model = timer.run("finalize:%s" % toolset, _prepare_for_toolset, intr, toolset)
+        timer.run("generate:%s" % toolset, _generate, model, toolset)
+
+    timer.add_passes(bkl.interpreter.passes.pass_timings())
+
+
+def _prepare_for_toolset(intr, toolset):
+    model = intr.make_toolset_specific_model(toolset)
+    intr.finalize_for_toolset(model, toolset)
+    return model
+
+
+def run_benchmark(params, toolsets=ALL_TOOLSETS, repeat=1, workdir=None):
+    """
+    Generates synthetic project described by *params* and measures its
+    processing *repeat* times. Returns results in the form that is saved
+    into JSON files.
+    """
+    keep_workdir = workdir is not None
+    if workdir is None:
+        workdir = tempfile.mkdtemp(prefix="bkl-benchmark-")
+    old_dry_run = bkl.io.dry_run
+    old_written_files = dict(bkl.io._all_written_files)
+    cwd = os.getcwd()
+    try:
+        main_file = os.path.basename(generate_project(workdir, params, toolsets))
+        os.chdir(workdir)
+        bkl.io.dry_run = True
+        timer = PhaseTimer()
+        for i in range(repeat):
+            run_once(timer, main_file, toolsets)
+    finally:
+        os.chdir(cwd)
+        bkl.io.dry_run = old_dry_run
+        bkl.io._all_written_files.clear()
+        bkl.io._all_written_files.update(old_written_files)
+        if not keep_workdir:
+            shutil.rmtree(workdir)
+
+    return {
+        "params": params.as_dict(),
+        "toolsets": list(toolsets),
+        "repeat": repeat,
+        "phases": timer.as_list(),
+        "passes": timer.passes_as_list(),
+        "caches": bkl.utils.cache_stats(),
+    }
+
+
+def compare_results(results, baseline, threshold, min_time=0.01):
+    """
+    Compares *results* with *baseline* results and returns the list of
+    regressions, as human-readable strings.
+
+    A phase is considered to have regressed if it takes more than
+    ``1+threshold`` times the baseline time (and the difference is larger
+    than *min_time* seconds, to filter out noise in very fast phases). Memory
+    is compared only once, as the peak memory of the whole process, because
+    the per-phase values are peaks to date and not specific to the phase.
+    """
+    if results["params"] != baseline["params"]:
+        raise ValueError("baseline was measured on a different project (%s)" %
+                         ProjectParams(**baseline["params"]))
+
+    regressions = []
+    base_phases = dict((p["phase"], p) for p in baseline["phases"])
+    for p in results["phases"]:
+        base = base_phases.get(p["phase"])
+        if base is None:
+            continue
+        if (p["time"] > base["time"] * (1 + threshold) and
+                p["time"] - base["time"] > min_time):
+            regressions.append("%s: time %.3fs, baseline %.3fs" %
+                               (p["phase"], p["time"], base["time"]))
+
+    peak = _process_peak_memory(results)
+    base_peak = _process_peak_memory(baseline)
+    if peak is not None and base_peak is not None and peak > base_peak * (1 + threshold):
+        regressions.append("process peak memory %dkB, baseline %dkB" % (peak, base_peak))
+    return regressions
+
+
+def _process_peak_memory(results):
+    values = [p["peak_memory"] for p in results["phases"] if p["peak_memory"] is not None]
+    return max(values) if values else None
+
+
+def format_results(results, baseline=None):
+    base_phases = {}
+    if baseline:
+        base_phases = dict((p["phase"], p) for p in baseline["phases"])
+    width = max([20] + [len(p["phase"]) for p in results["phases"]])
+    lines = ["%-*s %10s %18s" % (width, "phase", "time [s]", "peak so far [kB]")]
+    for p in results["phases"]:
+        line = "%-*s %10.3f %18s" % (width, p["phase"], p["time"], p["peak_memory"])
+        base = base_phases.get(p["phase"])
+        if base and base["time"]:
+            line += "   %+6.1f%%" % (100.0 * (p["time"] - base["time"]) / base["time"])
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def format_cache_stats(results):
+    """
+    Formats statistics of memoized functions from the last run.
+    """
+    caches = sorted(results.get("caches", []), key=lambda c: c["name"])
+    width = max([20] + [len(c["name"]) for c in caches])
+    lines = ["%-*s %-8s %10s %10s %8s %10s" % (width, "cache", "scope", "hits", "misses", "hit rate", "peak size")]
+    for c in caches:
+        lines.append("%-*s %-8s %10d %10d %7.0f%% %10d" % (width, c["name"], c["scope"],
+                                                          c["hits"], c["misses"],
+                                                          c.get("hit_rate", 0.0) * 100,
+                                                          c["peak_size"]))
+    return "\n".join(lines)
+
+
+def format_pass_timings(results):
+    """
+    Formats total times of the interpreter passes, which are parts of the
+    finalize phases.
+    """
+    passes = results.get("passes", [])
+    width = max([20] + [len(p["pass"]) for p in passes])
+    lines = ["%-*s %10s" % (width, "pass", "time [s]")]
+    for p in passes:
+        lines.append("%-*s %10.3f" % (width, p["pass"], p["time"]))
+    return "\n".join(lines)
+
+
+def main(argv):
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option(
+            "", "--preset",
+            action="store", dest="preset", default="medium",
+            choices=sorted(PRESETS.keys()),
+            help="size of the generated project: %s (default: %%default)" % ", ".join(sorted(PRESETS.keys())))
+    for name in sorted(ProjectParams().as_dict().keys()):
+        parser.add_option(
+                "", "--%s" % name.replace("_", "-"),
+                action="store", type="int", dest=name, default=None,
+                metavar="N",
+                help="override the preset's number of %s" % name.replace("_", " "))
+    parser.add_option(
+            "-t", "--toolset",
+            action="append", dest="toolsets",
+            metavar="TOOLSET",
+            help="only benchmark the given toolset (may be specified more than once)")
+    parser.add_option(
+            "-r", "--repeat",
+            action="store", type="int", dest="repeat", default=1,
+            help="number of runs, the fastest one is used (default: %default)")
+    parser.add_option(
+            "-o", "--output",
+            action="store", dest="output", default=None,
+            metavar="FILE",
+            help="save results as JSON into FILE")
+    parser.add_option(
+            "-b", "--baseline",
+            action="store", dest="baseline", default=None,
+            metavar="FILE",
+            help="compare results with baseline saved in FILE")
+    parser.add_option(
+            "", "--threshold",
+            action="store", type="float", dest="threshold", default=0.2,
+            help="relative slowdown considered a regression (default: %default)")
+    parser.add_option(
+            "-j", "--jobs",
+            action="store", type="int", dest="jobs", default=1,
+            metavar="N",
+            help="use up to N worker processes when generating (default: %default)")
+    parser.add_option(
+            "", "--cache-stats",
+            action="store_true", dest="cache_stats", default=False,
+            help="show statistics of memoized functions")
+    parser.add_option(
+            "", "--pass-timings",
+            action="store_true", dest="pass_timings", default=False,
+            help="show times of the interpreter passes")
+    parser.add_option(
+            "", "--workdir",
+            action="store", dest="workdir", default=None,
+            metavar="DIR",
+            help="generate the project into DIR and keep it there")
+
+    options, args = parser.parse_args(argv)
+    if args:
+        parser.error("unexpected arguments")
+
+    logging.basicConfig(level=logging.WARNING)
+
+    params = ProjectParams(**PRESETS[options.preset].as_dict())
+    for name in params.as_dict():
+        value = getattr(options, name)
+        if value is not None:
+            setattr(params, name, value)
+    toolsets = options.toolsets or ALL_TOOLSETS
+
+    baseline = None
+    if options.baseline:
+        with open(options.baseline, "rt") as f:
+            baseline = json.load(f)
+
+    bkl.parallel.jobs = max(1, options.jobs)
+
+    print "benchmarking project with %s" % params
+    results = run_benchmark(params, toolsets, options.repeat, options.workdir)
+    print format_results(results, baseline)
+    if options.pass_timings:
+        print
+        print format_pass_timings(results)
+    if options.cache_stats:
+        print
+        print format_cache_stats(results)
+
+    if options.output:
+        with open(options.output, "wt") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if baseline:
+        try:
+            regressions = compare_results(results, baseline, options.threshold)
+        except ValueError as e:
+            sys.stderr.write("error: %s\n" % e)
+            return 3
+        if regressions:
+            sys.stderr.write("performance regressions detected:\n")
+            for r in regressions:
+                sys.stderr.write("  %s\n" % r)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -129,7 +129,12 @@ class Extension(object):
         global _extension_instances
         key = (cls, name)
         if key not in _extension_instances:
-            _extension_instances[key] = cls._implementations[name]()
+            if name not in cls._implementations:
+                import bkl.plugins
+                bkl.plugins.load_extension(cls.__name__, name)
+            # loading the plugin may have created the instance already
+            if key not in _extension_instances:
+                _extension_instances[key] = cls._implementations[name]()
         return _extension_instances[key]
 
     @classmethod
@@ -137,16 +142,33 @@ class Extension(object):
         """
         Returns iterator over instances of all implementations of this extension
         type.
+
+        Note that this loads all plugins implementing this extension type, use
+        :meth:`all_loaded()` to avoid it.
+        """
+        import bkl.plugins
+        bkl.plugins.load_extensions_of_kind(cls.__name__)
+        return cls.all_loaded()
+
+    @classmethod
+    def all_loaded(cls):
+        """
+        Returns iterator over instances of all implementations of this extension
+        type that were already loaded.
         """
-        for name in cls.all_names():
+        for name in cls._implementations.keys():
             yield cls.get(name)
 
     @classmethod
     def all_names(cls):
         """
-        Returns names of all implementations of this extension type.
+        Returns names of all implementations of this extension type, including
+        the ones from plugins that weren't loaded yet.
         """
-        return cls._implementations.keys()
+        import bkl.plugins
+        names = set(cls._implementations.keys())
+        names.update(bkl.plugins.extension_names(cls.__name__))
+        return list(names)
 
     @classmethod
     def all_properties_kinds(cls):
@@ -323,7 +345,7 @@ class Property(object):
     def _add_scope(self, scope):
         if self.scopes is None:
             self.scopes = [scope]
-        else:
+        elif scope not in self.scopes:
             self.scopes.append(scope)
 
     @property
@@ -385,10 +407,10 @@ class Property(object):
         return e
 
     def _add_toolset(self, toolset):
-        if self.toolsets:
-            self.toolsets.append(toolset)
-        else:
+        if not self.toolsets:
             self.toolsets = [toolset]
+        elif toolset not in self.toolsets:
+            self.toolsets.append(toolset)
 
 
 class BuildNode(object):
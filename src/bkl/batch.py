@@ -0,0 +1,137 @@
+#
+#  This file is part of Bakefile (http://bakefile.org)
+#
+#  Copyright (C) 2013 Vaclav Slavik
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to
+#  deal in the Software without restriction, including without limitation the
+#  rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#  sell copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#  IN THE SOFTWARE.
+#
+
+"""
+Processing of several independent projects in one run of Bakefile.
+
+The projects share everything that doesn't depend on the project: loaded
+plugins, the properties registry and parsed input files (see
+:data:`bkl.utils.CACHE_SCOPE_SESSION`), so that this is much faster than
+running Bakefile for each of them. Every project is processed by its own
+interpreter and errors in one of them don't prevent processing the others.
+"""
+
+import os.path
+
+import logging
+logger = logging.getLogger("bkl.batch")
+
+import bkl.parallel
+from bkl.error import Error
+
+
+def read_list_file(filename):
+    """
+    Returns names of input files listed in *filename*, one per line.
+    Relative names are relative to the directory of the list file. Empty
+    lines and lines starting with ``#`` are ignored.
+    """
+    basedir = os.path.dirname(filename)
+    files = []
+    with open(filename, "rt") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            files.append(os.path.join(basedir, line))
+    return files
+
+
+def expand_arguments(args):
+    """
+    Returns list of input files given by command line arguments *args*.
+    Arguments starting with ``@`` are names of list files, see
+    :func:`read_list_file`, the others are input files themselves. Files
+    given more than once are only included the first time.
+    """
+    files = []
+    for a in args:
+        if a.startswith("@"):
+            files += read_list_file(a[1:])
+        else:
+            files.append(a)
+    unique = []
+    found = set()
+    for f in files:
+        key = os.path.normpath(f)
+        if key not in found:
+            found.add(key)
+            unique.append(f)
+    return unique
+
+
+class BatchProcessor(object):
+    """
+    Processes several input files, each by a new interpreter created by
+    calling *make_interpreter*. If *use_workers* is true, the files are
+    processed in worker processes if :mod:`bkl.parallel` is enabled; this
+    must be disabled for interpreters with output other than files.
+
+    Errors are logged and processing continues with the next file, unless
+    *reraise* is set, in which case they are propagated to the caller.
+
+    .. attribute:: results
+
+       List of ``(filename, status)`` pairs for all processed files, where
+       status is 0 for successfully processed files and 1 for failed ones.
+    """
+    def __init__(self, make_interpreter, use_workers=True, reraise=False):
+        self.make_interpreter = make_interpreter
+        self.use_workers = use_workers
+        self.reraise = reraise
+        self.results = []
+
+    def process_file(self, filename):
+        """
+        Processes a single input file and returns its status.
+        """
+        try:
+            self.make_interpreter().process_file(filename)
+        except IOError as e:
+            if self.reraise:
+                raise
+            logger.error(e)
+            return 1
+        except Error as e:
+            if self.reraise:
+                raise
+            logger.error(e.msg, extra={"pos":e.pos})
+            return 1
+        return 0
+
+    def process(self, filenames):
+        """
+        Processes all files from the *filenames* list and returns the highest
+        of their statuses, i.e. 0 if all of them were processed successfully.
+        """
+        if self.use_workers:
+            statuses = bkl.parallel.map_in_workers(self.process_file, filenames)
+        else:
+            statuses = [self.process_file(f) for f in filenames]
+        self.results += zip(filenames, statuses)
+        return max(statuses) if statuses else 0
+
+    def failed_files(self):
+        """Returns list of names of files that failed to be processed."""
+        return [f for f, status in self.results if status != 0]
@@ -0,0 +1,205 @@
+#
+#  This file is part of Bakefile (http://bakefile.org)
+#
+#  Copyright (C) 2013 Vaclav Slavik
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to
+#  deal in the Software without restriction, including without limitation the
+#  rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#  sell copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#  IN THE SOFTWARE.
+#
+
+"""
+Binary decision diagrams for reasoning about boolean conditions.
+
+This module implements a small, reduced and ordered BDD package. Variables
+are *atoms* of the form ``(kind, name, value)`` which represent the test
+"variable *name* (of given *kind*) equals *value*". Atoms that share the same
+kind and name are considered to be mutually exclusive, i.e. a variable can't
+be equal to two different values at the same time. This is what makes the
+diagrams useful for conditions such as ``$(config)=="Debug"``.
+
+Nodes are hash-consed in a unique table and redundant tests, including those
+made redundant by the mutual exclusion of atoms, are removed, so two
+equivalent functions are always represented by the very same :class:`Node`
+object and equivalence (or always-true and always-false) checks are simple
+identity comparisons.
+
+See :class:`bkl.expr.CondAnalyzer` for conversion of Bakefile expressions
+into BDD nodes.
+"""
+
+
+class Node(object):
+    """
+    BDD node. Nodes are immutable and must only be created by
+    :class:`BDD`.
+
+    .. attribute:: atom
+
+       The tested atom or :const:`None` for the terminal nodes.
+
+    .. attribute:: high
+
+       Node to use if the atom's test succeeds.
+
+    .. attribute:: low
+
+       Node to use if the atom's test fails.
+    """
+    __slots__ = ("atom", "var", "high", "low")
+
+    def __init__(self, atom, high, low):
+        self.atom = atom
+        self.var = atom[:2] if atom is not None else None
+        self.high = high
+        self.low = low
+
+    def is_terminal(self):
+        return self.atom is None
+
+    def __repr__(self):
+        if self.atom is None:
+            return "TRUE" if self.high else "FALSE"
+        return "Node(%s==%r)" % (self.atom[1], self.atom[2])
+
+
+class BDD(object):
+    """
+    BDD manager, owning the unique table and the cache of operations.
+
+    All nodes that are combined together must come from the same manager.
+
+    .. attribute:: TRUE
+
+       Terminal node representing the constant true function.
+
+    .. attribute:: FALSE
+
+       Terminal node representing the constant false function.
+    """
+    def __init__(self):
+        self.TRUE = Node(None, True, True)
+        self.FALSE = Node(None, False, False)
+        self._unique = {}
+        self._ite_cache = {}
+        self._not_cache = {}
+
+    def __len__(self):
+        """Returns the number of non-terminal nodes in the unique table."""
+        return len(self._unique)
+
+    def const(self, value):
+        """Returns terminal node for given Python boolean value."""
+        return self.TRUE if value else self.FALSE
+
+    def atom(self, atom):
+        """
+        Returns node representing the test of a single atom.
+
+        :param atom: ``(kind, name, value)`` tuple; all of its items must be
+                     hashable and comparable with other atoms' items.
+        """
+        return self._mk(atom, self.TRUE, self.FALSE)
+
+    def _mk(self, atom, high, low):
+        var = atom[:2]
+        # On the high branch, the variable is known to be equal to atom's
+        # value, so any further test of the same variable fails:
+        while high.var == var:
+            high = high.low
+        # The low branch doesn't test atom's value, so for it, the value is
+        # just like any other value not tested by it. If the result for it is
+        # the same as on the high branch, the test is redundant. Removing it
+        # makes equal functions share the node even if they test different
+        # values of the same variable, e.g. "x!=a && x==b" and "x==b".
+        other = low
+        while other.var == var:
+            other = other.low
+        if high is other:
+            return low
+        key = (atom, high, low)
+        try:
+            return self._unique[key]
+        except KeyError:
+            n = Node(atom, high, low)
+            self._unique[key] = n
+            return n
+
+    def _cofactors(self, n, top):
+        if n.atom == top:
+            return n.high, n.low
+        high = n
+        while high.var == top[:2]:
+            high = high.low
+        return high, n
+
+    def ite(self, f, g, h):
+        """
+        Returns node for the "if *f* then *g* else *h*" function.
+        """
+        if f is self.TRUE:
+            return g
+        if f is self.FALSE:
+            return h
+        if g is h:
+            return g
+        if g is self.TRUE and h is self.FALSE:
+            return f
+        if g is self.FALSE and h is self.TRUE:
+            return self.not_(f)
+        key = (f, g, h)
+        try:
+            return self._ite_cache[key]
+        except KeyError:
+            pass
+        top = min(n.atom for n in (f, g, h) if n.atom is not None)
+        fh, fl = self._cofactors(f, top)
+        gh, gl = self._cofactors(g, top)
+        hh, hl = self._cofactors(h, top)
+        r = self._mk(top, self.ite(fh, gh, hh), self.ite(fl, gl, hl))
+        self._ite_cache[key] = r
+        return r
+
+    def not_(self, f):
+        """Returns negation of *f*."""
+        if f is self.TRUE:
+            return self.FALSE
+        if f is self.FALSE:
+            return self.TRUE
+        try:
+            return self._not_cache[f]
+        except KeyError:
+            r = self._mk(f.atom, self.not_(f.high), self.not_(f.low))
+            self._not_cache[f] = r
+            self._not_cache[r] = f
+            return r
+
+    def and_(self, f, g):
+        """Returns conjunction of *f* and *g*."""
+        return self.ite(f, g, self.FALSE)
+
+    def or_(self, f, g):
+        """Returns disjunction of *f* and *g*."""
+        return self.ite(f, self.TRUE, g)
+
+    def implies(self, f, g):
+        """Returns True if *f* implies *g* for all variable assignments."""
+        return self.ite(f, g, self.TRUE) is self.TRUE
+
+    def is_satisfiable(self, f):
+        """Returns True if there's at least one assignment making *f* true."""
+        return f is not self.FALSE
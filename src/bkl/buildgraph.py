@@ -0,0 +1,802 @@
+#
+#  This file is part of Bakefile (http://bakefile.org)
+#
+#  Copyright (C) 2013 Vaclav Slavik
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to
+#  deal in the Software without restriction, including without limitation the
+#  rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#  sell copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#  IN THE SOFTWARE.
+#
+
+"""
+Exporting build graphs of makefile-based toolsets for use by external tools.
+
+The graph consists of the nodes of build graphs (see
+:class:`bkl.api.BuildNode`) of all targets, one copy for every configuration
+of the target. Commands, inputs and outputs are formatted exactly as in the
+generated makefile of node's module, i.e. relative to its directory and with
+make variables (e.g. ``$(CC)``) left unexpanded. Dependencies between the
+nodes are given explicitly, so the consumers don't need to match the files.
+
+The graph can be saved either as JSON or in a compact binary form, see
+:meth:`BuildGraph.save`, or its shape can be analyzed with
+:class:`GraphAnalysis`. Build times logged by the makefiles can be summarized
+with :class:`TimingReport`.
+"""
+
+import os.path
+import re
+import struct
+
+import logging
+logger = logging.getLogger("bkl.buildgraph")
+
+import bkl.api
+import bkl.expr
+import bkl.utils
+from bkl.interpreter import Interpreter
+from bkl.error import Error, error_context, NonConstError
+
+
+class _ConfigSpecializer(bkl.expr.RewritingVisitor):
+    """
+    Resolves conditionals that depend only on the configuration. Unlike
+    :class:`bkl.model.ProxyIfResolver`, conditions that depend on settings
+    are kept, because makefiles can evaluate them at make time.
+    """
+    def __init__(self, project, config):
+        super(_ConfigSpecializer, self).__init__()
+        self.compiler = project.expr_compiler
+        self.env = {"config": config}
+
+    def reference(self, e):
+        return self.visit(e.get_value())
+
+    def if_(self, e):
+        try:
+            value = self.compiler.evaluate(e.cond, self.env)
+        except NonConstError:
+            return self._rewrite_children(e)
+        return self.visit(e.value_yes if value else e.value_no)
+
+    def specialize(self, exprs):
+        return [self.visit(e) for e in exprs]
+
+
+def _format_all(formatter, exprs):
+    # Conditional items may turn out to be empty for the configuration.
+    return [x for x in (formatter.format(e) for e in exprs) if x]
+
+
+class BuildGraphNode(object):
+    """
+    Node of the exported build graph.
+
+    .. attribute:: id
+
+       Index of the node in :attr:`BuildGraph.nodes`.
+
+    .. attribute:: toolset
+
+       Name of the toolset the node is for.
+
+    .. attribute:: module
+
+       Fully qualified name of the module the node's target is in.
+
+    .. attribute:: directory
+
+       Directory of the module's makefile, relative to the top source
+       directory (with ``/`` as separator). Commands are run in it.
+
+    .. attribute:: target
+
+       Name of the target the node belongs to.
+
+    .. attribute:: configuration
+
+       Name of the configuration.
+
+    .. attribute:: name
+
+       Name of phony node, or None.
+
+    .. attribute:: main
+
+       True if this is the main node of the target.
+
+    .. attribute:: commands
+
+       List of commands, as strings.
+
+    .. attribute:: inputs
+
+       List of input files (or phony targets), as strings.
+
+    .. attribute:: outputs
+
+       List of output files, as strings.
+
+    .. attribute:: deps
+
+       List of IDs of the nodes this node depends on.
+    """
+    def __init__(self, id, toolset, module, directory, target, configuration,
+                 name, main, commands, inputs, outputs):
+        self.id = id
+        self.toolset = toolset
+        self.module = module
+        self.directory = directory
+        self.target = target
+        self.configuration = configuration
+        self.name = name
+        self.main = main
+        self.commands = commands
+        self.inputs = inputs
+        self.outputs = outputs
+        self.deps = []
+
+    def as_dict(self):
+        return {
+            "id": self.id,
+            "toolset": self.toolset,
+            "module": self.module,
+            "directory": self.directory,
+            "target": self.target,
+            "configuration": self.configuration,
+            "name": self.name,
+            "main": self.main,
+            "commands": self.commands,
+            "inputs": self.inputs,
+            "outputs": self.outputs,
+            "deps": self.deps,
+        }
+
+
+class BuildGraph(object):
+    """
+    Build graph of a project, collected from one or more toolsets.
+
+    .. attribute:: nodes
+
+       List of all :class:`BuildGraphNode` nodes.
+    """
+
+    #: Version of the exported data format.
+    FORMAT_VERSION = 1
+
+    #: Magic bytes the binary form starts with.
+    BINARY_MAGIC = "BKLGRAPH"
+
+    def __init__(self):
+        self.nodes = []
+
+    @staticmethod
+    def supports(toolset):
+        """
+        Returns True if *toolset* (:class:`bkl.api.Toolset` instance) has
+        build graphs that can be collected.
+        """
+        return hasattr(toolset, "get_build_graphs")
+
+    def add_toolset(self, toolset, project, configurations=None):
+        """
+        Adds build graphs of all targets of *project* as generated by
+        *toolset* (a makefile-based :class:`bkl.api.Toolset` instance).
+        The project must be finalized for this toolset.
+
+        If *configurations* list is given, only nodes for these
+        configurations are added.
+        """
+        logger.debug("collecting build graph of %s", toolset.name)
+        graphs = toolset.get_build_graphs(project)
+        targets = dict((t.name, t) for t in project.all_targets())
+        top_srcdir = os.path.abspath(project.top_module.srcdir)
+        # Files are identified by their paths relative to the top directory,
+        # so that nodes from different modules agree on them:
+        key_fmt = toolset.ExprFormatter(toolset, bkl.expr.PathAnchorsInfo(
+                                            dirsep="/",
+                                            outfile=os.path.join(top_srcdir, "Makefile"),
+                                            builddir=None,
+                                            model=project.top_module))
+
+        # Nodes producing given (canonically formatted) file or phony target,
+        # and main nodes of targets, for every configuration:
+        specializers = {}
+        producers = {}
+        main_nodes = {}
+        added = []
+        for module in project.modules:
+            with error_context(module):
+                makefile_var = "%s.makefile" % toolset.name
+                makefile = module.get_variable_value(makefile_var).as_native_path_for_output(module)
+                directory = os.path.relpath(os.path.dirname(os.path.abspath(makefile)), top_srcdir)
+                directory = "/".join(directory.split(os.path.sep))
+                fmt = toolset.ExprFormatter(toolset, bkl.expr.PathAnchorsInfo(
+                                                dirsep="/",
+                                                outfile=makefile,
+                                                builddir=None,
+                                                model=module))
+            for t in module.targets.itervalues():
+                if t not in graphs:
+                    continue
+                with error_context(t):
+                    graph = graphs[t]
+                    for config in t["configurations"].as_py():
+                        if configurations is not None and config not in configurations:
+                            continue
+                        try:
+                            spec = specializers[config]
+                        except KeyError:
+                            spec = specializers[config] = _ConfigSpecializer(project, config)
+                        for node in graph.all_nodes():
+                            with error_context(node):
+                                inputs = spec.specialize(node.inputs)
+                                outputs = spec.specialize(node.outputs)
+                                n = BuildGraphNode(
+                                        id=len(self.nodes),
+                                        toolset=toolset.name,
+                                        module=module.fully_qualified_name,
+                                        directory=directory,
+                                        target=t.name,
+                                        configuration=config,
+                                        name=fmt.format(node.name) if node.name else None,
+                                        main=node is graph.main,
+                                        commands=_format_all(fmt, spec.specialize(node.commands)),
+                                        inputs=_format_all(fmt, inputs),
+                                        outputs=_format_all(fmt, outputs))
+                                self.nodes.append(n)
+                                if outputs:
+                                    for out in _format_all(key_fmt, outputs):
+                                        producers[(config, out)] = n
+                                else:
+                                    producers[(config, directory, n.name)] = n
+                                added.append((n, _format_all(key_fmt, inputs), t))
+                            if n.main:
+                                main_nodes[(t, config)] = n
+
+        for n, inputs, t in added:
+            deps = set()
+            for i in inputs:
+                dep = (producers.get((n.configuration, i)) or
+                       producers.get((n.configuration, n.directory, i)))
+                if dep is not None and dep is not n:
+                    deps.add(dep.id)
+            if n.main:
+                for d in t["deps"]:
+                    dep = main_nodes.get((targets[d.as_py()], n.configuration))
+                    if dep is not None:
+                        deps.add(dep.id)
+            n.deps = sorted(deps)
+
+    def as_dict(self):
+        """
+        Returns the graph as a dictionary, in the form it is saved as JSON.
+        """
+        return {
+            "version": self.FORMAT_VERSION,
+            "nodes": [n.as_dict() for n in self.nodes],
+        }
+
+    def save(self, filename):
+        """
+        Saves the graph into *filename*. If it has ``.json`` extension, the
+        graph is saved as JSON object with ``version`` and ``nodes`` keys,
+        with nodes described by objects with the attributes of
+        :class:`BuildGraphNode` as keys. Otherwise, it is saved in the binary
+        form written by :meth:`write_binary`.
+        """
+        logger.debug("saving build graph with %d nodes into %s", len(self.nodes), filename)
+        if filename.endswith(".json"):
+            import json
+            with open(filename, "wt") as f:
+                json.dump(self.as_dict(), f, indent=1, sort_keys=True)
+                f.write("\n")
+        else:
+            with open(filename, "wb") as f:
+                self.write_binary(f)
+
+    def write_binary(self, f):
+        """
+        Writes the graph into file object *f* in compact binary form. All
+        integers are unsigned 32bit little-endian numbers and strings are
+        stored only once, in a table at the beginning. The layout is:
+
+        * 8 bytes magic ``BKLGRAPH`` followed by the format version.
+        * Number of strings, then every string as its length followed by
+          its UTF-8 encoded bytes.
+        * Number of nodes, then for every node: indexes of its toolset,
+          module, directory, target, configuration and name strings (name is
+          ``0xFFFFFFFF`` if the node has no name), 1 if it is target's main
+          node or 0 if not, and then lists of commands, inputs and outputs
+          (as string indexes) and deps (as node IDs), every list prefixed
+          by the number of its items.
+        """
+        strings = {}
+        table = []
+        def s(x):
+            try:
+                return strings[x]
+            except KeyError:
+                strings[x] = len(table)
+                table.append(x)
+                return len(table) - 1
+
+        records = []
+        for n in self.nodes:
+            rec = [s(n.toolset), s(n.module), s(n.directory), s(n.target),
+                   s(n.configuration),
+                   0xFFFFFFFF if n.name is None else s(n.name),
+                   1 if n.main else 0]
+            for lst in (n.commands, n.inputs, n.outputs):
+                rec.append(len(lst))
+                rec.extend(s(x) for x in lst)
+            rec.append(len(n.deps))
+            rec.extend(n.deps)
+            records.append(rec)
+
+        f.write(self.BINARY_MAGIC)
+        f.write(struct.pack("<2I", self.FORMAT_VERSION, len(table)))
+        for x in table:
+            if isinstance(x, unicode):
+                x = x.encode("utf-8")
+            f.write(struct.pack("<I", len(x)))
+            f.write(x)
+        f.write(struct.pack("<I", len(records)))
+        for rec in records:
+            f.write(struct.pack("<%dI" % len(rec), *rec))
+
+
+def read_timing_records(filename):
+    """
+    Reads records of build times from *filename*. Every line of the file
+    describes one build command or node either as ``TARGET FILE SECONDS``
+    or as ``[...] [MODULE] TARGET FILE START END``, i.e. with start and end
+    times of the build, optionally preceded by the fully qualified name of
+    target's module and other (ignored) fields. The latter is the format of
+    the logs written by makefiles when ``timing-log`` property is set. FILE
+    is the name of node's first output, without the directory, or the name
+    of a phony node. Empty lines and lines starting with ``#`` are ignored.
+
+    Returns list of ``(module, target, file, seconds, start)`` tuples, where
+    *module* and *start* are :const:`None` if the record doesn't have them.
+    """
+    from bkl.parser.ast import Position
+    records = []
+    with open(filename, "rt") as f:
+        for lineno, line in enumerate(f, 1):
+            fields = line.split()
+            if not fields or fields[0].startswith("#"):
+                continue
+            try:
+                if len(fields) == 3:
+                    target, name, seconds = fields
+                    module = start = None
+                    seconds = float(seconds)
+                elif len(fields) >= 4:
+                    target, name, start, end = fields[-4:]
+                    module = fields[-5] if len(fields) >= 5 else None
+                    start = float(start)
+                    seconds = float(end) - start
+                else:
+                    raise ValueError
+            except ValueError:
+                raise Error("invalid timing record \"%s\"" % line.strip(),
+                            pos=Position(filename, lineno))
+            records.append((module, target, name, seconds, start))
+    return records
+
+
+def load_timings(filename):
+    """
+    Loads build times of nodes from *filename*, for use as node costs by
+    :class:`GraphAnalysis`. See :func:`read_timing_records` for the format of
+    the file. If a node is listed more than once, the times are added up, as
+    makefiles log every command of the node separately.
+
+    Returns dictionary mapping (target, file) tuples to times in seconds.
+    """
+    timings = {}
+    for module, target, name, seconds, start in read_timing_records(filename):
+        key = (target, name)
+        timings[key] = timings.get(key, 0.0) + seconds
+    return timings
+
+
+class TimingReport(object):
+    """
+    Summary of build times logged by makefiles with ``timing-log`` property
+    set, telling where the time of the build goes.
+
+    :param records: Records of build times, as returned by
+                    :func:`read_timing_records`.
+    """
+    #: Maximal number of entries listed in every part of the report.
+    report_limit = 10
+
+    def __init__(self, records):
+        self.records = list(records)
+
+    def total_time(self):
+        """Returns sum of times of all records."""
+        return sum(r[3] for r in self.records)
+
+    def wall_time(self):
+        """
+        Returns time between the start of the first command and the end of
+        the last one or :const:`None` if the records don't have start times.
+        """
+        timed = [r for r in self.records if r[4] is not None]
+        if not timed:
+            return None
+        return max(r[4] + r[3] for r in timed) - min(r[4] for r in timed)
+
+    def _aggregate(self, key):
+        totals = {}
+        for r in self.records:
+            k = key(r)
+            seconds, count = totals.get(k, (0.0, 0))
+            totals[k] = (seconds + r[3], count + 1)
+        return sorted(((seconds, count, k) for k, (seconds, count) in totals.iteritems()),
+                      key=lambda x: (-x[0], x[2]))
+
+    def by_target(self):
+        """
+        Returns list of ``(seconds, count, name)`` tuples with total time and
+        number of records of every target, sorted by time, longest first.
+        Targets are named with the fully qualified name of their module,
+        if known, e.g. ``main::sub::foo``.
+        """
+        return self._aggregate(lambda r: "%s::%s" % (r[0], r[1]) if r[0] else r[1])
+
+    def by_file_type(self):
+        """
+        Like :meth:`by_target`, but aggregated by extensions of the files.
+        """
+        return self._aggregate(lambda r: os.path.splitext(r[2])[1][1:] or "(no extension)")
+
+    def by_module(self):
+        """
+        Like :meth:`by_target`, but aggregated by modules.
+        """
+        return self._aggregate(lambda r: r[0] or "(unknown)")
+
+    def format_report(self):
+        """Returns text report with the summary."""
+        total = self.total_time()
+        out = []
+        out.append("records: %d, total time: %.2fs" % (len(self.records), total))
+        wall = self.wall_time()
+        if wall is not None:
+            out.append("wall time: %.2fs" % wall)
+        for title, entries in [("modules", self.by_module()),
+                               ("file types", self.by_file_type()),
+                               ("targets", self.by_target())]:
+            out.append("time by %s:" % title)
+            for seconds, count, name in entries[:self.report_limit]:
+                out.append("  %s: %.2fs, %.1f%% (%d records)" %
+                           (name, seconds, 100.0 * seconds / total if total else 0.0, count))
+        return "\n".join(out)
+
+
+def _node_file(node):
+    # name of node's output without directory or make variables such as
+    # $(_builddir), or name of phony node
+    if node.outputs:
+        return re.split(r"[/)]", node.outputs[0])[-1]
+    return node.name
+
+
+class GraphAnalysis(object):
+    """
+    Analysis of the shape of build graph (:class:`BuildGraph`) of a single
+    toolset and configuration, intended to find out why builds don't run in
+    parallel as much as they could.
+
+    :param project:  The project (:class:`bkl.model.Project`), finalized
+                     for the toolset.
+    :param nodes:    Nodes of the graph to analyze.
+    :param timings:  Optional dictionary with costs of the nodes, as returned
+                     by :func:`load_timings`. If not given, every node has
+                     cost 1.
+
+    .. attribute:: levels
+
+       Dictionary mapping node IDs to their levels: nodes without
+       dependencies are at level 0, others one level above the highest of
+       their dependencies.
+    """
+
+    #: Number of items shown in lists in :meth:`format_report`.
+    report_limit = 10
+
+    def __init__(self, project, nodes, timings=None):
+        self.project = project
+        self.nodes = dict((n.id, n) for n in nodes)
+        self.timings = timings
+        if timings is None:
+            self.costs = dict((i, 1.0) for i in self.nodes)
+        else:
+            self.costs = dict((n.id, timings.get((n.target, _node_file(n)), 0.0))
+                              for n in nodes)
+        self.order = self._sort_topologically()
+        self.levels = {}
+        for i in self.order:
+            deps = self.nodes[i].deps
+            self.levels[i] = 1 + max(self.levels[d] for d in deps) if deps else 0
+
+    def _sort_topologically(self):
+        # iterative DFS, so that deep graphs don't hit the recursion limit
+        order = []
+        state = {}
+        for start in sorted(self.nodes):
+            if start in state:
+                continue
+            state[start] = False
+            stack = [(start, iter(self.nodes[start].deps))]
+            while stack:
+                i, deps = stack[-1]
+                for d in deps:
+                    if d not in self.nodes:
+                        continue
+                    if d not in state:
+                        state[d] = False
+                        stack.append((d, iter(self.nodes[d].deps)))
+                        break
+                    elif state[d] is False:
+                        n = self.nodes[d]
+                        raise Error("cycle in build graph involving %s of target \"%s\"" %
+                                    (_node_file(n), n.target))
+                else:
+                    stack.pop()
+                    state[i] = True
+                    order.append(i)
+        return order
+
+    @property
+    def depth(self):
+        """Number of levels of the graph."""
+        return 1 + max(self.levels.itervalues()) if self.levels else 0
+
+    def widths(self):
+        """Returns list with numbers of nodes at every level."""
+        widths = [0] * self.depth
+        for level in self.levels.itervalues():
+            widths[level] += 1
+        return widths
+
+    def critical_path(self):
+        """
+        Returns the most costly chain of dependent nodes as (cost, nodes)
+        tuple, with the nodes ordered from the first one to build.
+        """
+        best = {}
+        for i in self.order:
+            deps = [d for d in self.nodes[i].deps if d in best]
+            prev = max(deps, key=lambda d: best[d][0]) if deps else None
+            best[i] = ((best[prev][0] if prev is not None else 0.0) + self.costs[i], prev)
+        if not best:
+            return (0.0, [])
+        # prefer longer paths if the costs are the same (e.g. missing timings)
+        last = max(self.order, key=lambda i: (best[i][0], self.levels[i]))
+        cost = best[last][0]
+        path = []
+        while last is not None:
+            path.append(self.nodes[last])
+            last = best[last][1]
+        path.reverse()
+        return (cost, path)
+
+    def fan_in(self):
+        """
+        Returns list of (count, node) tuples for nodes that other nodes
+        depend on, sorted by decreasing number of dependent nodes.
+        """
+        counts = {}
+        for n in self.nodes.itervalues():
+            for d in n.deps:
+                if d in self.nodes:
+                    counts[d] = counts.get(d, 0) + 1
+        return sorted(((c, self.nodes[i]) for i, c in counts.iteritems()),
+                      key=lambda x: (-x[0], x[1].id))
+
+    def longest_targets_chain(self):
+        """Returns the longest chain of dependent targets, as list of names."""
+        deps = {}
+        for n in self.nodes.itervalues():
+            deps.setdefault(n.target, set())
+            if n.main:
+                for d in n.deps:
+                    dep = self.nodes.get(d)
+                    if dep is not None and dep.main and dep.target != n.target:
+                        deps[n.target].add(dep.target)
+        return _longest_chain(deps)
+
+    def submake_ordering(self):
+        """
+        Returns list of ordering constraints between sub-makefiles, as
+        (parent, submodule, waits_for) tuples of modules: *submodule*'s
+        sub-make is only started after *waits_for*'s finished.
+        """
+        from bkl.makefile import _ModulesGraph
+        graph = _ModulesGraph(self.project)
+        result = []
+        for main in self.project.modules:
+            for sub in graph.submodules[main]:
+                waits_for = set()
+                for tdep in graph.subtree_deps(sub):
+                    tmod = graph.child_containing(main, tdep.parent)
+                    if tmod is not None and tmod is not main and tmod is not sub:
+                        waits_for.add(tmod)
+                for w in sorted(waits_for, key=lambda m: m.fully_qualified_name):
+                    result.append((main, sub, w))
+        return result
+
+    def longest_submodules_chain(self):
+        """
+        Returns the longest chain of sub-makefiles that must be built one
+        after another, as list of modules' fully qualified names.
+        """
+        deps = {}
+        for main, sub, waits_for in self.submake_ordering():
+            deps.setdefault(sub.fully_qualified_name, set()).add(waits_for.fully_qualified_name)
+            deps.setdefault(waits_for.fully_qualified_name, set())
+        return _longest_chain(deps)
+
+    def serialization_points(self):
+        """
+        Returns list of serialization points caused by ordering of
+        sub-makefiles (see :meth:`submake_ordering`), sorted by decreasing
+        cost of the nodes built before they are needed. Every item is a
+        dictionary with the following keys:
+
+        * ``parent``, ``submodule``, ``waits_for`` -- modules as in
+          :meth:`submake_ordering`.
+        * ``blocked`` -- number of nodes of *submodule* (and its submodules)
+          waiting for the sub-make of *waits_for* to finish.
+        * ``needed``, ``total`` -- number of nodes of *waits_for* that are
+          actually needed by the blocked nodes and of all its nodes.
+        * ``unneeded_cost`` -- cost of the nodes that aren't needed.
+        """
+        def in_subtree(n, module):
+            fqn = module.fully_qualified_name
+            return n.module == fqn or n.module.startswith(fqn + "::")
+
+        points = []
+        for main, sub, waits_for in self.submake_ordering():
+            blocked = [n for n in self.nodes.itervalues() if in_subtree(n, sub)]
+            waited = set(n.id for n in self.nodes.itervalues() if in_subtree(n, waits_for))
+            needed = set()
+            todo = [d for n in blocked for d in n.deps]
+            while todo:
+                i = todo.pop()
+                if i in needed or i not in self.nodes:
+                    continue
+                needed.add(i)
+                todo.extend(self.nodes[i].deps)
+            needed &= waited
+            points.append({
+                "parent": main,
+                "submodule": sub,
+                "waits_for": waits_for,
+                "blocked": len(blocked),
+                "needed": len(needed),
+                "total": len(waited),
+                "unneeded_cost": sum(self.costs[i] for i in waited - needed),
+            })
+        points.sort(key=lambda p: (-p["unneeded_cost"], -p["blocked"]))
+        return points
+
+    def format_report(self):
+        """Returns text report with the results of the analysis."""
+        limit = self.report_limit
+        edges = sum(len(n.deps) for n in self.nodes.itervalues())
+        out = []
+        out.append("nodes: %d, dependencies: %d" % (len(self.nodes), edges))
+        if self.timings is not None:
+            missing = sum(1 for n in self.nodes.itervalues()
+                          if (n.target, _node_file(n)) not in self.timings)
+            out.append("nodes without timing: %d" % missing)
+        out.append("depth: %d" % self.depth)
+        out.append("width by level: %s" % ", ".join(str(w) for w in self.widths()))
+
+        cost, path = self.critical_path()
+        out.append("critical path (cost %g, %d nodes):" % (cost, len(path)))
+        for n in path:
+            out.append("  %s: %s (%g)" % (n.target, _node_file(n), self.costs[n.id]))
+
+        chain = self.longest_targets_chain()
+        out.append("longest chain of targets (%d): %s" % (len(chain), " -> ".join(chain)))
+        chain = self.longest_submodules_chain()
+        out.append("longest chain of sub-makefiles (%d): %s" % (len(chain), " -> ".join(chain)))
+
+        out.append("fan-in hotspots:")
+        for count, n in [x for x in self.fan_in() if x[0] > 1][:limit]:
+            out.append("  %s: %s (%d dependent nodes)" % (n.target, _node_file(n), count))
+
+        out.append("sub-make serialization points:")
+        for p in self.serialization_points()[:limit]:
+            out.append("  %s waits for %s (%d of its %d nodes not needed, cost %g; %d nodes blocked)" %
+                       (p["submodule"].fully_qualified_name,
+                        p["waits_for"].fully_qualified_name,
+                        p["total"] - p["needed"], p["total"],
+                        p["unneeded_cost"], p["blocked"]))
+        return "\n".join(out)
+
+
+def _longest_chain(deps):
+    # deps maps names to sets of names they depend on; returns the longest
+    # chain, starting with the name with no dependencies
+    longest = {}
+    for name in sorted(deps):
+        if name in longest:
+            continue
+        path = set([name])
+        stack = [(name, iter(sorted(deps[name])))]
+        while stack:
+            x, pending = stack[-1]
+            for d in pending:
+                if d in path:
+                    raise Error("cyclic dependency involving \"%s\"" % d)
+                if d not in longest:
+                    path.add(d)
+                    stack.append((d, iter(sorted(deps.get(d, ())))))
+                    break
+            else:
+                stack.pop()
+                path.discard(x)
+                best = []
+                for d in sorted(deps.get(x, ())):
+                    if len(longest[d]) > len(best):
+                        best = longest[d]
+                longest[x] = best + [x]
+    best = []
+    for name in sorted(longest):
+        if len(longest[name]) > len(best):
+            best = longest[name]
+    return best
+
+
+class GraphAnalyzingInterpreter(Interpreter):
+    """
+    Interpreter that doesn't generate any output, but prints analysis
+    (see :class:`GraphAnalysis`) of build graphs of makefile toolsets
+    instead. Only the first configuration of the project is analyzed.
+
+    :param timings: Optional nodes costs, see :func:`load_timings`.
+    """
+    def __init__(self, timings=None):
+        super(GraphAnalyzingInterpreter, self).__init__()
+        self.timings = timings
+
+    def generate_for_toolset(self, toolset, skip_making_copy=False):
+        toolset_obj = bkl.api.Toolset.get(toolset)
+        if not BuildGraph.supports(toolset_obj):
+            logger.info("toolset %s doesn't have build graph, skipping it", toolset)
+            return
+        model = self.make_toolset_specific_model(toolset, skip_making_copy)
+        self.finalize_for_toolset(model, toolset)
+        config = model.configurations.keys()[0]
+        try:
+            graph = BuildGraph()
+            graph.add_toolset(toolset_obj, model, configurations=[config])
+            analysis = GraphAnalysis(model, graph.nodes, self.timings)
+            print "build graph of toolset %s, configuration %s:" % (toolset, config)
+            print analysis.format_report()
+            print
+        finally:
+            bkl.utils.reset_caches(bkl.utils.CACHE_SCOPE_TOOLSET)
@@ -34,7 +34,9 @@ import itertools
 import re
 from abc import ABCMeta, abstractmethod
 
+from bdd import BDD
 from error import NonConstError, CannotDetermineError, ParserError, Error, error_context, warning
+from utils import CacheStats
 
 
 class Expr(object):
@@ -52,7 +54,17 @@ class Expr(object):
     .. attribute:: pos
 
        Location of the expression in source tree.
+
+    .. attribute:: has_local_paths
+
+       True if the expression contains (directly, not through references)
+       any path relative to ``@srcdir`` or ``@builddir``, i.e. a path that
+       :class:`bkl.interpreter.passes.PathsNormalizer` may need to rewrite.
+       This is determined when the expression is created, so that already
+       normalized subtrees can be skipped quickly.
     """
+    has_local_paths = False
+
     def __init__(self, pos=None):
         self.pos = pos
     
@@ -147,6 +159,7 @@ class ListExpr(Expr):
     def __init__(self, items, pos=None):
         super(ListExpr, self).__init__(pos)
         self.items = items
+        self.has_local_paths = any(i.has_local_paths for i in items)
 
     def as_py(self):
         return [ i.as_py() for i in self.items ]
@@ -173,6 +186,7 @@ class ConcatExpr(Expr):
         super(ConcatExpr, self).__init__(pos)
         assert len(items) > 0
         self.items = items
+        self.has_local_paths = any(i.has_local_paths for i in items)
 
     def as_py(self):
         items = (i.as_py() for i in self.items)
@@ -336,6 +350,8 @@ class BoolExpr(Expr):
         self.operator = operator
         self.left = left
         self.right = right
+        self.has_local_paths = (left.has_local_paths or
+                                (right is not None and right.has_local_paths))
     
     def has_bool_operands(self):
         """
@@ -408,6 +424,9 @@ class IfExpr(Expr):
         self.cond = cond
         self.value_yes = yes
         self.value_no = no
+        self.has_local_paths = (cond.has_local_paths or
+                                yes.has_local_paths or
+                                no.has_local_paths)
 
     def as_py(self):
         return self.get_value().as_py()
@@ -446,6 +465,9 @@ ANCHOR_TOP_BUILDDIR = "@top_builddir"
 # all possible anchors
 ANCHORS = [ANCHOR_SRCDIR, ANCHOR_TOP_SRCDIR, ANCHOR_BUILDDIR, ANCHOR_TOP_BUILDDIR]
 
+# anchors that must be normalized before the paths can be used elsewhere
+_LOCAL_ANCHORS = (ANCHOR_SRCDIR, ANCHOR_BUILDDIR)
+
 class PathExpr(Expr):
     """
     Expression that holds a file or directory name, or part of it.
@@ -491,6 +513,8 @@ class PathExpr(Expr):
         self.components = components
         self.anchor = anchor
         self.anchor_file = anchor_file
+        # paths anchored at @top_srcdir or @top_builddir are normalized already
+        self.has_local_paths = anchor in _LOCAL_ANCHORS
 
     def as_py(self):
         # We can't represent a path as something natively useful (e.g. native
@@ -617,28 +641,54 @@ class PathExpr(Expr):
         return isinstance(first, PlaceholderExpr)
 
 
+# Names of Visitor methods handling the individual expression types.
+_VISITOR_METHODS = {
+    NullExpr         : "null",
+    LiteralExpr      : "literal",
+    ListExpr         : "list",
+    ConcatExpr       : "concat",
+    ReferenceExpr    : "reference",
+    PlaceholderExpr  : "placeholder",
+    PathExpr         : "path",
+    BoolValueExpr    : "bool_value",
+    BoolExpr         : "bool",
+    IfExpr           : "if_",
+}
+
+# Functions returning the list of children of composite expressions.
+_CHILDREN = {
+    ListExpr         : lambda e: e.items,
+    ConcatExpr       : lambda e: e.items,
+    PathExpr         : lambda e: e.components,
+    BoolExpr         : lambda e: [e.left] if e.right is None else [e.left, e.right],
+    IfExpr           : lambda e: [e.cond, e.value_yes, e.value_no],
+}
+
+
+# Metaclass used for all visitors, it precomputes the dispatch table of every
+# visitor class, so that it doesn't have to be done for every instance.
+class _VisitorMetaclass(ABCMeta):
+    def __init__(cls, name, bases, dct):
+        super(_VisitorMetaclass, cls).__init__(name, bases, dct)
+        table = {}
+        for t, method in _VISITOR_METHODS.iteritems():
+            func = getattr(cls, method)
+            table[t] = getattr(func, "im_func", func)
+        cls._dispatch_table = table
+
+
 class Visitor(object):
     """
     Implements visitor pattern for :class:`Expr` expressions. This is abstract
     base class, derived classes must implement all of its methods except
     :meth:`visit()`. The way visitors are used is that the caller calls
     :meth:`visit()` on the expression.
-    """
-    __metaclass__ = ABCMeta
 
-    def __init__(self):
-        self._dispatch = {
-            NullExpr         : self.null,
-            LiteralExpr      : self.literal,
-            ListExpr         : self.list,
-            ConcatExpr       : self.concat,
-            ReferenceExpr    : self.reference,
-            PlaceholderExpr  : self.placeholder,
-            PathExpr         : self.path,
-            BoolValueExpr    : self.bool_value,
-            BoolExpr         : self.bool,
-            IfExpr           : self.if_,
-        }
+    Handlers implemented with :meth:`visit_children()` don't recurse, they
+    walk the tree using an explicit stack, so that even very deeply nested
+    expressions can be visited.
+    """
+    __metaclass__ = _VisitorMetaclass
 
     def visit(self, e):
         """
@@ -648,7 +698,7 @@ class Visitor(object):
         Return value is the value returned by the appropriate callback and
         is typically :const:`None`.
         """
-        return self._dispatch[type(e)](e)
+        return self._dispatch_table[type(e)](self, e)
 
     @abstractmethod
     def null(self, e):
@@ -708,21 +758,22 @@ class Visitor(object):
         Helper to implement visitor methods that just need to recursively
         work on all children. Ignores return value for the children.
         """
-        t = type(e)
-        if t is ListExpr:
-            for i in e.items: self.visit(i)
-        elif t is ConcatExpr:
-            for i in e.items: self.visit(i)
-        elif t is PathExpr:
-            for i in e.components: self.visit(i)
-        elif t is BoolExpr:
-            self.visit(e.left)
-            if e.right is not None:
-                self.visit(e.right)
-        elif t is IfExpr:
-            self.visit(e.cond)
-            self.visit(e.value_yes)
-            self.visit(e.value_no)
+        table = self._dispatch_table
+        get_children = _CHILDREN.get(type(e))
+        if get_children is None:
+            return
+        # Children handled by visit_children() too are expanded in place
+        # instead of recursing; the order of calls is the same as if it
+        # recursed, though.
+        stack = get_children(e)[::-1]
+        while stack:
+            i = stack.pop()
+            t = type(i)
+            func = table[t]
+            if func is _visit_children:
+                stack.extend(_CHILDREN[t](i)[::-1])
+            else:
+                func(self, i)
 
 
 class RewritingVisitor(Visitor):
@@ -737,8 +788,18 @@ class RewritingVisitor(Visitor):
     implementations of the others will do the right thing: for example, if an
     item in the list is rewritten, the list() method will detect it and return
     a new list.
+
+    .. attribute:: only_if_flagged
+
+       If set to the name of a boolean attribute of :class:`Expr` (e.g.
+       ``"has_local_paths"``), the default implementations don't descend into
+       composite expressions for which the attribute is false and return them
+       unchanged. Set it in derived classes that only rewrite some kinds of
+       expressions.
     """
 
+    only_if_flagged = None
+
     def _process_children(self, children):
         """
         Process all items from the *children* list. Returns a tuple of two
@@ -765,39 +826,117 @@ class RewritingVisitor(Visitor):
     reference = Visitor.noop
     placeholder = Visitor.noop
 
-    def list(self, e):
-        new, changed = self._process_children(e.items)
-        if not changed:
-            return e
-        return ListExpr(new, pos=e.pos)
+    def _rewrite_children(self, e):
+        """
+        Default implementation of the handlers of composite expressions:
+        visits their children and creates a new expression if any of them
+        changed. Null children of lists, concatenations and paths are removed.
 
-    def concat(self, e):
-        # merge concatenated literals:
-        items, changed = self._process_children(e.items)
-        if not changed:
+        Children handled by this method as well are processed using an
+        explicit stack instead of recursion.
+        """
+        flag = self.only_if_flagged
+        if flag is not None and not getattr(e, flag):
             return e
-        return ConcatExpr(items, pos=e.pos)
+        table = self._dispatch_table
+        get_children = _CHILDREN
+        rebuild = _REBUILD
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        node = e
+        children = get_children[type(e)](e)
+        results = []
+        i = 0
+        while True:
+            count = len(children)
+            while i < count:
+                child = children[i]
+                t = type(child)
+                func = table[t]
+                if func is _rewrite_children:
+                    if flag is not None and not getattr(child, flag):
+                        # nothing to rewrite in this subtree
+                        results.append(child)
+                        i += 1
+                        continue
+                    # descend into the child, remembering where to continue
+                    push((node, children, results, i))
+                    node = child
+                    children = get_children[t](child)
+                    results = []
+                    i = 0
+                    count = len(children)
+                else:
+                    results.append(func(self, child))
+                    i += 1
+            value = rebuild[type(node)](node, results)
+            if not stack:
+                return value
+            node, children, results, i = pop()
+            results.append(value)
+            i += 1
+
+    list = _rewrite_children
+    concat = _rewrite_children
+    path = _rewrite_children
+    bool = _rewrite_children
+    if_ = _rewrite_children
+
+
+_visit_children = Visitor.visit_children.im_func
+_rewrite_children = RewritingVisitor._rewrite_children.im_func
+
+
+def _rebuild_items(children, results):
+    # Same logic as RewritingVisitor._process_children()
+    new = []
+    changed = False
+    for i, j in itertools.izip(children, results):
+        if i is not j:
+            changed = True
+        if isinstance(j, NullExpr):
+            changed = True
+        else:
+            new.append(j)
+    return new if changed else None
 
-    def path(self, e):
-        components, changed = self._process_children(e.components)
-        if not changed:
-            return e
-        return PathExpr(components, e.anchor, e.anchor_file, pos=e.pos)
+def _rebuild_list(e, results):
+    new = _rebuild_items(e.items, results)
+    return e if new is None else ListExpr(new, pos=e.pos)
 
-    def bool(self, e):
-        left = self.visit(e.left)
-        right = None if e.right is None else self.visit(e.right)
-        if left is e.left and right is e.right:
-            return e
-        return BoolExpr(e.operator, left, right, pos=e.pos)
+def _rebuild_concat(e, results):
+    new = _rebuild_items(e.items, results)
+    return e if new is None else ConcatExpr(new, pos=e.pos)
 
-    def if_(self, e):
-        cond = self.visit(e.cond)
-        yes = self.visit(e.value_yes)
-        no = self.visit(e.value_no)
-        if cond is e.cond and yes is e.value_yes and no is e.value_no:
+def _rebuild_path(e, results):
+    new = _rebuild_items(e.components, results)
+    return e if new is None else PathExpr(new, e.anchor, e.anchor_file, pos=e.pos)
+
+def _rebuild_bool(e, results):
+    if e.right is None:
+        left, = results
+        if left is e.left:
             return e
-        return IfExpr(cond, yes, no, pos=e.pos)
+        return BoolExpr(e.operator, left, None, pos=e.pos)
+    left, right = results
+    if left is e.left and right is e.right:
+        return e
+    return BoolExpr(e.operator, left, right, pos=e.pos)
+
+def _rebuild_if(e, results):
+    cond, yes, no = results
+    if cond is e.cond and yes is e.value_yes and no is e.value_no:
+        return e
+    return IfExpr(cond, yes, no, pos=e.pos)
+
+_REBUILD = {
+    ListExpr         : _rebuild_list,
+    ConcatExpr       : _rebuild_concat,
+    PathExpr         : _rebuild_path,
+    BoolExpr         : _rebuild_bool,
+    IfExpr           : _rebuild_if,
+}
 
 
 class PathAnchorsInfo(object):
@@ -884,6 +1023,34 @@ class PathAnchorsInfo(object):
             self.builddir_abs = None
 
 
+# Functions computing keys for Formatter's cache, see _format_cache_key().
+_FORMAT_CACHE_KEYS = {
+    NullExpr         : lambda e: ("n",),
+    LiteralExpr      : lambda e: e.value,
+    ListExpr         : lambda e: ("l",) + tuple(_format_cache_key(x) for x in e.items),
+    ConcatExpr       : lambda e: ("c",) + tuple(_format_cache_key(x) for x in e.items),
+    ReferenceExpr    : lambda e: ("r", e.var, e.context),
+    PlaceholderExpr  : lambda e: ("h", e.var),
+    PathExpr         : lambda e: ("p", e.anchor) + tuple(_format_cache_key(x) for x in e.components),
+    BoolValueExpr    : lambda e: ("v", bool(e.value)),
+    BoolExpr         : lambda e: ("b", e.operator, _format_cache_key(e.left),
+                                  None if e.right is None else _format_cache_key(e.right)),
+    IfExpr           : lambda e: ("i", _format_cache_key(e.cond),
+                                  _format_cache_key(e.value_yes), _format_cache_key(e.value_no)),
+}
+
+def _format_cache_key(e):
+    """
+    Returns hashable key describing the structure of expression *e*, such
+    that expressions with equal keys are formatted in the same way. Only
+    works for the standard expression types, throws KeyError for others.
+    """
+    return _FORMAT_CACHE_KEYS[type(e)](e)
+
+# Expression types that are cheaper to format than to look up in the cache.
+_NOT_CACHED_TYPES = frozenset([NullExpr, LiteralExpr, PlaceholderExpr, BoolValueExpr])
+
+
 class Formatter(Visitor):
     """
     Base class for expression formatters. A *formatter* is a class that
@@ -904,18 +1071,49 @@ class Formatter(Visitor):
     .. attribute:: paths_info
 
        :class:`PathAnchorsInfo` information object to use for formatting of paths.
+
+    .. attribute:: use_cache
+
+       Whether to remember formatted expressions. Because the same
+       expressions (e.g. paths to dependencies or lists of include
+       directories) are typically formatted many times when generating
+       output, every formatter caches the results, keyed by the structure of
+       the expression. This means that formatters with side effects (e.g.
+       noting that builddir is used) must keep them for at least as long as
+       the formatter exists.
     """
     list_sep = " "
+    use_cache = True
 
     def __init__(self, paths_info):
         super(Formatter, self).__init__()
         self.paths_info = paths_info
+        if self.use_cache:
+            self._cache = {}
+            self._cache_stats = _formatter_cache_stats(type(self))
 
     def format(self, e):
         """
         Formats expression *e* into a string.
         """
-        return self.visit(e)
+        if not self.use_cache or type(e) in _NOT_CACHED_TYPES:
+            return self.visit(e)
+        try:
+            key = _format_cache_key(e)
+        except KeyError:
+            # custom expression type, can't be cached
+            return self.visit(e)
+        try:
+            text = self._cache[key]
+            self._cache_stats.hits += 1
+            return text
+        except KeyError:
+            pass
+        text = self.visit(e)
+        self._cache[key] = text
+        self._cache_stats.misses += 1
+        self._cache_stats.update_size(len(self._cache))
+        return text
 
     def null(self, e):
         return ""
@@ -972,10 +1170,23 @@ class Formatter(Visitor):
         return self.format(e.get_value())
 
 
+_all_formatter_cache_stats = {}
+
+def _formatter_cache_stats(formatter_class):
+    try:
+        return _all_formatter_cache_stats[formatter_class]
+    except KeyError:
+        stats = CacheStats("%s.%s.format" % (formatter_class.__module__, formatter_class.__name__))
+        _all_formatter_cache_stats[formatter_class] = stats
+        return stats
+
+
 class SymbolicFormatter(Formatter):
     """
     Formats into unambiguous symbolic representation of the expression.
     """
+    # This formatter is typically only used once.
+    use_cache = False
     def __init__(self):
         super(SymbolicFormatter, self).__init__(None)
 
@@ -1044,6 +1255,124 @@ class CondTrackingMixin:
         self.if_stack = stack
 
 
+class CondAnalyzer(object):
+    """
+    Converts boolean expressions into canonical BDD nodes (see
+    :mod:`bkl.bdd`) and answers questions about them.
+
+    Equality tests of placeholders (e.g. ``$(config)``) or variable references
+    against constant values are represented as mutually exclusive atoms of the
+    same variable. Any other non-constant subexpression is treated as an opaque
+    atom of its own.
+
+    The analyzer caches converted expressions, so it's efficient to reuse one
+    instance for many conditions.
+
+    .. attribute:: bdd
+
+       The :class:`bkl.bdd.BDD` manager holding the nodes.
+    """
+    def __init__(self):
+        self.bdd = BDD()
+        self._nodes = {}
+        self._opaque = {}
+
+    def node(self, e):
+        """
+        Returns BDD node for boolean expression *e*. If *e* is :const:`None`,
+        the condition is considered to be always true.
+        """
+        if e is None:
+            return self.bdd.TRUE
+        try:
+            return self._nodes[id(e)][1]
+        except KeyError:
+            n = self._convert(e)
+            # keep e alive, so that its id is not reused
+            self._nodes[id(e)] = (e, n)
+            return n
+
+    def is_always_true(self, e):
+        """Returns True if the condition *e* always holds."""
+        return self.node(e) is self.bdd.TRUE
+
+    def is_always_false(self, e):
+        """Returns True if the condition *e* can never hold."""
+        return self.node(e) is self.bdd.FALSE
+
+    def implies(self, a, b):
+        """Returns True if condition *a* implies condition *b*."""
+        return self.bdd.implies(self.node(a), self.node(b))
+
+    def are_equivalent(self, a, b):
+        """Returns True if conditions *a* and *b* are equivalent."""
+        return self.node(a) is self.node(b)
+
+    def _convert(self, e):
+        bdd = self.bdd
+        if isinstance(e, BoolValueExpr):
+            return bdd.const(e.value)
+        elif isinstance(e, BoolExpr):
+            op = e.operator
+            if op == BoolExpr.NOT:
+                return bdd.not_(self.node(e.left))
+            elif op == BoolExpr.AND:
+                return bdd.and_(self.node(e.left), self.node(e.right))
+            elif op == BoolExpr.OR:
+                return bdd.or_(self.node(e.left), self.node(e.right))
+            elif op == BoolExpr.EQUAL:
+                return self._equality(e)
+            elif op == BoolExpr.NOT_EQUAL:
+                return bdd.not_(self._equality(e))
+        elif isinstance(e, IfExpr):
+            return bdd.ite(self.node(e.cond), self.node(e.value_yes), self.node(e.value_no))
+        try:
+            return bdd.const(e.as_py())
+        except NonConstError:
+            if isinstance(e, ReferenceExpr):
+                return self.node(e.get_value())
+        except Error:
+            # e.g. a reference to a not yet defined variable
+            pass
+        return self._opaque_atom(e)
+
+    def _opaque_atom(self, e):
+        try:
+            return self._opaque[id(e)][1]
+        except KeyError:
+            n = self.bdd.atom(("?", id(e), True))
+            self._opaque[id(e)] = (e, n)
+            return n
+
+    def _symbol(self, e):
+        if isinstance(e, PlaceholderExpr):
+            return ("%", e.var)
+        elif isinstance(e, ReferenceExpr):
+            # the same name may refer to different variables in different
+            # scopes, hence the context's identity
+            return ("$", (e.var, id(e.context)))
+        else:
+            return None
+
+    def _const(self, e):
+        try:
+            value = e.as_py()
+        except Error:
+            return None
+        return value if isinstance(value, (basestring, bool)) else None
+
+    def _equality(self, e):
+        try:
+            return self.bdd.const(are_equal(e.left, e.right, _inside_cond=True))
+        except Error:
+            pass
+        sym, value = self._symbol(e.left), self._const(e.right)
+        if sym is None or value is None:
+            sym, value = self._symbol(e.right), self._const(e.left)
+        if sym is None or value is None:
+            return self._opaque_atom(e)
+        return self.bdd.atom(sym + (value,))
+
 
 class _SplitVisitor(Visitor):
     """
@@ -1297,6 +1626,10 @@ class _PossibleValuesVisitor(Visitor, CondTrackingMixin):
         Visitor.__init__(self)
         CondTrackingMixin.__init__(self)
         self.inside_a_value = 0
+        self.analyzer = CondAnalyzer()
+
+    def _is_possible(self, cond):
+        return self.analyzer.node(cond) is not self.analyzer.bdd.FALSE
 
     def null(self, e):
         return []
@@ -1319,14 +1652,22 @@ class _PossibleValuesVisitor(Visitor, CondTrackingMixin):
         assert False, "this should never be called"
 
     def if_(self, e):
+        # branches that can't be reached under the active condition are
+        # skipped entirely
         try:
             self.push_cond(e.cond)
-            yes = self.visit(e.value_yes)
+            if self._is_possible(self.active_if_cond):
+                yes = self.visit(e.value_yes)
+            else:
+                yes = []
         finally:
             self.pop_cond()
         try:
             self.push_cond(BoolExpr(BoolExpr.NOT, e.cond, pos=e.cond.pos))
-            no = self.visit(e.value_no)
+            if self._is_possible(self.active_if_cond):
+                no = self.visit(e.value_no)
+            else:
+                no = []
         finally:
             self.pop_cond()
         return yes + no
@@ -1364,6 +1705,8 @@ class _PossibleValuesVisitor(Visitor, CondTrackingMixin):
             out = []
             for result in itertools.product(*items):
                 cond = self._get_cond_for_list(result)
+                if cond is not None and not self._is_possible(cond):
+                    continue # contradictory combination of conditions
                 out.append((cond, ConcatExpr([x for c,x in result], pos=e.pos)))
             return out
         finally:
@@ -1377,6 +1720,8 @@ class _PossibleValuesVisitor(Visitor, CondTrackingMixin):
             out = []
             for result in itertools.product(*components):
                 cond = self._get_cond_for_list(result)
+                if cond is not None and not self._is_possible(cond):
+                    continue # contradictory combination of conditions
                 out.append((cond, PathExpr([x for c,x in result], anchor=e.anchor, anchor_file=e.anchor_file, pos=e.pos)))
             return out
         finally:
@@ -1392,6 +1737,8 @@ class _PossibleValuesVisitor(Visitor, CondTrackingMixin):
             out = []
             for result in itertools.product(*items):
                 cond = self._get_cond_for_list(result)
+                if cond is not None and not self._is_possible(cond):
+                    continue # contradictory combination of conditions
                 out.append((cond, ListExpr([x for c,x in result], pos=e.pos)))
             return out
         else:
@@ -1486,6 +1833,155 @@ def are_equal(a, b, _inside_cond=False):
         raise CannotDetermineError("cannot determine whether the following two expressions are equal: \"%s\" and \"%s\"; please report this as a bug." % (a,b))
 
 
+class _SubstPlaceholdersVisitor(RewritingVisitor):
+    # Replaces placeholders with values from the environment dictionary, used
+    # by compiled comparisons that can't be evaluated directly.
+    def __init__(self, env):
+        super(_SubstPlaceholdersVisitor, self).__init__()
+        self.env = env
+
+    def placeholder(self, e):
+        try:
+            return LiteralExpr(self.env[e.var], pos=e.pos)
+        except KeyError:
+            return e
+
+    def reference(self, e):
+        return self.visit(e.get_value())
+
+
+class _CompilingVisitor(Visitor):
+    # Helper for ExprCompiler: returns Python function evaluating the visited
+    # expression for given environment. The functions mirror as_py()
+    # implementations of the respective Expr classes.
+    def __init__(self, compiler):
+        super(_CompilingVisitor, self).__init__()
+        self.compiler = compiler
+
+    def null(self, e):
+        return lambda env: None
+
+    def literal(self, e):
+        value = e.value
+        return lambda env: value
+
+    bool_value = literal
+
+    def list(self, e):
+        items = [self.compiler.compile(x) for x in e.items]
+        return lambda env: [f(env) for f in items]
+
+    def concat(self, e):
+        items = [self.compiler.compile(x) for x in e.items]
+        def _concat(env):
+            values = (f(env) for f in items)
+            return "".join(v for v in values if v is not None)
+        return _concat
+
+    def path(self, e):
+        anchor = e.anchor
+        components = [self.compiler.compile(x) for x in e.components]
+        return lambda env: "%s/%s" % (anchor, "/".join(f(env) for f in components))
+
+    def placeholder(self, e):
+        def _placeholder(env):
+            try:
+                return env[e.var]
+            except KeyError:
+                raise NonConstError(e)
+        return _placeholder
+
+    def reference(self, e):
+        # Don't inline the referenced value, it is resolved (and compiled, if
+        # it wasn't already) every time, so that changes to it are honored.
+        compiler = self.compiler
+        return lambda env: compiler.compile(e.get_value())(env)
+
+    def bool(self, e):
+        op = e.operator
+        left = self.compiler.compile(e.left)
+        if op == BoolExpr.NOT:
+            return lambda env: not left(env)
+        right = self.compiler.compile(e.right)
+        if op == BoolExpr.AND:
+            return lambda env: left(env) and right(env)
+        elif op == BoolExpr.OR:
+            return lambda env: left(env) or right(env)
+        elif op == BoolExpr.EQUAL:
+            return lambda env: self._equal(e, left, right, env)
+        elif op == BoolExpr.NOT_EQUAL:
+            return lambda env: not self._equal(e, left, right, env)
+        else:
+            assert False, "invalid BoolExpr operator"
+
+    def _equal(self, e, left, right, env):
+        # Compare the same way BoolExpr.as_py() does: when the operands can't
+        # be evaluated, let are_equal() compare them symbolically.
+        try:
+            return are_equal(left(env), right(env))
+        except NonConstError:
+            pass
+        subst = _SubstPlaceholdersVisitor(env)
+        try:
+            return are_equal(subst.visit(e.left), subst.visit(e.right), _inside_cond=True)
+        except CannotDetermineError:
+            raise CannotDetermineError('cannot evaluate bool expression "%s"' % e, e.pos)
+
+    def if_(self, e):
+        cond = self.compiler.compile(e.cond)
+        yes = self.compiler.compile(e.value_yes)
+        no = self.compiler.compile(e.value_no)
+        return lambda env: yes(env) if cond(env) else no(env)
+
+
+class ExprCompiler(object):
+    """
+    Compiles expressions into Python functions for fast repeated evaluation.
+
+    Evaluating an expression with :meth:`Expr.as_py()` walks the whole
+    expression tree every time, which is wasteful for expressions such as
+    conditions shared by many source files, that are evaluated over and over
+    again for different configurations. Compiled functions take an
+    *environment* dictionary with values of placeholders (e.g. ``config`` or
+    ``arch``) as their only argument and return the same Python value as
+    :meth:`Expr.as_py()` would if the placeholders were replaced with their
+    values.
+
+    Compiled functions throw :exc:`bkl.error.NonConstError` if they cannot
+    determine the value (e.g. because it depends on a setting), in exactly the
+    same cases :meth:`Expr.as_py()` would.
+
+    Compiled functions are cached by expression identity for the lifetime of
+    the compiler, so it is only meant to be used with expressions that are
+    no longer modified, i.e. finalized models.
+    """
+    def __init__(self):
+        self._compiled = {}
+        self._visitor = _CompilingVisitor(self)
+
+    def compile(self, e):
+        """
+        Returns Python function evaluating expression *e*, see the class
+        description.
+        """
+        try:
+            return self._compiled[id(e)][1]
+        except KeyError:
+            f = self._visitor.visit(e)
+            # keep a reference to e, so that its id() can't be reused:
+            self._compiled[id(e)] = (e, f)
+            return f
+
+    def evaluate(self, e, env=None):
+        """
+        Evaluates expression *e* in environment *env* (dictionary of
+        placeholders' values) using its compiled form. Throws
+        :exc:`bkl.error.NonConstError` if it cannot be evaluated.
+        """
+        env = {} if env is None else env
+        return self.compile(e)(env)
+
+
 class _AddPrefixVisitor(RewritingVisitor):
     def __init__(self, prefix):
         super(_AddPrefixVisitor, self).__init__()
@@ -33,6 +33,7 @@ import bkl.parser
 import bkl.model
 import bkl.api
 import bkl.expr
+import bkl.utils
 import passes
 from builder import Builder
 from bkl.error import Error, warning
@@ -65,11 +66,18 @@ class Interpreter(object):
 
        If :const:`None` (the default), then the toolsets listed in the bakefile
        are used.
+
+    .. attribute:: build_graph
+
+       If set to :class:`bkl.buildgraph.BuildGraph` instance, build graphs of
+       all toolsets that have them are added to it after generating their
+       output. :const:`None` by default.
     """
 
     def __init__(self):
         self.model = bkl.model.Project()
         self.toolsets_to_use = None
+        self.build_graph = None
 
 
     def limit_toolsets(self, toolsets):
@@ -102,9 +110,17 @@ class Interpreter(object):
         Step 1 is done by :meth:`add_module`. Steps 2-4 are done by
         :meth:`finalize` and step 5 is implemented in :meth:`generate`.
         """
-        self.add_module(ast, self.model)
-        self.finalize()
-        self.generate()
+        try:
+            self.add_module(ast, self.model)
+            self.finalize()
+            self.generate()
+        finally:
+            for c in bkl.utils.cache_stats():
+                logger.debug("cache %s: %d hits, %d misses (%.0f%% hit rate), peak size %d",
+                             c["name"], c["hits"], c["misses"], c["hit_rate"] * 100, c["peak_size"])
+            # Session caches are kept for the next processed project, if any.
+            bkl.utils.reset_caches(bkl.utils.CACHE_SCOPE_RUN)
+            bkl.utils.reset_caches(bkl.utils.CACHE_SCOPE_TOOLSET)
 
 
     def process_file(self, filename):
@@ -157,13 +173,9 @@ class Interpreter(object):
         # call any custom steps first:
         self._call_custom_steps(self.model, "finalize")
 
-        # then apply standard processing:
-        passes.detect_potential_problems(self.model)
-        passes.normalize_and_validate_bool_subexpressions(self.model)
-        passes.normalize_vars(self.model)
-        passes.validate_vars(self.model)
-        passes.normalize_paths_in_model(self.model, toolset=None)
-        passes.simplify_exprs(self.model)
+        # then apply standard processing, fused into as few traversals of the
+        # model as possible:
+        passes.create_finalize_passes(self.model).run()
 
 
     def finalize_for_toolset(self, toolset_model, toolset):
@@ -180,9 +192,9 @@ class Interpreter(object):
         # This is done second time here (in addition to finalize()) to deal
         # with paths added by make_variables_for_missing_props() and paths with
         # @builddir (which is toolset specific and couldn't be resolved
-        # earlier).  Ideally we wouldn't do it, but hopefully it's not all that
-        # inefficient, as no real work is done for paths that are already
-        # normalized:
+        # earlier). Expressions normalized by the first pass are not
+        # flagged as having local paths and so are skipped without visiting
+        # them:
         passes.normalize_paths_in_model(toolset_model, toolset)
 
 
@@ -255,4 +267,10 @@ class Interpreter(object):
         self.finalize_for_toolset(model, toolset)
 
         logger.debug("****** generating for toolset %s ********", toolset)
-        bkl.api.Toolset.get(toolset).generate(model)
+        try:
+            toolset_obj = bkl.api.Toolset.get(toolset)
+            toolset_obj.generate(model)
+            if self.build_graph is not None and self.build_graph.supports(toolset_obj):
+                self.build_graph.add_toolset(toolset_obj, model)
+        finally:
+            bkl.utils.reset_caches(bkl.utils.CACHE_SCOPE_TOOLSET)
@@ -37,53 +37,61 @@ from bkl.error import Error, warning, error_context
 from bkl.expr import Visitor
 
 
+class SelfReferencesChecker(Visitor):
+    """
+    Checks that variables don't reference themselves, directly or through
+    other variables. Each variable is checked only once, so the same instance
+    can be used to efficiently check many variables.
+    """
+    def __init__(self):
+        super(SelfReferencesChecker, self).__init__()
+        self.stack = []
+        self.checked = set()
+
+    literal = Visitor.noop
+    bool_value = Visitor.noop
+    null = Visitor.noop
+    concat = Visitor.visit_children
+    list = Visitor.visit_children
+    path = Visitor.visit_children
+    bool = Visitor.visit_children
+    if_ = Visitor.visit_children
+    placeholder = Visitor.noop
+
+    def reference(self, e):
+        var = e.get_variable()
+        if var is None:
+            # reference to default value of a property
+            return
+        if var in self.stack:
+            # TODO: include complete stack of messages+positions
+            raise Error('variable "%s" is defined recursively, references itself' % var.name,
+                        pos=e.pos)
+        else:
+            self.check(var)
+
+    def check(self, var):
+        """
+        Checks variable *var*, throws :exc:`bkl.error.Error` if it references
+        itself.
+        """
+        if var in self.checked:
+            return
+        self.stack.append(var)
+        try:
+            self.visit(var.value)
+        finally:
+            self.stack.pop()
+        self.checked.add(var)
+
+
 def detect_self_references(model):
     """
     Verifies that recursive self-referencing loops (e.g. "foo = $(foo)")
     don't exist.
     """
     logger.debug("checking for self-references")
-
-    class SelfRefChecker(Visitor):
-        def __init__(self):
-            super(SelfRefChecker, self).__init__()
-            self.stack = []
-            self.checked = set()
-
-        literal = Visitor.noop
-        bool_value = Visitor.noop
-        null = Visitor.noop
-        concat = Visitor.visit_children
-        list = Visitor.visit_children
-        path = Visitor.visit_children
-        bool = Visitor.visit_children
-        if_ = Visitor.visit_children
-        placeholder = Visitor.noop
-
-        def reference(self, e):
-            var = e.get_variable()
-            if var is None:
-                # reference to default value of a property
-                return
-            if var in self.stack:
-                # TODO: include complete stack of messages+positions
-                raise Error('variable "%s" is defined recursively, references itself' % var.name,
-                            pos=e.pos)
-            else:
-                self.check(var)
-
-        def check(self, var):
-            if var in self.checked:
-                return
-            self.stack.append(var)
-            try:
-                self.visit(var.value)
-            finally:
-                self.stack.pop()
-            self.checked.add(var)
-
-    visitor = SelfRefChecker()
-
+    visitor = SelfReferencesChecker()
     for var in model.all_variables():
         visitor.check(var)
 
@@ -136,6 +144,13 @@ def mark_variables_in_expr_as_used(expression):
     usage_tracker.visit(expression)
 
 
+def track_variable_usage(var):
+    """
+    Marks all variables referenced by the value of *var* as used.
+    """
+    usage_tracker.visit(var.value)
+
+
 def detect_unused_vars(model):
     """
     Warns about unused variables -- they may indicate typos.
@@ -144,9 +159,16 @@ def detect_unused_vars(model):
     # variables. Notice that it's possible that some code explicitly marked
     # variables as used with mark_variables_in_expr_as_used() before this step.
     for var in model.all_variables():
-        usage_tracker.visit(var.value)
+        track_variable_usage(var)
+    report_unused_vars(model)
 
-    # Not emit warnings for unused variables.
+
+def report_unused_vars(model):
+    """
+    Emits warnings about unused variables. Unlike detect_unused_vars(), this
+    function assumes that track_variable_usage() was already called for all
+    variables in the model.
+    """
     import re
     regex_vs_option = re.compile(r'(msvs|vs[0-9]+)\.option\.')
 
@@ -38,6 +38,19 @@ import logging
 logger = logging.getLogger("bkl.interpreter.builder")
 
 
+class _ContextRelocator(RewritingVisitor):
+    """
+    Rebinds references in expressions precompiled by
+    :meth:`Builder._compile()` to the given context.
+    """
+    def __init__(self, context):
+        super(_ContextRelocator, self).__init__()
+        self.context = context
+
+    def reference(self, e):
+        return ReferenceExpr(e.var, self.context, pos=e.pos)
+
+
 class Builder(object, CondTrackingMixin):
     """
     interpreter.Builder processes parsed AST and builds a project model
@@ -128,8 +141,11 @@ class Builder(object, CondTrackingMixin):
 
 
     def on_assignment(self, node):
+        self._assign(node, self._build_expression(node.value))
+
+
+    def _assign(self, node, value):
         append = node.append
-        value = self._build_expression(node.value)
         has_cond = self.active_if_cond is not None
 
         varname = node.lvalue.var
@@ -237,6 +253,10 @@ class Builder(object, CondTrackingMixin):
 
 
     def on_sources_or_headers(self, node):
+        self._add_files(node, self._build_expression(node.files))
+
+
+    def _add_files(self, node, files):
         if node.kind == "sources":
             filelist = self.context.sources
         elif node.kind == "headers":
@@ -244,7 +264,6 @@ class Builder(object, CondTrackingMixin):
         else:
             assert False, 'invalid files list kind "%s"' % node.kind
 
-        files = self._build_expression(node.files)
         analyze.mark_variables_in_expr_as_used(files)
         for cond, f in enum_possible_values(files, global_cond=self.active_if_cond):
             obj = SourceFile(self.context, f, source_pos=f.pos)
@@ -277,7 +296,72 @@ class Builder(object, CondTrackingMixin):
             self._apply_templates(target, t.bases, applied)
             logger.debug("applying template %s to %s", t.name, target.name)
             applied.add(t.name)
-            self.handle_children(t._definition, target)
+            self._apply_template(t, target)
+
+    def _apply_template(self, template, target):
+        ops = template._compiled
+        if ops is None:
+            ops = template._compiled = self._compile(template._definition)
+        self._replay(ops, target)
+
+    def _compile(self, nodes):
+        """
+        Compiles AST *nodes* into a list of operations that can be replayed
+        by :meth:`_replay()` in any context without processing the AST again.
+        This is used for templates and imported files.
+
+        The operations are ``(handler, node, expression)`` tuples; the
+        expressions are prebuilt with references bound to :const:`None`
+        context and are relocated to the context they are replayed in.
+        Statements other than assignments, file lists and conditions are
+        kept as AST nodes and handled normally when replayed.
+        """
+        ops = []
+        try:
+            old_ctxt = self.context
+            self.context = None
+            self._compile_nodes(nodes, ops)
+        finally:
+            self.context = old_ctxt
+        return ops
+
+    def _replay(self, ops, context):
+        """
+        Applies operations compiled by :meth:`_compile()` to *context*.
+        """
+        relocate = _ContextRelocator(context).visit
+        try:
+            old_ctxt = self.context
+            self.context = context
+            for func, node, e in ops:
+                with error_context(node):
+                    func(self, node, None if e is None else relocate(e))
+        finally:
+            self.context = old_ctxt
+
+    def _compile_nodes(self, nodes, ops):
+        for n in nodes:
+            t = type(n)
+            with error_context(n):
+                if t is AssignmentNode or t is AppendNode:
+                    ops.append((Builder._assign, n, self._build_expression(n.value)))
+                elif t is FilesListNode:
+                    ops.append((Builder._add_files, n, self._build_expression(n.files)))
+                elif t is IfNode:
+                    ops.append((Builder._push_cond_op, n, self._build_expression(n.cond)))
+                    self._compile_nodes(n.content, ops)
+                    ops.append((Builder._pop_cond_op, n, None))
+                elif t is not NilNode:
+                    ops.append((Builder._handle_node_op, n, None))
+
+    def _push_cond_op(self, node, cond):
+        self.push_cond(cond)
+
+    def _pop_cond_op(self, node, unused):
+        self.pop_cond()
+
+    def _handle_node_op(self, node, unused):
+        self._ast_dispatch[type(node)](self, node)
 
     def on_target(self, node):
         name = node.name
@@ -427,10 +511,15 @@ class Builder(object, CondTrackingMixin):
         try:
             module = self.context.module
             logger.debug("importing file %s into %s", fn, module)
-            imported_ast = parse_file(fn)
+            fragments = self.context.project._compiled_imports
+            if fn in fragments:
+                ops = fragments[fn]
+            else:
+                imported_ast = parse_file(fn)
+                ops = fragments[fn] = self._compile(imported_ast.children)
             module.imports.add(fn)
             # TODO: tag error_context with "imported from ..."
-            self.handle_children(imported_ast.children, self.context)
+            self._replay(ops, self.context)
         except IOError as e:
             if e.filename:
                 msg = "%s: %s" % (e.strerror, e.filename)
@@ -447,7 +536,7 @@ class Builder(object, CondTrackingMixin):
         fn = os.path.join(os.path.dirname(node.pos.filename), node.file)
         import bkl.plugins
         bkl.plugins.load_from_file(fn)
-        props.registry.force_rescan()
+        props.registry.update()
 
 
     def on_srcdir(self, node):
@@ -27,6 +27,7 @@ Implementation of misc interpreter passes -- optimization, checking etc.
 """
 
 import os.path
+import time
 
 import logging
 logger = logging.getLogger("bkl.pass")
@@ -39,56 +40,174 @@ import bkl.model
 import bkl.vartypes
 from bkl.error import Error, NonConstError, TypeError
 from bkl.expr import RewritingVisitor
-from bkl.utils import memoized
+from bkl.utils import memoized, OrderedDict, CACHE_SCOPE_TOOLSET
 
 
-def detect_potential_problems(model):
+# Total time spent in every pass run by a PassManager since the last
+# reset_pass_timings() call.
+_pass_timings = OrderedDict()
+
+def pass_timings():
     """
-    Run several warnings-generating steps, to detect common problems.
+    Returns ordered dictionary with the total time (in seconds) spent in
+    every pass run by :class:`PassManager` since the last
+    :func:`reset_pass_timings` call. This is used by the benchmarks.
     """
-    analyze.detect_self_references(model)
-    analyze.detect_unused_vars(model)
-    analyze.detect_missing_generated_outputs(model)
-
+    return _pass_timings.copy()
 
-def normalize_and_validate_bool_subexpressions(model):
+def reset_pass_timings():
     """
-    Normalizes bool expressions, i.e. ensures the conditions are valid bools.
-    variables' values with respect to their types.
+    Resets the timings returned by :func:`pass_timings`.
     """
-    logger.debug("checking boolean expressions")
-    for var in model.all_variables():
-        bkl.vartypes.normalize_and_validate_bool_subexpressions(var.value)
+    _pass_timings.clear()
 
 
-def normalize_vars(model):
+class PassManager(object):
     """
-    Normalizes variables' values with respect to their types. For example,
-    changes non-list value expressions for lists into single-item lists.
+    Runs a sequence of passes over the model.
+
+    Most passes only transform or check variables one by one. Instead of
+    walking the entire model for each of them, they are registered as
+    per-variable *transforms* with :meth:`add` and consecutive transforms are
+    applied, in the order of registration, during a single traversal of the
+    model. Passes that need to see the whole model are added with
+    :meth:`add_model_pass`; they naturally split the traversal in two.
+
+    Note that transforms that follow references into other variables can't
+    share a traversal with the transforms they depend on. Of the passes done
+    by :func:`create_finalize_passes`, only the analysis ones
+    (``detect_self_references`` and ``track_variable_usage``) are fused;
+    every other transform still walks the model on its own.
+
+    .. attribute:: timings
+
+       Ordered dictionary with the time (in seconds) spent in every pass,
+       filled by :meth:`run`. The times are added to :func:`pass_timings`
+       too.
     """
-    logger.debug("normalizing variables")
-    for var in model.all_variables():
-        # if the type of the variable wasn't determined yet, guess it
-        if var.type is bkl.vartypes.TheAnyType:
-            var.type = bkl.vartypes.guess_expr_type(var.value)
-        # normalize the value for the type
-        var.value = var.type.normalize(var.value)
+    def __init__(self, model):
+        self.model = model
+        self.timings = OrderedDict()
+        self._steps = []
+
+    def add(self, name, func, barrier=False):
+        """
+        Registers per-variable transform *func*, called as ``func(var, part)``
+        for every variable *var* in the model, *part* being the model part
+        the variable belongs to.
+
+        The transform may modify the variable's value. It may rely on the
+        variable (but not other variables) being already processed by
+        transforms registered before it. If it needs to see other variables
+        processed too, e.g. because it follows references, *barrier* must be
+        set to start a new traversal of the model. The same applies if it must
+        see other variables *not* processed by the transforms registered
+        after it yet.
+        """
+        if barrier or not self._steps or self._steps[-1][0] is not None:
+            self._steps.append((None, []))
+        self._steps[-1][1].append((name, func))
+
+    def add_model_pass(self, name, func):
+        """
+        Registers pass *func* called as ``func(model)`` after all previously
+        registered passes are done.
+        """
+        self._steps.append((name, func))
+
+    def run(self):
+        """
+        Runs all registered passes.
+        """
+        for name, step in self._steps:
+            if name is None:
+                self._run_transforms(step)
+            else:
+                start = time.time()
+                step(self.model)
+                self._add_timing(name, time.time() - start)
+        for name, duration in self.timings.iteritems():
+            logger.debug("pass %s took %.3f s", name, duration)
+            _pass_timings[name] = _pass_timings.get(name, 0.0) + duration
+
+    def _add_timing(self, name, duration):
+        self.timings[name] = self.timings.get(name, 0.0) + duration
+
+    def _run_transforms(self, transforms):
+        logger.debug("running passes: %s", ", ".join(n for n, f in transforms))
+        durations = [0.0] * len(transforms)
+        for part in _all_parts(self.model):
+            variables = part.variables.values()
+            if not variables:
+                continue
+            for i, (name, func) in enumerate(transforms):
+                start = time.time()
+                for var in variables:
+                    func(var, part)
+                durations[i] += time.time() - start
+        for (name, func), duration in zip(transforms, durations):
+            self._add_timing(name, duration)
+
 
+def _all_parts(part):
+    # all parts of the model in the same order as all_variables() uses
+    yield part
+    for c in part.child_parts():
+        for p in _all_parts(c):
+            yield p
 
-def validate_vars(model):
+
+def create_finalize_passes(model):
     """
-    Validates variables' values with respect to their types, i.e. check
-    the correctness of the values. It is assumed that normalize_vars() was
-    executed beforehand.
+    Returns :class:`PassManager` with all the passes done on the model before
+    making toolset-specific copies of it: detection of potential problems,
+    normalization and validation of bool subexpressions and of variables'
+    values with respect to their types, normalization of paths and
+    simplification of expressions.
     """
-    logger.debug("checking types of variables")
-    for var in model.all_variables():
-        try:
-            var.type.validate(var.value)
-        except TypeError as err:
-            # TODO: add this as a remark to the error object
-            err.msg = "variable \"%s\" (%s): %s" % (var.name, var.type, err.msg)
-            raise
+    pm = PassManager(model)
+
+    self_refs = analyze.SelfReferencesChecker()
+    pm.add("detect_self_references", lambda var, part: self_refs.check(var))
+    pm.add("track_variable_usage", lambda var, part: analyze.track_variable_usage(var))
+    pm.add_model_pass("report_unused_vars", analyze.report_unused_vars)
+    pm.add_model_pass("detect_missing_generated_outputs", analyze.detect_missing_generated_outputs)
+
+    pm.add("normalize_and_validate_bool_subexpressions", _normalize_bool_subexpressions_of_var,
+           barrier=True)
+    # guessing of the type follows references into other variables, whose
+    # bool subexpressions must be normalized already
+    pm.add("normalize_vars", _normalize_var, barrier=True)
+    # validation follows references, so other variables must be normalized too
+    pm.add("validate_vars", _validate_var, barrier=True)
+    # ...and it must see them before their paths are normalized
+    pm.add("normalize_paths", _make_paths_normalizing_transform(model, None), barrier=True)
+    # simplification inlines other variables' values, they must be final
+    pm.add("simplify_exprs", _make_simplifying_transform(simplify.BasicSimplifier()), barrier=True)
+    return pm
+
+
+def _normalize_bool_subexpressions_of_var(var, part):
+    bkl.vartypes.normalize_and_validate_bool_subexpressions(var.value)
+
+
+def _normalize_var(var, part):
+    # Normalizes variable's value with respect to its type. For example,
+    # changes non-list value expressions for lists into single-item lists.
+    # if the type of the variable wasn't determined yet, guess it
+    if var.type is bkl.vartypes.TheAnyType:
+        var.type = bkl.vartypes.guess_expr_type(var.value)
+    # normalize the value for the type
+    var.value = var.type.normalize(var.value)
+
+
+def _validate_var(var, part):
+    try:
+        var.type.validate(var.value)
+    except TypeError as err:
+        # TODO: add this as a remark to the error object
+        err.msg = "variable \"%s\" (%s): %s" % (var.name, var.type, err.msg)
+        raise
 
 
 def remove_disabled_model_parts(model, toolset):
@@ -107,13 +226,17 @@ def remove_disabled_model_parts(model, toolset):
                 raise
 
     def _remove_from_list(parts, allow_dynamic):
-        to_del = []
+        # Filter the list in a single pass instead of calling remove() for
+        # every disabled part, which would be quadratic. The list is modified
+        # in place, because it is owned by its parent part.
+        kept = []
         for p in parts:
             if _should_remove(p, allow_dynamic):
-                to_del.append(p)
-        for p in to_del:
-            logger.debug("removing disabled %s from %s", p, p.parent)
-            parts.remove(p)
+                logger.debug("removing disabled %s from %s", p, p.parent)
+            else:
+                kept.append(p)
+        if len(kept) != len(parts):
+            parts[:] = kept
 
     for module in model.modules:
         targets_to_del = []
@@ -128,21 +251,22 @@ def remove_disabled_model_parts(model, toolset):
             del module.targets[target.name]
 
     # remove any empty submodules:
-    mods_to_del = []
+    modules_with_submodules = set(m.parent for m in model.modules)
+    mods_to_del = set()
     for module in model.modules:
         if module is model.top_module:
             continue
-        if not list(module.submodules) and not module.targets:
+        if module not in modules_with_submodules and not module.targets:
             logger.debug("removing empty %s", module)
-            mods_to_del.append(module)
+            mods_to_del.add(module)
             continue
         mod_toolsets = module.get_variable_value("toolsets")
         if toolset not in mod_toolsets.as_py():
             logger.debug("removing %s, because it isn't for toolset %s (is for: %s)",
                          module, toolset, mod_toolsets.as_py())
-            mods_to_del.append(module)
-    for module in mods_to_del:
-        model.modules.remove(module)
+            mods_to_del.add(module)
+    if mods_to_del:
+        model.modules[:] = [m for m in model.modules if m not in mods_to_del]
 
     # and remove unused settings too:
     settings_to_del = []
@@ -164,7 +288,12 @@ class PathsNormalizer(RewritingVisitor):
     You must call :meth:`set_context()` to associate a module or target before
     calling :meth:`visit()`.  Paths relative to @builddir can only be processed
     if the context was set to a target.
+
+    Only subexpressions with :attr:`bkl.expr.Expr.has_local_paths` set are
+    visited, so normalizing already normalized expressions is cheap.
     """
+    only_if_flagged = "has_local_paths"
+
     def __init__(self, project, toolset=None):
         super(PathsNormalizer, self).__init__()
         self.toolset = toolset
@@ -186,7 +315,7 @@ class PathsNormalizer(RewritingVisitor):
             self.module = context
             self.target = None
 
-    @memoized
+    @memoized(scope=CACHE_SCOPE_TOOLSET, weak_keys=True)
     def _src_prefix(self, source_file):
         srcdir = os.path.abspath(self.project.get_srcdir(source_file))
         prefix = os.path.relpath(srcdir, start=self.top_srcdir)
@@ -197,7 +326,7 @@ class PathsNormalizer(RewritingVisitor):
             lst = prefix.split(os.path.sep)
             return [bkl.expr.LiteralExpr(i) for i in lst]
 
-    @memoized
+    @memoized(scope=CACHE_SCOPE_TOOLSET, weak_keys=True)
     def _builddir(self, target):
         builddir = self.toolset.get_builddir_for(target)
         logger.debug('translating @builddir paths of %s into %s', target, builddir)
@@ -242,20 +371,41 @@ def normalize_paths_in_model(model, toolset):
     Performs the normalization in-place for the whole model.
     """
     logger.debug("translating relative paths into absolute")
+    pm = PassManager(model)
+    pm.add("normalize_paths", _make_paths_normalizing_transform(model, toolset))
+    pm.run()
 
+def _make_paths_normalizing_transform(model, toolset):
     if toolset is not None:
         toolset = bkl.api.Toolset.get(toolset)
-
     norm = PathsNormalizer(model, toolset)
+    contexts = {}
+    current = [None]
 
-    for module in model.modules:
-        norm.set_context(module)
-        for var in module.variables.itervalues():
-            var.value = norm.visit(var.value)
-        for target in module.targets.itervalues():
-            norm.set_context(target)
-            for var in target.all_variables():
-                var.value = norm.visit(var.value)
+    def _get_context(part):
+        # Paths are translated in the context of the nearest enclosing target
+        # or module; project-level variables and settings are left alone.
+        try:
+            return contexts[part]
+        except KeyError:
+            if isinstance(part, (bkl.model.Target, bkl.model.Module)):
+                ctx = part
+            elif isinstance(part, (bkl.model.Project, bkl.model.Setting)):
+                ctx = None
+            else:
+                ctx = _get_context(part.parent)
+            contexts[part] = ctx
+            return ctx
+
+    def transform(var, part):
+        ctx = _get_context(part)
+        if ctx is None:
+            return
+        if ctx is not current[0]:
+            norm.set_context(ctx)
+            current[0] = ctx
+        var.value = norm.visit(var.value)
+    return transform
 
 
 def make_variables_for_missing_props(model, toolset):
@@ -268,17 +418,13 @@ def make_variables_for_missing_props(model, toolset):
         make_variables_for_missing_props(part, toolset)
 
 
-def simplify_exprs(model):
-    """
-    Simplify expressions in the model. This does "cheap" simplifications such
-    as merging concatenated literals, recognizing always-false conditions,
-    eliminating unnecessary variable references (turn ``foo=$(x);bar=$(foo)``
-    into ``bar=$(x)``) etc.
-    """
-    logger.debug("simplifying expressions")
-    simplifier = simplify.BasicSimplifier()
-    for var in model.all_variables():
+def _make_simplifying_transform(simplifier):
+    # Does "cheap" simplifications such as merging concatenated literals,
+    # recognizing always-false conditions, eliminating unnecessary variable
+    # references (turn ``foo=$(x);bar=$(foo)`` into ``bar=$(x)``) etc.
+    def transform(var, part):
         var.value = simplifier.visit(var.value)
+    return transform
 
 
 def eliminate_superfluous_conditionals(model):
@@ -31,7 +31,8 @@ useful functions for evaluating and simplifying expressions.
 """
 
 from bkl.expr import *
-from bkl.error import NonConstError
+from bkl.error import NonConstError, CannotDetermineError
+from bkl.utils import memoized_property
 
 
 class BasicSimplifier(RewritingVisitor):
@@ -125,7 +126,22 @@ class ConditionalsSimplifier(BasicSimplifier):
     """
     More advanced simplifier class, eliminates const boolean expressions
     and their consequences (such as null items in lists).
+
+    Conditions are analyzed symbolically using :class:`bkl.expr.CondAnalyzer`,
+    so that e.g. contradictory conditions or branches of nested ``if``
+    expressions made unreachable by the outer condition are removed too.
+    The analyzer is only created when such a condition is encountered, so
+    reuse the simplifier for many expressions if possible.
     """
+    def __init__(self):
+        super(ConditionalsSimplifier, self).__init__()
+        # BDD node of the conditions of the enclosing if expressions, if any
+        self.active_cond_node = None
+
+    @memoized_property
+    def analyzer(self):
+        return CondAnalyzer()
+
     def bool(self, e):
         e = super(ConditionalsSimplifier, self).bool(e)
         if not isinstance(e, BoolExpr):
@@ -174,25 +190,46 @@ class ConditionalsSimplifier(BasicSimplifier):
                 if left is not None and right is not None:
                     assert (left or right) == False
                     return BoolValueExpr(False, pos=e.pos)
-            elif op == BoolExpr.EQUAL: 
-                return BoolValueExpr(e.left.as_py() == e.right.as_py())
-            elif op == BoolExpr.NOT_EQUAL: 
-                return BoolValueExpr(e.left.as_py() != e.right.as_py())
+            else:
+                # The analyzer can only simplify a single comparison if
+                # are_equal() can decide it, so don't convert it to BDD.
+                try:
+                    equal = are_equal(e.left, e.right, _inside_cond=True)
+                except CannotDetermineError:
+                    return e
+                return BoolValueExpr(equal == (op == BoolExpr.EQUAL), pos=e.pos)
         except NonConstError:
             pass
+        node = self.analyzer.node(e)
+        if node.is_terminal():
+            return BoolValueExpr(node is self.analyzer.bdd.TRUE, pos=e.pos)
         return e
 
     def if_(self, e):
-        e = super(ConditionalsSimplifier, self).if_(e)
-        if not isinstance(e, IfExpr):
-            return e
+        cond = self.visit(e.cond)
+        bdd = self.analyzer.bdd
+        saved = self.active_cond_node
+        outer = saved if saved is not None else bdd.TRUE
+        cond_node = self.analyzer.node(cond)
+        yes_node = bdd.and_(outer, cond_node)
+        no_node = bdd.and_(outer, bdd.not_(cond_node))
+        # if one of the branches is unreachable, the other one is always taken
+        if no_node is bdd.FALSE:
+            return self.visit(e.value_yes)
+        if yes_node is bdd.FALSE:
+            return self.visit(e.value_no)
         try:
-            if e.cond.as_py():
-                return e.value_yes
-            else:
-                return e.value_no
-        except NonConstError:
+            self.active_cond_node = yes_node
+            yes = self.visit(e.value_yes)
+            self.active_cond_node = no_node
+            no = self.visit(e.value_no)
+        finally:
+            self.active_cond_node = saved
+        if cond is e.cond and yes is e.value_yes and no is e.value_no:
             return e
+        if isinstance(yes, NullExpr) and isinstance(no, NullExpr):
+            return NullExpr(pos=e.pos)
+        return IfExpr(cond, yes, no, pos=e.pos)
 
 
 def simplify(e):
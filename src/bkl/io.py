@@ -55,6 +55,10 @@ EOL_UNIX    = "unix"
 
 _all_written_files = {}
 
+# When not None, committed files are collected here instead of being written;
+# see capture_output()
+_captured_output = None
+
 class OutputFile(object):
     """
     File to be written by Bakefile.
@@ -87,10 +91,27 @@ class OutputFile(object):
             raise Error("conflict in file %(filename)s, generated both by %(creator1)s for %(create_for1)s and %(creator)s for %(create_for)s" % locals())
         _all_written_files[filename] = (creator, create_for)
 
+        self.creator = creator
+        self.create_for = create_for
         self.filename = filename
         self.eol = eol
         self.charset = charset
-        self.text = ""
+        # written pieces of text, joined lazily by the text property, so that
+        # writing many small pieces doesn't copy the whole text every time
+        self._pieces = []
+
+    @property
+    def text(self):
+        """
+        The text written so far.
+        """
+        if len(self._pieces) != 1:
+            self._pieces = ["".join(self._pieces)]
+        return self._pieces[0]
+
+    @text.setter
+    def text(self, value):
+        self._pieces = [value]
 
     def write(self, text):
         """
@@ -100,7 +121,7 @@ class OutputFile(object):
         """
         if isinstance(text, unicode):
             text = text.encode(self.charset)
-        self.text += text
+        self._pieces.append(text)
 
     def replace(self, placeholder, value):
         """
@@ -113,6 +134,11 @@ class OutputFile(object):
         self.text = self.text.replace(placeholder, value, 1)
 
     def commit(self):
+        if _captured_output is not None:
+            _captured_output.append((self.filename, self.eol, self.charset,
+                                     self.text,
+                                     str(self.creator), str(self.create_for)))
+            return
         if self.eol == EOL_WINDOWS:
             self.text = self.text.replace("\n", "\r\n")
         try:
@@ -163,3 +189,42 @@ class OutputFile(object):
             os.makedirs(dirname)
         with open(self.filename, "wb") as f:
             f.write(self.text)
+
+
+def capture_output():
+    """
+    Starts capturing committed output files instead of writing them. This is
+    used by worker processes (see :mod:`bkl.parallel`), whose output is
+    written by the main process.
+    """
+    global _captured_output
+    _captured_output = []
+
+
+def end_capture_output():
+    """
+    Stops capturing started by capture_output() and returns the captured
+    files, in a picklable form suitable for replay_output().
+    """
+    global _captured_output
+    captured = _captured_output
+    _captured_output = None
+    return captured
+
+
+def conflicts_with_written(captured):
+    """
+    Returns True if any of the files captured by capture_output() was
+    already written by another creator, i.e. replay_output() would fail.
+    """
+    return any(x[0] in _all_written_files for x in captured)
+
+
+def replay_output(captured):
+    """
+    Commits files captured by capture_output(), possibly in another process.
+    """
+    for filename, eol, charset, text, creator, create_for in captured:
+        f = OutputFile(filename, eol, charset, creator, create_for)
+        f.text = text
+        f.commit()
@@ -33,9 +33,11 @@ import os.path
 
 import io
 import expr
+import bkl.parallel
 from bkl.error import Error, CannotDetermineError, error_context
 from bkl.api import Extension, Toolset, Property
-from bkl.vartypes import PathType
+from bkl.model import Module
+from bkl.vartypes import PathType, BoolType
 from bkl.utils import OrderedDict
 
 
@@ -122,6 +124,19 @@ class MakefileFormatter(Extension):
         """
         raise NotImplementedError
 
+    def timed_command(self, command, timestamp, record, logfile):
+        """
+        Returns string with *command* wrapped so that, when run, it appends
+        a line with *record* followed by the start and end time of the
+        command to *logfile*. The exit status of *command* must be kept.
+
+        :param command:   Command to wrap, already formatted.
+        :param timestamp: Shell command printing the current time.
+        :param record:    Text identifying the command in the log.
+        :param logfile:   Name of the log file, already formatted.
+        """
+        raise NotImplementedError
+
 
 class MakefileExprFormatter(expr.Formatter):
     def __init__(self, toolset, paths_info):
@@ -146,6 +161,97 @@ class MakefileExprFormatter(expr.Formatter):
         return "$(%s)" % name
 
 
+class _BuildGraphs(dict):
+    """
+    Mapping of targets to their build graphs (with normalized paths), created
+    on first use. Only targets that should be built have a build graph.
+    """
+    def __init__(self, toolset, project):
+        super(_BuildGraphs, self).__init__()
+        from bkl.interpreter.passes import PathsNormalizer
+        self.toolset = toolset
+        self.norm = PathsNormalizer(project)
+
+    def __missing__(self, target):
+        if not target.should_build():
+            raise KeyError(target)
+        norm = self.norm
+        with error_context(target):
+            norm.set_context(target)
+            graph = target.type.get_build_subgraph(self.toolset, target)
+            for node in graph.all_nodes():
+                node.inputs = [norm.visit(e) for e in node.inputs]
+                node.outputs = [norm.visit(e) for e in node.outputs]
+                node.commands = [norm.visit(e) for e in node.commands]
+        self[target] = graph
+        return graph
+
+
+class _ModulesGraph(object):
+    """
+    Dependencies between the modules of a project, derived once from the
+    dependencies of their targets.
+
+    .. attribute:: submodules
+
+       Dictionary with lists of direct submodules of every module.
+    """
+    def __init__(self, project):
+        self.project = project
+        self.targets = dict((t.name, t) for t in project.all_targets())
+        self.submodules = dict((m, []) for m in project.modules)
+        for m in project.modules:
+            if m.parent in self.submodules:
+                self.submodules[m.parent].append(m)
+        self._target_deps = {}
+        self._subtree_deps = {}
+
+    def target_deps(self, target):
+        """Returns list of targets that *target* depends on."""
+        try:
+            return self._target_deps[target]
+        except KeyError:
+            deps = []
+            for dep in target["deps"]:
+                name = dep.as_py()
+                tdep = self.targets.get(name)
+                if tdep is None:
+                    tdep = self.project.get_target(name) # throws
+                deps.append(tdep)
+            self._target_deps[target] = deps
+            return deps
+
+    def subtree_deps(self, module):
+        """
+        Returns set of targets that the targets of *module* or any of its
+        (grand-)*submodules depend on.
+        """
+        try:
+            return self._subtree_deps[module]
+        except KeyError:
+            deps = set()
+            for t in module.targets.itervalues():
+                deps.update(self.target_deps(t))
+            for sub in self.submodules[module]:
+                deps.update(self.subtree_deps(sub))
+            self._subtree_deps[module] = deps
+            return deps
+
+    def child_containing(self, main, module):
+        """
+        Returns *main* itself if *module* is *main*, its direct submodule
+        that *module* is (grand-)*child of or is, or None if *module* is not
+        in *main*'s subtree.
+        """
+        if module is main:
+            return main
+        while module.parent is not main:
+            module = module.parent
+            if not isinstance(module, Module):
+                return None
+        return module
+
+
 class MakefileToolset(Toolset):
     """
     Base class for makefile-based toolsets.
@@ -166,6 +272,15 @@ class MakefileToolset(Toolset):
     #: Command used to delete files
     del_command = None
 
+    #: Shell command printing the current time in seconds, used to time
+    #: build commands if ``timing-log`` is enabled. Toolsets that can't do
+    #: it leave it as :const:`None` and don't have the property at all.
+    timestamp_command = None
+
+    #: Name of the log written by the timing instrumentation, in the build
+    #: directory of the module.
+    timing_log_file = "bkl-timing.log"
+
     @classmethod
     def properties_module(cls):
         yield Property("%s.makefile" % cls.name,
@@ -174,6 +289,25 @@ class MakefileToolset(Toolset):
                        inheritable=False,
                        doc="Name of output file for module's makefile.")
 
+    @classmethod
+    def properties_target(cls):
+        if cls.timestamp_command is None:
+            return
+        yield Property("%s.timing-log" % cls.name,
+                       type=BoolType(),
+                       default=False,
+                       inheritable=True,
+                       doc="""
+                           Record how long building the target takes.
+
+                           If set, every command building the target appends
+                           the time it took to ``bkl-timing.log`` file in the
+                           build directory. Use ``bkl --timing-report`` to
+                           summarize the log; it is deleted by ``make
+                           clean``, so that it only covers a single build
+                           after it.
+                           """)
+
     def get_builddir_for(self, target):
         makefile = target["%s.makefile" % self.name]
         builddir = makefile.get_directory_path()
@@ -183,28 +317,43 @@ class MakefileToolset(Toolset):
         # We need to know build graphs of all targets so that we can generate
         # dependencies on produced files. Worse yet, we need to have them for
         # all modules before generating the output, because of cross-module
-        # dependencies.
-        # TODO-MT: read only, can be ran in parallel
-        from bkl.interpreter.passes import PathsNormalizer
-        norm = PathsNormalizer(project)
-        build_graphs = {}
-        for t in project.all_targets():
-            with error_context(t):
-                if not t.should_build():
-                    continue
-                norm.set_context(t)
-                graph = t.type.get_build_subgraph(self, t)
-                for node in graph.all_nodes():
-                    node.inputs = [norm.visit(e) for e in node.inputs]
-                    node.outputs = [norm.visit(e) for e in node.outputs]
-                    node.commands = [norm.visit(e) for e in node.commands]
-                build_graphs[t] = graph
+        # dependencies -- and so that errors in them prevent writing any
+        # output, even when the makefiles are generated in workers.
+        build_graphs = self.get_build_graphs(project)
+        modules_graph = _ModulesGraph(project)
+        modules = project.modules
+        if bkl.parallel.can_use_workers(len(modules)):
+            # The workers inherit the graphs when forked, so they don't
+            # need to be passed to them.
+            self._worker_args = (build_graphs, modules_graph)
+            try:
+                bkl.parallel.map_in_workers(self._gen_makefile_in_worker, modules)
+            finally:
+                self._worker_args = None
+            return
 
-        for m in project.modules:
+        for m in modules:
             with error_context(m):
-                self._gen_makefile(build_graphs, m)
+                self._gen_makefile(build_graphs, modules_graph, m)
 
-    def _gen_makefile(self, build_graphs, module):
+    def get_build_graphs(self, project):
+        """
+        Returns dictionary with build graphs (:class:`bkl.api.BuildSubgraph`)
+        of all targets of *project* that should be built, with normalized
+        paths, as used for generating the makefiles.
+        """
+        build_graphs = _BuildGraphs(self, project)
+        for t in project.all_targets():
+            if t.should_build():
+                build_graphs[t]
+        return build_graphs
+
+    def _gen_makefile_in_worker(self, module):
+        build_graphs, modules_graph = self._worker_args
+        with error_context(module):
+            self._gen_makefile(build_graphs, modules_graph, module)
+
+    def _gen_makefile(self, build_graphs, modules_graph, module):
         # Flag indicating whether this makefile actually builds anything.
         self.uses_builddir = False
 
@@ -246,34 +395,27 @@ class MakefileToolset(Toolset):
             target from another.
             """
             mod_deps = set()
-            project = main.project
-            inspect = [submodule] + [p for p in project.modules if p.is_submodule_of(submodule)]
-            for mod in inspect:
-                for target in mod.targets.itervalues():
-                    for dep in target["deps"]:
-                        tdep = project.get_target(dep.as_py())
-                        tmod = tdep.parent
-                        if tmod is main:
-                            mod_deps.add(_format_dep(tdep))
-                        elif tmod.is_submodule_of(main):
-                            while tmod.parent is not main:
-                                tmod = tmod.parent
-                            if tmod is not submodule:
-                                mod_deps.add(tmod.name)
+            for tdep in modules_graph.subtree_deps(submodule):
+                tmod = modules_graph.child_containing(main, tdep.parent)
+                if tmod is main:
+                    mod_deps.add(_format_dep(tdep))
+                elif tmod is not None and tmod is not submodule:
+                    mod_deps.add(tmod.name)
             return sorted(mod_deps)
 
         # Write the "all" target:
         all_targets = (
                       [_format_dep(t) for t in module.targets.itervalues()] +
-                      [sub.name for sub in module.submodules]
+                      [sub.name for sub in modules_graph.submodules[module]]
                       )
         f.write(mk_fmt.target(name="all", deps=all_targets, commands=None))
 
         phony_targets = ["all", "clean"]
+        timing_log = None
 
         targets_from_submodules = OrderedDict()
         submakefiles = OrderedDict()
-        for sub in module.submodules:
+        for sub in modules_graph.submodules[module]:
             subpath = sub.get_variable_value("%s.makefile" % self.name)
             # FIXME: use $dirname(), $basename() functions, this is hacky
             subdir = subpath.get_directory_path()
@@ -291,18 +433,22 @@ class MakefileToolset(Toolset):
             with error_context(t):
                 # collect target's dependencies
                 target_deps = []
-                for dep in t["deps"]:
-                    tdep = module.project.get_target(dep.as_py())
+                for tdep in modules_graph.target_deps(t):
                     tdepstr = _format_dep(tdep)
                     target_deps.append(tdepstr)
                     if tdep.parent is not module:
                         # link external dependencies with submodules to build them
-                        tmod = tdep.parent
-                        while tmod.parent is not None and tmod.parent is not module:
-                            tmod = tmod.parent
-                        if tmod in module.submodules:
+                        tmod = modules_graph.child_containing(module, tdep.parent)
+                        if tmod is not None:
                             targets_from_submodules[tdepstr] = tmod
 
+                timed = (self.timestamp_command is not None and
+                         t["%s.timing-log" % self.name].as_py())
+                if timed and timing_log is None:
+                    timing_log = expr_fmt.format(
+                            expr.PathExpr([expr.LiteralExpr(self.timing_log_file)],
+                                          expr.ANCHOR_BUILDDIR))
+
                 # generate code for the target's build graph:
                 graph = build_graphs[t]
                 for node in graph.all_nodes():
@@ -319,6 +465,12 @@ class MakefileToolset(Toolset):
 
                         out_fmt = [expr_fmt.format(x) for x in out]
                         commands_fmt = [expr_fmt.format(c) for c in node.commands]
+                        if timed:
+                            record = "%s %s $(notdir %s)" % (module.fully_qualified_name,
+                                                             t.name, out_fmt[0])
+                            commands_fmt = [mk_fmt.timed_command(c, self.timestamp_command,
+                                                                 record, timing_log)
+                                            for c in commands_fmt]
                         if len(out_fmt) == 1:
                             text = mk_fmt.target(name=out_fmt[0],
                                                  deps=deps,
@@ -342,7 +494,8 @@ class MakefileToolset(Toolset):
         clean_cmds = self._get_clean_commands(
                         mk_fmt, expr_fmt,
                         (build_graphs[t] for t in module.targets.itervalues()),
-                        submakefiles.itervalues())
+                        submakefiles.itervalues(),
+                        timing_log)
         f.write(mk_fmt.target(name="clean", deps=[], commands=clean_cmds))
 
         self.on_phony_targets(f, phony_targets)
@@ -363,11 +516,13 @@ class MakefileToolset(Toolset):
             f.write(mk_fmt.var_definition(setting.name, expr_fmt.format(setting["default"])))
         f.write("\n%s\n" % mk_fmt.comment("------------"))
 
-    def _get_clean_commands(self, mk_fmt, expr_fmt, graphs, submakefiles):
+    def _get_clean_commands(self, mk_fmt, expr_fmt, graphs, submakefiles, timing_log=None):
         if self.uses_builddir:
             for e in self.autoclean_extensions:
                 p = expr.PathExpr([expr.LiteralExpr("*." + e)], expr.ANCHOR_BUILDDIR)
                 yield "%s %s" % (self.del_command, expr_fmt.format(p))
+        if timing_log is not None:
+            yield "%s %s" % (self.del_command, timing_log)
         for g in graphs:
             for node in g.all_nodes():
                 for f in node.outputs:
@@ -186,6 +186,9 @@ class Template(object):
         # for internal use, this is a list of AST nodes that
         # define the configuration
         self._definition = []
+        # ...and the same compiled by bkl.interpreter.builder.Builder, when
+        # the template is used for the first time
+        self._compiled = None
 
 
 class ModelPart(object):
@@ -216,6 +219,12 @@ class ModelPart(object):
         self.parent = parent
         self.variables = utils.OrderedDict()
         self.source_pos = source_pos
+        # cached results of _resolve(), valid for given registry generation
+        self._resolution_cache = {}
+        self._resolution_registry_generation = props.registry.generation
+        # names mapped to the child scopes whose cached results depend on
+        # this scope's result for the name
+        self._resolution_dependents = {}
 
     def _clone_into(self, clone):
         clone.source_pos = self.source_pos
@@ -303,7 +312,7 @@ class ModelPart(object):
         if cond is None:
             return True
         try:
-            return cond.as_py()
+            return self.project.expr_compiler.evaluate(cond)
         except error.NonConstError:
             from bkl.interpreter.simplify import simplify
             cond = simplify(cond)
@@ -344,18 +353,7 @@ class ModelPart(object):
         .. note:: Unlike :meth:`get_variable_value()`, this method doesn't
                   look for properties' default values.
         """
-        var = self.get_variable(name)
-        if var is not None:
-            return var
-
-        if self.parent:
-            # there may be a property with this name; if so, we must check it for
-            # its 'inheritable' flag:
-            p = self.get_prop(name)
-            can_inherit = (p is None) or p.inheritable
-            if can_inherit:
-                return self.parent.resolve_variable(name)
-        return None
+        return self._resolve(name)[0]
 
 
     def get_variable_value(self, name):
@@ -379,21 +377,72 @@ class ModelPart(object):
 
         .. seealso:: :meth:`resolve_variable()`
         """
-        var = self.resolve_variable(name)
+        var, prop_scope = self._resolve(name)
         if var is not None:
             return var.value
 
-        # there may be a property with this name; try to find it and use its
-        # default value
-        scope = self
-        while scope:
-            p = scope.get_prop(name)
-            if p is not None:
-                return p.default_expr(scope, throw_if_required=False)
-            scope = scope.parent
+        # there may be a property with this name; if so, use its default value
+        if prop_scope is not None:
+            return prop_scope.get_prop(name).default_expr(prop_scope, throw_if_required=False)
         raise error.UndefinedError("unknown variable \"%s\"" % name)
 
 
+    def _resolve(self, name):
+        """
+        Looks up variable *name* using the rules described in
+        :meth:`resolve_variable()` and :meth:`get_variable_value()`.
+
+        Returns a tuple of (variable, scope), where variable is the resolved
+        :class:`Variable` object (or :const:`None`) and scope is the nearest
+        model part with property *name* (or :const:`None`), i.e. the scope the
+        property's default value should be evaluated in.
+
+        Results are cached and reused until a variable with the same name is
+        added to this scope or one of its parents (see
+        :meth:`_invalidate_resolved()`) or the set of known properties
+        changes. Parent scopes' cached results are used for lookups in this
+        one, so that the parent chain is walked at most once per name.
+        """
+        if self._resolution_registry_generation != props.registry.generation:
+            self._resolution_cache.clear()
+            self._resolution_dependents.clear()
+            self._resolution_registry_generation = props.registry.generation
+        else:
+            try:
+                return self._resolution_cache[name]
+            except KeyError:
+                pass
+
+        var = self.variables.get(name, None)
+        prop = self.get_prop(name)
+        prop_scope = self if prop is not None else None
+        if self.parent and (var is None or prop is None):
+            parent = self.parent
+            parent_var, parent_prop_scope = parent._resolve(name)
+            parent._resolution_dependents.setdefault(name, []).append(self)
+            # there may be a property with this name; if so, we must check it
+            # for its 'inheritable' flag:
+            if var is None and (prop is None or prop.inheritable):
+                var = parent_var
+            if prop_scope is None:
+                prop_scope = parent_prop_scope
+
+        cached = (var, prop_scope)
+        self._resolution_cache[name] = cached
+        return cached
+
+    def _invalidate_resolved(self, name):
+        """
+        Discards cached results of :meth:`_resolve()` for *name* in this
+        scope and in all scopes whose results were derived from it.
+        """
+        todo = [self]
+        while todo:
+            part = todo.pop()
+            part._resolution_cache.pop(name, None)
+            todo += part._resolution_dependents.pop(name, ())
+
+
     def is_variable_explicitly_set(self, name):
         """
         Returns true if the variable was set in the bakefiles explicitly.
@@ -416,6 +465,7 @@ class ModelPart(object):
         """Adds a new variable object."""
         assert var.name not in self.variables
         self.variables[var.name] = var
+        self._invalidate_resolved(var.name)
 
 
     def set_property_value(self, prop, value):
@@ -463,13 +513,16 @@ class ModelPart(object):
     def _get_prop(self, name):
         raise NotImplementedError
 
-    def enum_props(self):
+    def enum_props(self, toolset=None):
         """
         Enumerates properties defined on this object.
 
         Like :meth:`get_prop()`, this method doesn't work recursively upwards,
         but lists only properties that are defined for this scope.
 
+        :param toolset: If given, properties specific to other toolsets are
+                omitted.
+
         .. seealso:: :meth:`get_prop()`
         """
         raise NotImplementedError
@@ -482,9 +535,7 @@ class ModelPart(object):
         :param toolset: Name of the toolset to generate for. Properties
                 specific to other toolsets are ignored for efficiency.
         """
-        for p in self.enum_props():
-            if p.toolsets and toolset not in p.toolsets:
-                continue
+        for p in self.enum_props(toolset):
             if self.is_variable_null(p.name):
                 if p.inheritable and not p._scope_is_directly_for(self):
                     # don't create default for inheritable properties at higher
@@ -494,6 +545,7 @@ class ModelPart(object):
                 var.is_explicitly_set = False
                 logger.debug("%s: setting default of %s: %s", self, var.name, var.value)
                 self.variables[p.name] = var
+                self._invalidate_resolved(p.name)
 
 
     def all_variables(self):
@@ -535,6 +587,11 @@ class Project(ModelPart):
     .. attribute:: templates
 
        Dictionary of all templates defined in the project.
+
+    .. attribute:: expr_compiler
+
+       :class:`bkl.expr.ExprCompiler` used for evaluating conditions in the
+       project's model.
     """
 
     name = "project"
@@ -547,6 +604,11 @@ class Project(ModelPart):
         self.settings = utils.OrderedDict()
         self.templates = {}
         self._srcdir_map = {}
+        self._proxy_resolvers = {}
+        self.expr_compiler = expr.ExprCompiler()
+        # for internal use by bkl.interpreter.builder.Builder, imported files
+        # compiled for reuse in all modules importing them
+        self._compiled_imports = {}
         self.add_configuration(Configuration("Debug",   base=None, is_debug=True))
         self.add_configuration(Configuration("Release", base=None, is_debug=False))
 
@@ -628,8 +690,8 @@ class Project(ModelPart):
     def _get_prop(self, name):
         return props.get_project_prop(name)
 
-    def enum_props(self):
-        return props.enum_project_props()
+    def enum_props(self, toolset=None):
+        return props.enum_project_props(toolset)
 
     def add_configuration(self, config):
         """Adds a new configuration to the project."""
@@ -651,6 +713,20 @@ class Project(ModelPart):
     def set_srcdir(self, filename, srcdir):
         self._srcdir_map[filename] = srcdir
 
+    def get_proxy_resolver(self, config, arch=None):
+        """
+        Returns :class:`ProxyIfResolver` for given configuration and
+        architecture, shared by all :class:`ConfigurationProxy` objects in
+        the project.
+        """
+        key = (config.name, arch)
+        try:
+            return self._proxy_resolvers[key]
+        except KeyError:
+            resolver = ProxyIfResolver(config.name, arch, self.expr_compiler)
+            self._proxy_resolvers[key] = resolver
+            return resolver
+
 
 class Module(ModelPart):
     """
@@ -734,8 +810,8 @@ class Module(ModelPart):
     def _get_prop(self, name):
         return props.get_module_prop(name)
 
-    def enum_props(self):
-        return props.enum_module_props()
+    def enum_props(self, toolset=None):
+        return props.enum_module_props(toolset)
 
 
 class ConfigurationsPropertyMixin:
@@ -764,18 +840,65 @@ class ConfigurationsPropertyMixin:
             except KeyError:
                 # TODO: validate the values earlier, as part of vartypes validation
                 raise error.Error("configuration \"%s\" not defined" % cname, pos=cfglist.pos)
-            yield ConfigurationProxy(self, cfg)
+            yield self.get_configuration_proxy(cfg)
+
+    def get_configuration_proxy(self, config, arch=None):
+        """
+        Returns :class:`ConfigurationProxy` for configuration *config* (a
+        :class:`bkl.model.Configuration` object) and, optionally,
+        architecture *arch* of this model part.
+
+        Only one proxy is created for every configuration and architecture
+        combination, so that values specialized for it are computed just once
+        and shared by all code using the proxy.
+        """
+        try:
+            proxies = self._configuration_proxies
+        except AttributeError:
+            proxies = self._configuration_proxies = {}
+        key = (config, arch)
+        try:
+            return proxies[key]
+        except KeyError:
+            proxy = ConfigurationProxy(self, config, arch)
+            proxies[key] = proxy
+            return proxy
 
 
 class ProxyIfResolver(expr.RewritingVisitor):
     """
-    Replaces references to $(config) with value, allowing the expressions
-    to be evaluated.
+    Replaces references to $(config) (and $(arch), if given) with value,
+    allowing the expressions to be evaluated.
     """
-    def __init__(self, config):
+    def __init__(self, config, arch=None, compiler=None):
         super(ProxyIfResolver, self).__init__()
         self.mapping = {"config": config}
+        if arch is not None:
+            self.mapping["arch"] = arch
         self.inside_cond = 0
+        self._specialized = {}
+        self._compiler = compiler if compiler is not None else expr.ExprCompiler()
+
+    def specialize(self, e):
+        """
+        Like visit(), but remembers the result, so that specializing the same
+        expression again -- e.g. a variable inherited by many source files
+        from their target -- is free.
+        """
+        try:
+            return self._specialized[id(e)][1]
+        except KeyError:
+            result = self.visit(e)
+            # keep a reference to e, so that its id() can't be reused:
+            self._specialized[id(e)] = (e, result)
+            return result
+
+    def evaluate_cond(self, e):
+        """
+        Evaluates condition *e* for the configuration, using its compiled
+        form. Throws NonConstError if it cannot be done.
+        """
+        return self._compiler.compile(e)(self.mapping)
 
     def visit_cond(self, e):
         try:
@@ -798,14 +921,14 @@ class ProxyIfResolver(expr.RewritingVisitor):
     def if_(self, e):
         try:
             self.inside_cond += 1
-            cond = self.visit(e.cond)
             # It is safe -- desirable, even -- to remove the if expression
             # here. Either it depends on a config value, in which case this
             # proxy made it evaluate to True or False, or it depends on some
             # setting, which is an error when outputting configurations-using
-            # format such as Visual Studio projects. So if the below expression
-            # throws NonConstError in the latter case, that's OK.
-            return self.visit(e.value_yes if cond.as_py() else e.value_no)
+            # format such as Visual Studio projects. So if the evaluation
+            # below throws NonConstError in the latter case, that's OK.
+            value = self._compiler.compile(e.cond)(self.mapping)
+            return self.visit(e.value_yes if value else e.value_no)
         finally:
             self.inside_cond -= 1
 
@@ -817,19 +940,28 @@ class ConfigurationProxy(object):
     depending on the value of "config", by substituting appropriate value
     according to the configuration name passed to proxy's constructor.
 
+    If *arch* is given, conditionals depending on the value of "arch" are
+    removed as well.
+
+    Processed expressions are shared by all proxies for the same configuration
+    and architecture in the project, so each expression is only specialized
+    once. Use :meth:`bkl.model.ConfigurationsPropertyMixin.get_configuration_proxy`
+    to obtain shared proxy instances.
+
     See :meth:`bkl.model.ModelPartWithConfigurations.configurations` for more information.
     """
-    def __init__(self, model, config):
+    def __init__(self, model, config, arch=None):
         self.model = model
         self.config = config
-        self._visitor = ProxyIfResolver(config.name)
+        self.arch = arch
+        self._visitor = model.project.get_proxy_resolver(config, arch)
 
     name = property(lambda self: self.config.name)
     is_debug = property(lambda self: self.config.is_debug)
     project = property(lambda self: self.model.project)
 
     def __getitem__(self, key):
-        return self._visitor.visit(self.model[key])
+        return self._visitor.specialize(self.model[key])
 
     def apply_subst(self, value):
         """
@@ -839,21 +971,20 @@ class ConfigurationProxy(object):
         and so the proxy is only partially effective.
         """
         if isinstance(value, list):
-            return [self._visitor.visit(x) for x in value]
+            return [self._visitor.specialize(x) for x in value]
         else:
-            return self._visitor.visit(value)
+            return self._visitor.specialize(value)
 
     def should_build(self):
         # see ModelPart.should_build()
         cond = self.model.condition
         if cond is None:
             return True
-        cond = self._visitor.visit_cond(cond)
         try:
-            return cond.as_py()
+            return self._visitor.evaluate_cond(cond)
         except error.NonConstError:
             from bkl.interpreter.simplify import simplify
-            cond = simplify(cond)
+            cond = simplify(self._visitor.visit_cond(cond))
             raise error.CannotDetermineError("condition for building %s couldn't be resolved\n(condition \"%s\" set at %s)" %
                         (self.model, cond, cond.pos),
                         pos=self.model.source_pos)
@@ -917,8 +1048,8 @@ class Target(ModelPart, ConfigurationsPropertyMixin):
     def _get_prop(self, name):
         return props.get_target_prop(self.type, name)
 
-    def enum_props(self):
-        return props.enum_target_props(self.type)
+    def enum_props(self, toolset=None):
+        return props.enum_target_props(self.type, toolset)
 
 
 
@@ -963,9 +1094,9 @@ class SourceFile(ModelPart, ConfigurationsPropertyMixin):
         # TODO: need to pass file type to it
         return props.get_file_prop(name)
 
-    def enum_props(self):
+    def enum_props(self, toolset=None):
         # TODO: need to pass file type to it
-        return props.enum_file_props()
+        return props.enum_file_props(toolset)
 
 
 
@@ -993,5 +1124,5 @@ class Setting(ModelPart):
     def _get_prop(self, name):
         return props.get_setting_prop(name)
 
-    def enum_props(self):
-        return props.enum_setting_props()
+    def enum_props(self, toolset=None):
+        return props.enum_setting_props(toolset)
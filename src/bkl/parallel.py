@@ -0,0 +1,153 @@
+#
+#  This file is part of Bakefile (http://bakefile.org)
+#
+#  Copyright (C) 2003-2013 Vaclav Slavik
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to
+#  deal in the Software without restriction, including without limitation the
+#  rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#  sell copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#  IN THE SOFTWARE.
+#
+
+"""
+Running independent parts of the work in worker processes.
+
+Workers are forked from the main process, so they see the fully built model
+and all caches without having to pickle them. They don't write any output
+files themselves: everything they commit is captured (see
+:func:`bkl.io.capture_output`) and written by the main process, in the same
+order as if the work was done serially. This keeps conflicts detection,
+statistics and ``--dry-run``/``--diff-only`` handling in one place. Messages
+logged by the workers are passed to the main process in the same way.
+"""
+
+import os
+
+import logging
+logger = logging.getLogger("bkl.parallel")
+
+import bkl.io
+
+
+# Maximum number of worker processes to use; 1 means no parallelism.
+jobs = 1
+
+# Work being done by the pool: (function, items) tuple. It is set before
+# forking the workers, so that they inherit it instead of unpickling it.
+_work = None
+
+# Set in worker processes to prevent nested pools.
+_in_worker = False
+
+
+def _init_worker():
+    global _in_worker
+    _in_worker = True
+
+
+class _CapturingHandler(logging.Handler):
+    # Collects log records emitted by a worker, so that the main process can
+    # log them in the right order -- or drop them if it redoes the work.
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        # format the message now, its arguments may not be picklable
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        self.records.append(record)
+
+
+def _run_item(index):
+    func, items = _work
+    root_logger = logging.getLogger()
+    handlers = root_logger.handlers
+    capturing = _CapturingHandler()
+    root_logger.handlers = [capturing]
+    bkl.io.capture_output()
+    try:
+        try:
+            result = func(items[index])
+        finally:
+            root_logger.handlers = handlers
+    except Exception as e:
+        # The item will be redone in the main process, where the error is
+        # reported with its full context.
+        logger.debug("worker failed on item %d: %s", index, e)
+        bkl.io.end_capture_output()
+        return (False, None, None, None)
+    return (True, result, bkl.io.end_capture_output(), capturing.records)
+
+
+def can_use_workers(count):
+    """
+    Returns True if *count* items of work would be processed by worker
+    processes by :func:`map_in_workers`.
+    """
+    return (jobs > 1 and count > 1 and
+            hasattr(os, "fork") and not _in_worker)
+
+
+def map_in_workers(func, items):
+    """
+    Calls *func* on every item of *items* and returns the list of results,
+    in the same order as the items.
+
+    If parallelism is enabled (:data:`jobs` is greater than 1), the calls are
+    spread over a pool of worker processes. *func* and *items* are not
+    pickled, but the results are, so they must be picklable. Output files
+    committed and messages logged by *func* are written by the calling
+    process, in the order of *items*. Any item that fails in a worker or
+    whose output conflicts with already written files is processed again
+    serially, so that errors are raised exactly as without the workers.
+    """
+    if not can_use_workers(len(items)):
+        return [func(x) for x in items]
+
+    import multiprocessing
+    global _work
+    _work = (func, items)
+    try:
+        count = min(jobs, len(items))
+        logger.debug("processing %d items in %d workers", len(items), count)
+        pool = multiprocessing.Pool(count, initializer=_init_worker)
+        try:
+            outcomes = pool.map(_run_item, range(len(items)), chunksize=1)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+    finally:
+        _work = None
+
+    results = []
+    for item, (ok, result, output, records) in zip(items, outcomes):
+        if ok and not bkl.io.conflicts_with_written(output):
+            for r in records:
+                logging.getLogger(r.name).handle(r)
+            bkl.io.replay_output(output)
+        else:
+            # Redo the item here, so that errors -- including conflicts
+            # between output files of different items -- are reported with
+            # the right context. Messages logged by the worker are dropped,
+            # they will be logged again.
+            result = func(item)
+        results.append(result)
+    return results
@@ -42,7 +42,7 @@ from BakefileQuotedStringLexer import BakefileQuotedStringLexer
 from BakefileQuotedStringParser import BakefileQuotedStringParser
 
 from bkl.error import ParserError, VersionError, warning
-from bkl.utils import memoized
+from bkl.utils import memoized, CACHE_SCOPE_SESSION
 
 
 # Helper to implement errors handling in a way we prefer
@@ -189,7 +189,7 @@ def parse(code, filename=None, detect_compatibility_errors=True):
             raise err
 
 
-@memoized
+@memoized(scope=CACHE_SCOPE_SESSION)
 def parse_file(filename):
     """
     Reads Bakefile code from given file returns parsed AST.
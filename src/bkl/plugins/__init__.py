@@ -22,6 +22,19 @@
 #  IN THE SOFTWARE.
 #
 
+"""
+Bakefile's built-in plugins.
+
+Plugins are not imported eagerly: the generated ``_manifest`` module records
+which plugin provides which extension or property, so that only plugins that
+are actually needed are imported, on demand, by :class:`bkl.api.Extension`
+and :mod:`bkl.props`. If the manifest is missing or doesn't match the plugins
+present, all plugins are loaded upfront as a fallback.
+
+Use ``make manifest`` (or :func:`write_manifest()`) to regenerate the
+manifest after changing plugins.
+"""
+
 import sys
 import logging
 __logger = logging.getLogger("bkl.plugins")
@@ -77,20 +90,191 @@ def __find_all_plugins():
         for importer in pkgutil.iter_importers(__name__):
             if hasattr(importer, 'toc'):
                 toc |= importer.toc
-        for name in toc:
-            if name.startswith(__name__ + '.'):
-                yield name[len(__name__) + 1:]
+        names = (name[len(__name__) + 1:] for name in toc if name.startswith(__name__ + '.'))
     else:
-        for _, name, _ in pkgutil.walk_packages(__path__):
+        names = (name for _, name, _ in pkgutil.walk_packages(__path__))
+    for name in names:
+        if not name.startswith("_"):
             yield name
 
 
-# import all plugins:
-__all__ = list(__find_all_plugins())
-from . import *
-assert __all__, "No plugins found - broken Bakefile installation?"
+def load(name):
+    """
+    Imports built-in plugin *name* (i.e. module name relative to
+    ``bkl.plugins``) if it wasn't imported yet.
+
+    Returns true if the plugin was loaded by this call.
+    """
+    if name in __loaded:
+        return False
+    import importlib
+    __loaded.add(name)
+    module = importlib.import_module("%s.%s" % (__name__, name))
+    __all__.append(name)
+    __logger.debug("    %-25s (from %s)", module.__name__, module.__file__)
+    # properties provided by the plugin must be made known:
+    import bkl.props
+    bkl.props.registry.update()
+    return True
+
+
+def load_all():
+    """
+    Imports all built-in plugins.
+    """
+    for name in __available:
+        load(name)
+
+
+def load_extension(kind, name):
+    """
+    Loads the plugin implementing extension *name* of type *kind* (name of
+    the extension type class, e.g. ``"Toolset"``), if there's one.
+    """
+    module = __extensions.get(kind, {}).get(name)
+    if module is not None:
+        load(module)
+
+
+def load_extensions_of_kind(kind):
+    """
+    Loads all plugins implementing some extension of type *kind*.
+    """
+    for module in sorted(set(__extensions.get(kind, {}).itervalues())):
+        load(module)
+
+
+def extension_names(kind):
+    """
+    Returns names of all known extensions of type *kind*, including those
+    implemented by plugins that weren't loaded yet.
+    """
+    return __extensions.get(kind, {}).keys()
+
+
+def load_properties(predicate, name=None):
+    """
+    Loads all plugins that provide properties matching *predicate*.
+
+    *predicate* is called with the manifest's property records, i.e. tuples
+    of ``(scope, name, plugin, toolset, inheritable)`` where *scope* is either
+    one of :class:`bkl.api.Property` scopes or name of a target type and
+    *toolset* is :const:`None` for properties not specific to any toolset.
+    If *name* is given, only properties with this name are considered.
+
+    Returns true if any plugin was loaded.
+    """
+    if name is None:
+        records = __properties
+    else:
+        records = __properties_by_name.get(name)
+        if not records:
+            return False
+    loaded = False
+    for module in sorted(set(r[2] for r in records if r[2] not in __loaded and predicate(r))):
+        loaded = load(module) or loaded
+    return loaded
+
+
+def generate_manifest():
+    """
+    Loads all plugins and returns source code of the ``_manifest`` module
+    describing them.
+    """
+    import pprint
+    import bkl.api
+
+    load_all()
+
+    def plugin_of(obj):
+        module = obj.__module__
+        if module.startswith(__name__ + "."):
+            return module[len(__name__) + 1:]
+        return None
+
+    def all_kinds(cls):
+        for kind in cls.__subclasses__():
+            if kind.__base__ is bkl.api.Extension:
+                yield kind
+
+    extensions = {}
+    for kind in all_kinds(bkl.api.Extension):
+        for name, impl in kind._implementations.iteritems():
+            module = plugin_of(impl)
+            if module is not None:
+                extensions.setdefault(kind.__name__, {})[name] = module
+
+    properties = set()
+    def add_props(ext, kind, scope, toolset):
+        module = plugin_of(ext.__class__)
+        if module is None:
+            return
+        for p in ext.all_properties(kind):
+            properties.add((scope, p.name, module, toolset, p.inheritable))
+
+    others = [(t, t.name) for t in bkl.api.Toolset.all()] + \
+             [(s, None) for s in bkl.api.CustomStep.all()]
+    for ext, toolset in others:
+        for kind in ext.all_properties_kinds():
+            if kind.startswith("properties_"):
+                add_props(ext, kind, kind[len("properties_"):], toolset)
+    for tt in bkl.api.TargetType.all():
+        add_props(tt, "properties", tt.name, None)
+
+    return MANIFEST_TEMPLATE % {
+            "modules": pprint.pformat(sorted(__available)),
+            "extensions": pprint.pformat(extensions),
+            "properties": pprint.pformat(sorted(properties)),
+            }
+
+
+def write_manifest(filename):
+    """
+    Writes output of :func:`generate_manifest()` into *filename*.
+    """
+    text = generate_manifest()
+    with open(filename, "wt") as f:
+        f.write(text)
+
+
+MANIFEST_TEMPLATE = """\
+# This file is generated by bkl.plugins.write_manifest(), do not modify it.
+# Run "make manifest" to update it after changing any plugins.
+
+#: All built-in plugins.
+MODULES = %(modules)s
+
+#: Plugins implementing extensions, keyed by extension type and name.
+EXTENSIONS = %(extensions)s
+
+#: Properties provided by plugins as (scope, name, plugin, toolset, inheritable).
+PROPERTIES = %(properties)s
+"""
+
+
+__available = list(__find_all_plugins())
+assert __available, "No plugins found - broken Bakefile installation?"
+__loaded = set()
+__all__ = []
+
+try:
+    from . import _manifest
+    if sorted(_manifest.MODULES) != sorted(__available):
+        __logger.debug("plugins manifest is out of date, ignoring it")
+        _manifest = None
+except ImportError:
+    _manifest = None
 
 __logger.debug("loaded plugins:")
-for p in __all__:
-    m = sys.modules["bkl.plugins.%s" % p]
-    __logger.debug("    %-25s (from %s)", m.__name__, m.__file__)
+if _manifest is not None:
+    __extensions = _manifest.EXTENSIONS
+    __properties = _manifest.PROPERTIES
+    __properties_by_name = {}
+    for r in __properties:
+        __properties_by_name.setdefault(r[1], []).append(r)
+else:
+    # no usable manifest, so load everything and let the lookups be no-ops:
+    __extensions = {}
+    __properties = []
+    __properties_by_name = {}
+    load_all()
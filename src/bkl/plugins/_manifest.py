@@ -0,0 +1,194 @@
+# This file is generated by bkl.plugins.write_manifest(), do not modify it.
+# Run "make manifest" to update it after changing any plugins.
+
+#: All built-in plugins.
+MODULES = ['action',
+ 'external',
+ 'gnu',
+ 'native',
+ 'vs200x',
+ 'vs201x',
+ 'vsbase',
+ 'wxwidgets']
+
+#: Plugins implementing extensions, keyed by extension type and name.
+EXTENSIONS = {'ExternalBuildHandler': {'visual-studio': 'external'},
+ 'FileCompiler': {'AR': 'gnu',
+                  'GNU C': 'gnu',
+                  'GNU C++': 'gnu',
+                  'GNU LD': 'gnu',
+                  'GNU module LD': 'gnu',
+                  'GNU shared LD': 'gnu',
+                  'WXRC': 'wxwidgets'},
+ 'FileType': {'XRC': 'wxwidgets', 'gnu-object': 'gnu'},
+ 'TargetType': {'action': 'action',
+                'external': 'external',
+                'library': 'native',
+                'loadable-module': 'native',
+                'program': 'native',
+                'shared-library': 'native'},
+ 'Toolset': {'gnu': 'gnu',
+             'gnu-osx': 'gnu',
+             'gnu-suncc': 'gnu',
+             'msvs': 'vs201x',
+             'vs2003': 'vs200x',
+             'vs2005': 'vs200x',
+             'vs2008': 'vs200x',
+             'vs2010': 'vs201x',
+             'vs2012': 'vs201x',
+             'vs2013': 'vs201x',
+             'vs2015': 'vs201x',
+             'vs2017': 'vs201x',
+             'vs2019': 'vs201x',
+             'vs2022': 'vs201x'}}
+
+#: Properties provided by plugins as (scope, name, plugin, toolset, inheritable).
+PROPERTIES = [('action', 'commands', 'action', None, False),
+ ('action', 'inputs', 'action', None, False),
+ ('action', 'outputs', 'action', None, False),
+ ('external', 'file', 'external', None, False),
+ ('library', 'allow-undefined', 'native', None, True),
+ ('library', 'archs', 'native', None, True),
+ ('library', 'basename', 'native', None, False),
+ ('library', 'c-compiler-options', 'native', None, True),
+ ('library', 'compiler-options', 'native', None, True),
+ ('library', 'cxx-compiler-options', 'native', None, True),
+ ('library', 'defines', 'native', None, True),
+ ('library', 'headers', 'native', None, False),
+ ('library', 'includedirs', 'native', None, True),
+ ('library', 'libdirs', 'native', None, True),
+ ('library', 'libs', 'native', None, True),
+ ('library', 'link-options', 'native', None, True),
+ ('library', 'multithreading', 'native', None, True),
+ ('library', 'outputdir', 'native', None, True),
+ ('library', 'pic', 'native', None, True),
+ ('library', 'sources', 'native', None, False),
+ ('library', 'warnings', 'native', None, True),
+ ('library', 'win32-crt-linkage', 'native', None, True),
+ ('library', 'win32-unicode', 'native', None, True),
+ ('loadable-module', 'allow-undefined', 'native', None, True),
+ ('loadable-module', 'archs', 'native', None, True),
+ ('loadable-module', 'basename', 'native', None, False),
+ ('loadable-module', 'c-compiler-options', 'native', None, True),
+ ('loadable-module', 'compiler-options', 'native', None, True),
+ ('loadable-module', 'cxx-compiler-options', 'native', None, True),
+ ('loadable-module', 'defines', 'native', None, True),
+ ('loadable-module', 'extension', 'native', None, False),
+ ('loadable-module', 'headers', 'native', None, False),
+ ('loadable-module', 'includedirs', 'native', None, True),
+ ('loadable-module', 'libdirs', 'native', None, True),
+ ('loadable-module', 'libs', 'native', None, True),
+ ('loadable-module', 'link-options', 'native', None, True),
+ ('loadable-module', 'multithreading', 'native', None, True),
+ ('loadable-module', 'outputdir', 'native', None, True),
+ ('loadable-module', 'pic', 'native', None, True),
+ ('loadable-module', 'sources', 'native', None, False),
+ ('loadable-module', 'warnings', 'native', None, True),
+ ('loadable-module', 'win32-crt-linkage', 'native', None, True),
+ ('loadable-module', 'win32-unicode', 'native', None, True),
+ ('module', 'None.generate-solution', 'vs201x', 'msvs', False),
+ ('module', 'None.solutionfile', 'vs201x', 'msvs', False),
+ ('module', 'gnu-osx.makefile', 'gnu', 'gnu-osx', False),
+ ('module', 'gnu-suncc.makefile', 'gnu', 'gnu-suncc', False),
+ ('module', 'gnu.makefile', 'gnu', 'gnu', False),
+ ('module', 'msvs.generate-solution', 'vs201x', 'msvs', False),
+ ('module', 'msvs.solutionfile', 'vs201x', 'msvs', False),
+ ('module', 'msvs2010.solutionfile', 'vs201x', 'msvs', False),
+ ('module', 'msvs2012.solutionfile', 'vs201x', 'msvs', False),
+ ('module', 'msvs2013.solutionfile', 'vs201x', 'msvs', False),
+ ('module', 'msvs2015.solutionfile', 'vs201x', 'msvs', False),
+ ('module', 'msvs2017.solutionfile', 'vs201x', 'msvs', False),
+ ('module', 'msvs2019.solutionfile', 'vs201x', 'msvs', False),
+ ('module', 'msvs2022.solutionfile', 'vs201x', 'msvs', False),
+ ('module', 'vs2003.generate-solution', 'vs200x', 'vs2003', False),
+ ('module', 'vs2003.solutionfile', 'vs200x', 'vs2003', False),
+ ('module', 'vs2005.generate-solution', 'vs200x', 'vs2005', False),
+ ('module', 'vs2005.solutionfile', 'vs200x', 'vs2005', False),
+ ('module', 'vs2008.generate-solution', 'vs200x', 'vs2008', False),
+ ('module', 'vs2008.solutionfile', 'vs200x', 'vs2008', False),
+ ('module', 'vs2010.generate-solution', 'vs201x', 'vs2010', False),
+ ('module', 'vs2010.solutionfile', 'vs201x', 'vs2010', False),
+ ('module', 'vs2012.generate-solution', 'vs201x', 'vs2012', False),
+ ('module', 'vs2012.solutionfile', 'vs201x', 'vs2012', False),
+ ('module', 'vs2013.generate-solution', 'vs201x', 'vs2013', False),
+ ('module', 'vs2013.solutionfile', 'vs201x', 'vs2013', False),
+ ('module', 'vs2015.generate-solution', 'vs201x', 'vs2015', False),
+ ('module', 'vs2015.solutionfile', 'vs201x', 'vs2015', False),
+ ('module', 'vs2017.generate-solution', 'vs201x', 'vs2017', False),
+ ('module', 'vs2017.solutionfile', 'vs201x', 'vs2017', False),
+ ('module', 'vs2019.generate-solution', 'vs201x', 'vs2019', False),
+ ('module', 'vs2019.solutionfile', 'vs201x', 'vs2019', False),
+ ('module', 'vs2022.generate-solution', 'vs201x', 'vs2022', False),
+ ('module', 'vs2022.solutionfile', 'vs201x', 'vs2022', False),
+ ('program', 'allow-undefined', 'native', None, True),
+ ('program', 'archs', 'native', None, True),
+ ('program', 'basename', 'native', None, False),
+ ('program', 'c-compiler-options', 'native', None, True),
+ ('program', 'compiler-options', 'native', None, True),
+ ('program', 'cxx-compiler-options', 'native', None, True),
+ ('program', 'defines', 'native', None, True),
+ ('program', 'headers', 'native', None, False),
+ ('program', 'includedirs', 'native', None, True),
+ ('program', 'libdirs', 'native', None, True),
+ ('program', 'libs', 'native', None, True),
+ ('program', 'link-options', 'native', None, True),
+ ('program', 'multithreading', 'native', None, True),
+ ('program', 'outputdir', 'native', None, True),
+ ('program', 'pic', 'native', None, True),
+ ('program', 'sources', 'native', None, False),
+ ('program', 'warnings', 'native', None, True),
+ ('program', 'win32-crt-linkage', 'native', None, True),
+ ('program', 'win32-subsystem', 'native', None, True),
+ ('program', 'win32-unicode', 'native', None, True),
+ ('shared-library', 'allow-undefined', 'native', None, True),
+ ('shared-library', 'archs', 'native', None, True),
+ ('shared-library', 'basename', 'native', None, False),
+ ('shared-library', 'c-compiler-options', 'native', None, True),
+ ('shared-library', 'compiler-options', 'native', None, True),
+ ('shared-library', 'cxx-compiler-options', 'native', None, True),
+ ('shared-library', 'defines', 'native', None, True),
+ ('shared-library', 'headers', 'native', None, False),
+ ('shared-library', 'includedirs', 'native', None, True),
+ ('shared-library', 'libdirs', 'native', None, True),
+ ('shared-library', 'libs', 'native', None, True),
+ ('shared-library', 'link-options', 'native', None, True),
+ ('shared-library', 'multithreading', 'native', None, True),
+ ('shared-library', 'outputdir', 'native', None, True),
+ ('shared-library', 'pic', 'native', None, True),
+ ('shared-library', 'sources', 'native', None, False),
+ ('shared-library', 'warnings', 'native', None, True),
+ ('shared-library', 'win32-crt-linkage', 'native', None, True),
+ ('shared-library', 'win32-unicode', 'native', None, True),
+ ('target', 'gnu-osx.timing-log', 'gnu', 'gnu-osx', True),
+ ('target', 'gnu-suncc.timing-log', 'gnu', 'gnu-suncc', True),
+ ('target', 'gnu.timing-log', 'gnu', 'gnu', True),
+ ('target', 'msvs.guid', 'vs201x', 'msvs', False),
+ ('target', 'msvs.projectfile', 'vs201x', 'msvs', False),
+ ('target', 'vs.property-sheets', 'vs201x', 'msvs', True),
+ ('target', 'vs.property-sheets', 'vs201x', 'vs2010', True),
+ ('target', 'vs.property-sheets', 'vs201x', 'vs2012', True),
+ ('target', 'vs.property-sheets', 'vs201x', 'vs2013', True),
+ ('target', 'vs.property-sheets', 'vs201x', 'vs2015', True),
+ ('target', 'vs.property-sheets', 'vs201x', 'vs2017', True),
+ ('target', 'vs.property-sheets', 'vs201x', 'vs2019', True),
+ ('target', 'vs.property-sheets', 'vs201x', 'vs2022', True),
+ ('target', 'vs2003.guid', 'vs200x', 'vs2003', False),
+ ('target', 'vs2003.projectfile', 'vs200x', 'vs2003', False),
+ ('target', 'vs2005.guid', 'vs200x', 'vs2005', False),
+ ('target', 'vs2005.projectfile', 'vs200x', 'vs2005', False),
+ ('target', 'vs2008.guid', 'vs200x', 'vs2008', False),
+ ('target', 'vs2008.projectfile', 'vs200x', 'vs2008', False),
+ ('target', 'vs2010.guid', 'vs201x', 'vs2010', False),
+ ('target', 'vs2010.projectfile', 'vs201x', 'vs2010', False),
+ ('target', 'vs2012.guid', 'vs201x', 'vs2012', False),
+ ('target', 'vs2012.projectfile', 'vs201x', 'vs2012', False),
+ ('target', 'vs2013.guid', 'vs201x', 'vs2013', False),
+ ('target', 'vs2013.projectfile', 'vs201x', 'vs2013', False),
+ ('target', 'vs2015.guid', 'vs201x', 'vs2015', False),
+ ('target', 'vs2015.projectfile', 'vs201x', 'vs2015', False),
+ ('target', 'vs2017.guid', 'vs201x', 'vs2017', False),
+ ('target', 'vs2017.projectfile', 'vs201x', 'vs2017', False),
+ ('target', 'vs2019.guid', 'vs201x', 'vs2019', False),
+ ('target', 'vs2019.projectfile', 'vs201x', 'vs2019', False),
+ ('target', 'vs2022.guid', 'vs201x', 'vs2022', False),
+ ('target', 'vs2022.projectfile', 'vs201x', 'vs2022', False)]
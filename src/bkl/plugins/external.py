@@ -33,8 +33,19 @@ from bkl.plugins.vsbase import VSProjectBase, VSToolsetBase, PROJECT_KIND_NET
 from bkl.utils import memoized_property, filter_duplicates
 from bkl.vartypes import ListType, StringType
 
-import xml.etree.ElementTree
+try:
+    import xml.etree.cElementTree as ElementTree
+except ImportError:
+    import xml.etree.ElementTree as ElementTree
 import re
+import os
+import os.path
+import hashlib
+import cPickle as pickle
+from cStringIO import StringIO
+
+import logging
+logger = logging.getLogger("bkl.external")
 
 
 class ExternalBuildHandler(Extension, FileRecognizer):
@@ -61,6 +72,10 @@ class ExternalTargetType(TargetType):
 
     Currently, only Visual Studio projects (vcproj, vcxproj, csproj) are
     supported and only when using a Visual Studio toolset.
+
+    The information read from the project files can be cached between runs
+    of Bakefile by setting the ``BAKEFILE_CACHE_DIR`` environment variable to
+    the directory to keep the cache in.
     """
     name = "external"
 
@@ -92,9 +107,135 @@ XMLNS = {
     "ms" : "http://schemas.microsoft.com/developer/msbuild/2003"
 }
 
+
+class VSProjectMetadataCache(object):
+    """
+    Persistent cache of metadata extracted from external project files.
+
+    The entries are keyed by the project's path and are valid for as long as
+    its size and modification time don't change. If they do, the file's hash
+    is compared too, so that merely touching the file doesn't require
+    parsing it again. The hash is only computed for persistent caches, an
+    in-memory one doesn't outlive changes to the files anyway.
+
+    :param filename: File to keep the cache in; if None, it is only kept in
+                     memory.
+    """
+    # Change this when the format of the entries or metadata changes.
+    FORMAT_VERSION = 2
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.hits = 0
+        self.misses = 0
+        self._entries = None
+        self._modified = False
+
+    def get(self, filename, kind, reader):
+        """
+        Returns metadata of project *filename*. On a cache miss, *reader* is
+        called with the project file's content to extract them. *kind*
+        identifies the reader used.
+        """
+        if self._entries is None:
+            self._entries = self._load()
+        key = (os.path.abspath(filename), kind)
+        try:
+            st = os.stat(filename)
+        except OSError as e:
+            # report it the same way as failing to open the file
+            raise IOError(e.errno, e.strerror, filename)
+        entry = self._entries.get(key)
+        if entry is not None and entry[:2] == (st.st_size, st.st_mtime):
+            self.hits += 1
+            return entry[3]
+
+        with open(filename, "rb") as f:
+            data = f.read()
+        if self.filename is not None:
+            digest = hashlib.sha1(data).hexdigest()
+        else:
+            digest = None
+        if digest is not None and entry is not None and entry[2] == digest:
+            self.hits += 1
+            metadata = entry[3]
+        else:
+            self.misses += 1
+            metadata = reader(data)
+        self._entries[key] = (st.st_size, st.st_mtime, digest, metadata)
+        self._modified = True
+        return metadata
+
+    def _load(self):
+        if self.filename is None:
+            return {}
+        try:
+            with open(self.filename, "rb") as f:
+                version, entries = pickle.load(f)
+            if version == self.FORMAT_VERSION:
+                return entries
+        except IOError:
+            pass
+        except Exception as e:
+            # the cache is just an optimization, ignore broken files
+            logger.debug("ignoring corrupted cache %s: %s", self.filename, e)
+        return {}
+
+    def save(self):
+        """
+        Writes the cache to its file, if it was modified.
+        """
+        logger.debug("external projects metadata cache: %d hits, %d misses",
+                     self.hits, self.misses)
+        if self.filename is None or not self._modified:
+            return
+        try:
+            dirname = os.path.dirname(self.filename)
+            if dirname and not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            tmpname = "%s.%d.tmp" % (self.filename, os.getpid())
+            with open(tmpname, "wb") as f:
+                pickle.dump((self.FORMAT_VERSION, self._entries), f, pickle.HIGHEST_PROTOCOL)
+            if os.name == "nt" and os.path.exists(self.filename):
+                os.remove(self.filename)
+            os.rename(tmpname, self.filename)
+            self._modified = False
+        except (IOError, OSError) as e:
+            logger.debug("failed to save cache %s: %s", self.filename, e)
+
+
+def _default_metadata_cache_file():
+    # The persistent cache is only used if BAKEFILE_CACHE_DIR is set.
+    cachedir = os.environ.get("BAKEFILE_CACHE_DIR")
+    if not cachedir:
+        return None
+    return os.path.join(cachedir, "vsprojects.cache")
+
+
+_metadata_cache = None
+
+def get_metadata_cache():
+    """
+    Returns the :class:`VSProjectMetadataCache` instance used for external
+    projects. If it is persistent, it is saved automatically when Bakefile
+    exits.
+    """
+    global _metadata_cache
+    if _metadata_cache is None:
+        _metadata_cache = VSProjectMetadataCache(_default_metadata_cache_file())
+        if _metadata_cache.filename is not None:
+            import atexit
+            atexit.register(_metadata_cache.save)
+    return _metadata_cache
+
+
 class VSExternalProjectBase(VSProjectBase):
     """
     Wrapper around externally-provided project file, base class.
+
+    Only the few bits of information needed for the solution are extracted
+    from the project file; derived classes implement this in
+    :meth:`_new_metadata()`, :meth:`_scan_root()` and :meth:`_scan_toplevel()`.
     """
     def __init__(self, target):
         self._project = target.project
@@ -119,8 +260,58 @@ class VSExternalProjectBase(VSProjectBase):
         self._configurations = get_prop_value_from_here(target, "configurations")
         self.dependencies = []
         self.source_pos = target.source_pos
-        xmldoc = xml.etree.ElementTree.parse(self.projectfile.as_native_path_for_output(target))
-        self.xml = xmldoc.getroot()
+        filename = self.projectfile.as_native_path_for_output(target)
+        try:
+            self.metadata = get_metadata_cache().get(filename,
+                                                     self.__class__.__name__,
+                                                     self._read_metadata)
+        except IOError as e:
+            with error_context(self.projectfile):
+                raise Error("cannot read external project %s: %s" % (filename, e.strerror))
+
+    @classmethod
+    def _read_metadata(cls, data):
+        """
+        Extracts metadata from the project file's content *data*. The file
+        is parsed incrementally, discarding the already scanned elements, and
+        only until _scan_toplevel() says that nothing more can be found.
+        """
+        metadata = cls._new_metadata()
+        depth = 0
+        for event, elem in ElementTree.iterparse(StringIO(data), events=("start", "end")):
+            if event == "start":
+                if depth == 0:
+                    cls._scan_root(elem, metadata)
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 1:
+                    done = cls._scan_toplevel(elem, metadata)
+                    elem.clear()
+                    if done:
+                        break
+        return metadata
+
+    @classmethod
+    def _new_metadata(cls):
+        """Returns dictionary to fill with the metadata."""
+        raise NotImplementedError
+
+    @classmethod
+    def _scan_root(cls, elem, metadata):
+        """
+        Extracts metadata from the root element; its children are not
+        parsed yet at this point.
+        """
+        pass
+
+    @classmethod
+    def _scan_toplevel(cls, elem, metadata):
+        """
+        Extracts metadata from the fully parsed child *elem* of the root
+        element. Returns True if no more metadata can follow.
+        """
+        raise NotImplementedError
 
     @memoized_property
     def configurations(self):
@@ -157,9 +348,27 @@ class VSExternalProject200x(VSExternalProjectBase):
     """
     Wrapper around VS 200{3,5,8} project files.
     """
+    @classmethod
+    def _new_metadata(cls):
+        return {"attrs": {}, "configurations": None, "platforms": None}
+
+    @classmethod
+    def _scan_root(cls, elem, metadata):
+        metadata["attrs"] = dict((k, elem.get(k)) for k in ("Version", "Name", "ProjectGUID"))
+
+    @classmethod
+    def _scan_toplevel(cls, elem, metadata):
+        if elem.tag == "Configurations":
+            metadata["configurations"] = [x.get("Name").partition("|")[0]
+                                          for x in elem.findall("Configuration")]
+        elif elem.tag == "Platforms":
+            metadata["platforms"] = [x.get("Name") for x in elem.findall("Platform")]
+        return (metadata["configurations"] is not None and
+                metadata["platforms"] is not None)
+
     @memoized_property
     def version(self):
-        v = self.xml.get("Version")
+        v = self.metadata["attrs"]["Version"]
         if v and "," in v:
             # vcproj files written under some locales (French, Czech) may use
             # ',' as decimal point character.
@@ -173,28 +382,73 @@ class VSExternalProject200x(VSExternalProjectBase):
 
     @memoized_property
     def name(self):
-        return self.xml.get("Name")
+        return self.metadata["attrs"]["Name"]
 
     @memoized_property
     def guid(self):
-        return self.xml.get("ProjectGUID")[1:-1]
+        return self.metadata["attrs"]["ProjectGUID"][1:-1]
 
     def _extract_configurations_names(self):
-        for x in self.xml.findall("Configurations/Configuration"):
-            yield x.get("Name").partition("|")[0]
+        return self.metadata["configurations"] or []
 
     def _extract_platforms(self):
-        for x in self.xml.findall("Platforms/Platform"):
-            yield x.get("Name")
+        return self.metadata["platforms"] or []
+
+
+class VSExternalProjectMSBuild(VSExternalProjectBase):
+    """
+    Base class for wrappers around MSBuild project files.
+
+    The elements with the metadata may be anywhere in the file, so all of it
+    is always scanned.
+    """
+
+    # Properties to extract from PropertyGroup elements.
+    properties = ["ProjectGuid"]
+
+    @classmethod
+    def _new_metadata(cls):
+        metadata = dict((p, None) for p in cls.properties)
+        metadata["ToolsVersion"] = None
+        return metadata
+
+    @classmethod
+    def _scan_root(cls, elem, metadata):
+        metadata["ToolsVersion"] = elem.get("ToolsVersion")
+
+    @classmethod
+    def _scan_toplevel(cls, elem, metadata):
+        if elem.tag == "{%(ms)s}PropertyGroup" % XMLNS:
+            for p in cls.properties:
+                if metadata[p] is None:
+                    metadata[p] = elem.findtext(("{%(ms)s}" % XMLNS) + p)
+        return False
 
 
-class VSExternalProject201x(VSExternalProjectBase):
+class VSExternalProject201x(VSExternalProjectMSBuild):
     """
     Wrapper around VS 201x project files.
     """
+    properties = ["ProjectGuid", "ProjectName", "PlatformToolset"]
+
+    @classmethod
+    def _new_metadata(cls):
+        metadata = super(VSExternalProject201x, cls)._new_metadata()
+        metadata["configurations"] = []
+        metadata["platforms"] = []
+        return metadata
+
+    @classmethod
+    def _scan_toplevel(cls, elem, metadata):
+        if elem.tag == "{%(ms)s}ItemGroup" % XMLNS:
+            for x in elem.findall("{%(ms)s}ProjectConfiguration" % XMLNS):
+                metadata["configurations"] += [c.text for c in x.findall("{%(ms)s}Configuration" % XMLNS)]
+                metadata["platforms"] += [p.text for p in x.findall("{%(ms)s}Platform" % XMLNS)]
+        return super(VSExternalProject201x, cls)._scan_toplevel(elem, metadata)
+
     @memoized_property
     def version(self):
-        v = self.xml.get("ToolsVersion")
+        v = self.metadata["ToolsVersion"]
         if v == "16.0":
             return 16
         elif v == "15.0":
@@ -206,44 +460,52 @@ class VSExternalProject201x(VSExternalProjectBase):
         elif v != "4.0":
             raise Error("unrecognized version of Visual Studio project %s: ToolsVersion=\"%s\"" %(
                         self.projectfile, v))
-        # TODO-PY26: use "PropertyGroup[@Label='Configuration']"
-        t = self.xml.findtext("{%(ms)s}PropertyGroup/{%(ms)s}PlatformToolset" % XMLNS)
-        if t == "v110":
+        if self.metadata["PlatformToolset"] == "v110":
             return 11
         else:
             return 10
 
     @memoized_property
     def name(self):
-        # TODO-PY26: use "PropertyGroup[@Label='Globals']"
-        name = self.xml.findtext("{%(ms)s}PropertyGroup/{%(ms)s}ProjectName" % XMLNS)
+        name = self.metadata["ProjectName"]
         if name is None:
             name = self.projectfile.get_basename()
         return name
 
     @memoized_property
     def guid(self):
-        # TODO-PY26: use "PropertyGroup[@Label='Globals']"
-        return self.xml.findtext("{%(ms)s}PropertyGroup/{%(ms)s}ProjectGuid" % XMLNS)[1:-1]
+        return self.metadata["ProjectGuid"][1:-1]
 
     def _extract_configurations_names(self):
-        # TODO-PY26: use "ItemGroup[@Label='ProjectConfigurations']"
-        for x in self.xml.findall("{%(ms)s}ItemGroup/{%(ms)s}ProjectConfiguration/{%(ms)s}Configuration" % XMLNS):
-            yield x.text
+        return self.metadata["configurations"]
 
     def _extract_platforms(self):
-        # TODO-PY26: use "ItemGroup[@Label='ProjectConfigurations']"
-        for x in self.xml.findall("{%(ms)s}ItemGroup/{%(ms)s}ProjectConfiguration/{%(ms)s}Platform" % XMLNS):
-            yield x.text
+        return self.metadata["platforms"]
 
 
-class VSExternalProjectCSharp(VSExternalProjectBase):
+class VSExternalProjectCSharp(VSExternalProjectMSBuild):
     """
     Wrapper around VS C# project files.
     """
 
     kind = PROJECT_KIND_NET
 
+    @classmethod
+    def _new_metadata(cls):
+        metadata = super(VSExternalProjectCSharp, cls)._new_metadata()
+        metadata["configs_and_platforms"] = []
+        return metadata
+
+    @classmethod
+    def _scan_toplevel(cls, elem, metadata):
+        if elem.tag == "{%(ms)s}PropertyGroup" % XMLNS:
+            cond = elem.get("Condition")
+            if cond:
+                m = re.match(r" *'\$\(Configuration\)\|\$\(Platform\)' *== '(.*)\|(.*)' *", cond)
+                if m:
+                    metadata["configs_and_platforms"].append((m.group(1), m.group(2)))
+        return super(VSExternalProjectCSharp, cls)._scan_toplevel(elem, metadata)
+
     @memoized_property
     def version(self):
         # .csproj files are generally usable across VS versions
@@ -255,22 +517,13 @@ class VSExternalProjectCSharp(VSExternalProjectBase):
 
     @memoized_property
     def guid(self):
-        # TODO-PY26: use "PropertyGroup[@Label='Globals']"
-        return self.xml.findtext("{%(ms)s}PropertyGroup/{%(ms)s}ProjectGuid" % XMLNS)[1:-1]
-
-    def _extract_configs_and_platforms(self):
-        for n in self.xml.findall("{%(ms)s}PropertyGroup" % XMLNS):
-            cond = n.get("Condition")
-            if cond:
-                m = re.match(r" *'\$\(Configuration\)\|\$\(Platform\)' *== '(.*)\|(.*)' *", cond)
-                if m:
-                    yield (m.group(1), m.group(2))
+        return self.metadata["ProjectGuid"][1:-1]
 
     def _extract_configurations_names(self):
-        return (x[0] for x in self._extract_configs_and_platforms())
+        return (x[0] for x in self.metadata["configs_and_platforms"])
 
     def _extract_platforms(self):
-        for x in filter_duplicates(self._extract_configs_and_platforms()):
+        for x in filter_duplicates(self.metadata["configs_and_platforms"]):
             p = x[1]
             # .csproj files use "AnyCPU", but .sln files (which is what this is
             # for) use "Any CPU".
@@ -315,6 +315,16 @@ class GnuMakefileFormatter(MakefileFormatter):
     def submake_command(self, directory, filename, target):
         return "$(MAKE) -C %s -f %s %s" % (directory, filename, target)
 
+    def timed_command(self, command, timestamp, record, logfile):
+        # Make's "@", "-" and "+" prefixes must stay in front of the whole
+        # command. The original command runs in a subshell, so that it can't
+        # change directory or exit before the record is written.
+        body = command.lstrip("@-+")
+        prefix = command[:len(command) - len(body)]
+        return ('%s_bkl_t0=$$(%s); ( %s ); _bkl_rc=$$?; '
+                'echo "%s $$_bkl_t0 $$(%s)" >> %s; exit $$_bkl_rc'
+                % (prefix, timestamp, body, record, timestamp, logfile))
+
     def multifile_target(self, outputs, outfiles, deps, commands):
         # Use a helper intermediate target to handle multiple outputs of a rule,
         # because we can't easily use GNU Make's pattern rules matching. The
@@ -417,6 +427,8 @@ class GnuToolset(MakefileToolset):
     autoclean_extensions = ["o", "d"]
     del_command = "rm -f"
 
+    timestamp_command = "date +%s.%N"
+
     object_type = GnuObjectFileType.get()
 
     allow_undefined_link_flag = "" # This is the default
@@ -688,6 +700,9 @@ class OSXGnuToolset(GnuToolset):
     soname_flags = "-install_name @rpath/$(notdir $@)"
     pthread_ld_flags = None
 
+    # BSD date doesn't support %N, so use Perl, which is always available.
+    timestamp_command = "perl -MTime::HiRes=time -e 'printf \"%.6f\", time'"
+
     def _get_archiver_definition(self, make_variables):
         make_variables.append('LIBTOOL')
 
@@ -744,6 +759,9 @@ class SunCCGnuToolset(GnuToolset):
     # FIXME: Do this for C++ only
     extra_link_flags = "-lCstd -lCrun"
 
+    # Solaris date doesn't support %N either.
+    timestamp_command = OSXGnuToolset.timestamp_command
+
     warning_flags = {
         "no":       "-w",
         "minimal":  None,
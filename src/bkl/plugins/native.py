@@ -32,7 +32,7 @@ from bkl.vartypes import *
 from bkl.compilers import *
 from bkl.expr import concat, PathExpr, LiteralExpr, NullExpr, ANCHOR_BUILDDIR
 from bkl.error import NonConstError, error_context
-from bkl.utils import memoized
+from bkl.utils import memoized, CACHE_SCOPE_TOOLSET
 
 class NativeCompiledType(TargetType):
     """Base class for natively-compiled targets."""
@@ -344,7 +344,7 @@ class NativeLinkedType(NativeCompiledType):
         return out
 
 
-    @memoized
+    @memoized(scope=CACHE_SCOPE_TOOLSET)
     def get_linkable_deps(self, target):
         """
         Returns iterator over target objects that are (transitive) dependencies.
@@ -244,7 +244,7 @@ class VS200xToolsetBase(VSToolsetBase):
 
         f = OutputFile(filename, EOL_WINDOWS, charset=VCPROJ_CHARSET,
                        creator=self, create_for=target)
-        f.write(self.XmlFormatter(target.project.settings, paths_info).format(root))
+        self.XmlFormatter(target.project.settings, paths_info).write(root, f)
         f.commit()
 
 
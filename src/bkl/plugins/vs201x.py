@@ -421,7 +421,7 @@ class VS201xToolsetBase(VSToolsetBase):
         f = OutputFile(filename, EOL_WINDOWS,
                        creator=self, create_for=target)
         f.write(codecs.BOM_UTF8)
-        f.write(formatter.format(root))
+        formatter.write(root, f)
         f.commit()
         self._write_filters_file_for(filename, formatter,
                                      target.headers, cl_files, idl_files, rc_files, natvis_files)
@@ -548,7 +548,7 @@ class VS201xToolsetBase(VSToolsetBase):
         f = OutputFile(filename + ".filters", EOL_WINDOWS,
                        creator=self, create_for=filename)
         f.write(codecs.BOM_UTF8)
-        f.write(formatter.format(root))
+        formatter.write(root, f)
         f.commit()
 
 
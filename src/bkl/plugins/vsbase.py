@@ -36,7 +36,8 @@ import logging
 logger = logging.getLogger("bkl.vsbase")
 
 import bkl.expr
-from bkl.utils import OrderedDict, OrderedSet, memoized
+import bkl.parallel
+from bkl.utils import OrderedDict, OrderedSet, memoized, CACHE_SCOPE_TOOLSET
 from bkl.error import error_context, warning, Error, CannotDetermineError
 from bkl.api import Toolset, Property
 from bkl.model import ConfigurationProxy
@@ -266,85 +267,109 @@ class XmlFormatter(object):
         Formats given node as an XML document and returns the document as a
         string.
         """
-        return XML_HEADER % dict(charset=self.charset) + self._do_format_node(node, "")
+        out = []
+        self._write_document(node, out.append)
+        return "".join(out)
 
-    def _do_format_node(self, n, indent):
+    def write(self, node, f):
+        """
+        Formats given node as an XML document and writes it into *f*, which
+        is typically :class:`bkl.io.OutputFile`, piece by piece as the markup
+        is produced.
+        """
+        self._write_document(node, f.write)
+
+    def _write_document(self, node, write):
+        write(XML_HEADER % dict(charset=self.charset))
+        self._write_node(node, "", write, [])
+
+    def _write_node(self, n, indent, write, pending):
+        """
+        Writes markup for node *n*, indented with *indent* text, by calling
+        *write* with its pieces.
+
+        As we don't know whether an element with children is empty (all of
+        them may have empty values) until they're all processed, its start
+        tag isn't written immediately, but put on the *pending* stack and
+        only written, together with the pending tags of its ancestors, before
+        the first piece of its content.
+        """
+        name = n.name
         attrs = self._get_quoted_nonempty_attrs(n)
         if n.children:
-            children_markup = []
             assert not n.text, "nodes with both text and children not implemented"
+            pending.append((name, attrs, indent))
+            depth = len(pending)
             subindent = indent + self.indent_step
             for key, value in n.children:
                 if isinstance(value, Node):
                     assert key == value.name
-                    children_markup.append(self._do_format_node(value, subindent))
+                    self._write_node(value, subindent, write, pending)
                 else:
                     try:
                         v = escape(self.format_value(value))
                         if v:
-                            children_markup.append("%s<%s>%s</%s>\n" % (subindent, key, v, key))
+                            self._write_pending(write, pending)
+                            write("%s<%s>%s</%s>\n" % (subindent, key, v, key))
                         # else: empty value, don't write that
                     except CannotDetermineError as e:
                         with error_context(value):
                             raise Error("cannot set property \"%s\" to non-constant expression \"%s\" (%s)" %
                                         (key, value, e.msg))
-            children_markup = "".join(children_markup)
-        else:
-            children_markup = None
-        text = self.format_value(n.text) if n.text else None
-        return self.format_node(n.name, attrs, text, children_markup, indent)
+            if len(pending) < depth:
+                # the start tag was written, so there was some content
+                write("%s</%s>\n" % (indent, name))
+                return
+            pending.pop()
+        elif n.text:
+            text = self.format_value(n.text)
+            if text:
+                self._write_pending(write, pending)
+                write("%s%s</%s>\n" % (self._start_tag(name, attrs, indent), text, name))
+                return
+        self._write_pending(write, pending)
+        write(self._empty_element(name, attrs, indent))
 
-    def format_node(self, name, attrs, text, children_markup, indent):
+    def _write_pending(self, write, pending):
         """
-        Formats given Node instance, indented with *indent* text.
+        Writes start tags of the elements on the *pending* stack.
+        """
+        for name, attrs, indent in pending:
+            write(self._start_tag(name, attrs, indent) + "\n")
+        del pending[:]
 
-        Content is either *text* or *children_markup*; the other is None. All
-        arguments already use properly escaped markup; values in *attrs* are
+    def _start_tag(self, name, attrs, indent):
+        """
+        Returns start tag of a non-empty element. Values in *attrs* are
         quoted and escaped.
         """
-        s = "%s<%s" % (indent, name)
         if attrs:
             # Different versions put attributes on the same or different
             # lines, so do this in a separate method to allow overriding it.
-            s += self.format_attrs(attrs, indent)
-
-            if text or children_markup:
-                # Moreover, different versions may or not put a new line
-                # before the closing angle bracket, so we need a method here
-                # too.
-                s += self.format_end_tag_with_attrs(indent)
-            else: # An empty element
-                # Some empty elements are output as "<foo/>" while others as
-                # "<foo>\n</foo>".
-                if name not in self.elems_not_collapsed:
-                    # And different versions close an empty tag differently,
-                    # so abstract it into a separate method as well.
-                    s += self.format_end_empty_tag(indent)
-
-                    # Skip the closing tag addition below.
-                    s += "\n"
-                    return s
-
-                s += self.format_end_tag_with_attrs(indent)
-                s += "\n"
-                s += indent
+            # Moreover, different versions may or not put a new line before
+            # the closing angle bracket, so we need a method here too.
+            return "%s<%s%s%s" % (indent, name,
+                                  self.format_attrs(attrs, indent),
+                                  self.format_end_tag_with_attrs(indent))
         else:
-            if text or children_markup:
-                s += ">"
-            else:
-                s += ">\n"
-                s += indent
+            return "%s<%s>" % (indent, name)
 
-        if text:
-            s += text
-        elif children_markup:
-            s += "\n"
-            s += children_markup
-            s += indent
-
-        s += "</%s>\n" % name
-
-        return s
+    def _empty_element(self, name, attrs, indent):
+        """
+        Returns markup for an element without any content.
+        """
+        if attrs:
+            s = "%s<%s%s" % (indent, name, self.format_attrs(attrs, indent))
+            # Some empty elements are output as "<foo/>" while others as
+            # "<foo>\n</foo>".
+            if name not in self.elems_not_collapsed:
+                # And different versions close an empty tag differently,
+                # so abstract it into a separate method as well.
+                return s + self.format_end_empty_tag(indent) + "\n"
+            s += self.format_end_tag_with_attrs(indent)
+        else:
+            s = "%s<%s>" % (indent, name)
+        return "%s\n%s</%s>\n" % (s, indent, name)
 
     def format_value(self, val):
         # This trick is necessary, because 'val' may be of many types -- in
@@ -360,7 +385,7 @@ class XmlFormatter(object):
         """
         Returns the list containing formatted attributes.
 
-        Parameters of this method are a subset of format_node() parameters.
+        Parameters of this method are a subset of _start_tag() parameters.
         """
         s = ''
         for key, value in attrs:
@@ -382,7 +407,7 @@ class XmlFormatter(object):
         """
         return " />"
 
-    @memoized
+    @memoized(scope=CACHE_SCOPE_TOOLSET, weak_keys=True)
     def _format_value(self, val, valtype):
         """
         Formats given value (of any type) into XML text.
@@ -453,6 +478,26 @@ class VSProjectBase(object):
     source_pos = None
 
 
+class VSProjectsIndex(object):
+    """
+    Index of all projects of all solutions generated by a toolset for the
+    given project, by their names (which are the IDs of their targets).
+
+    The solutions use it to find dependencies' projects and GUIDs, instead of
+    searching the tree of solutions.
+    """
+    def __init__(self):
+        self._projects = {}
+
+    def add(self, prj):
+        """Adds project (VSProjectBase-derived object) to the index."""
+        self._projects[prj.name] = prj
+
+    def get(self, id):
+        """Returns project of target *id* or None."""
+        return self._projects.get(id)
+
+
 class VSSolutionBase(object):
     """
     Base class for a representation of a Visual Studio solution file.
@@ -472,6 +517,10 @@ class VSSolutionBase(object):
         # unlike targets, modules' names aren't globally unique, so use the fully qualified name, which is
         self.guid = GUID(NAMESPACE_SLN_GROUP, module.project.top_module.name, module.fully_qualified_name)
         self.projects = OrderedDict()
+        if toolset.projects_index is None:
+            # solution created outside of generate()
+            toolset.projects_index = VSProjectsIndex()
+        self.projects_index = toolset.projects_index
         self.subsolutions = []
         self.parent_solution = None
         paths_info = bkl.expr.PathAnchorsInfo(
@@ -488,6 +537,7 @@ class VSSolutionBase(object):
         Adds a project (VSProjectBase-derived object) to the solution.
         """
         self.projects[prj.name] = prj
+        self.projects_index.add(prj)
 
     def add_subsolution(self, solution):
         """
@@ -510,31 +560,22 @@ class VSSolutionBase(object):
             for s in sln.all_subsolutions():
                 yield s
 
-    def _get_project_by_id(self, id):
-        try:
-            return self.projects[id]
-        except KeyError:
-            for sln in self.subsolutions:
-                p = sln._get_project_by_id(id)
-                if p:
-                    return p
-            return None
-
-    def additional_deps(self):
+    def additional_deps(self, own_projects=None):
         """
         Returns additional projects to include, "external" deps e.g. from
         parents, in the same format all_projects() uses.
+
+        *own_projects* is the list of all_projects(), if already known.
         """
         additional = []
-        top = self
-        while top.parent_solution:
-            top = top.parent_solution
-        if top is self:
+        if self.parent_solution is None:
             return additional
 
-        included = set(x.name for x in self.all_projects())
+        if own_projects is None:
+            own_projects = list(self.all_projects())
+        included = set(x.name for x in own_projects)
         todo = set()
-        for prj in self.all_projects():
+        for prj in own_projects:
             if prj.dependencies:
                 todo.update(prj.dependencies)
 
@@ -545,34 +586,17 @@ class VSSolutionBase(object):
             todo_new = set()
             for todo_item in sorted(todo):
                 included.add(todo_item)
-                prj = top._get_project_by_id(todo_item)
+                prj = self.projects_index.get(todo_item)
                 if prj.dependencies:
                     todo_new.update(prj.dependencies)
                 additional.append(prj)
             todo.update(todo_new)
         return additional
 
-    def _find_target_guid_recursively(self, id):
-        """Recursively search for the target in all submodules and return its GUID."""
-        try:
-            return self.projects[id].guid
-        except KeyError:
-            for sln in self.subsolutions:
-                guid = sln._find_target_guid_recursively(id)
-                if guid:
-                    return guid
-            return None
-
     def _get_target_guid(self, id):
-        try:
-            return self.projects[id].guid
-        except KeyError:
-            top = self
-            while top.parent_solution:
-                top = top.parent_solution
-            guid = top._find_target_guid_recursively(id)
-            assert guid, "can't find GUID of project '%s'" % id
-            return guid
+        prj = self.projects_index.get(id)
+        assert prj, "can't find GUID of project '%s'" % id
+        return prj.guid
 
     def write_header(self, file):
         file.write("Microsoft Visual Studio Solution File, Format Version %s\n" % self.format_version)
@@ -586,7 +610,7 @@ class VSSolutionBase(object):
 
         # Projects:
         all_own_projects = list(self.all_projects())
-        additional_deps = self.additional_deps()
+        additional_deps = self.additional_deps(all_own_projects)
         included_projects = all_own_projects + additional_deps
 
         if not included_projects:
@@ -731,6 +755,9 @@ class VSToolsetBase(Toolset):
 
     #: XML formatting class
     XmlFormatter = XmlFormatter
+    #: VSProjectsIndex of the project being generated, created by
+    #: generate() or by the first solution created outside of it
+    projects_index = None
 
     program_extension = "exe"
     library_extension = "lib"
@@ -778,10 +805,13 @@ class VSToolsetBase(Toolset):
 
 
     def generate(self, project):
-        # generate vcxproj files and prepare solutions
+        # prepare solutions and generate vcxproj files
+        self.projects_index = VSProjectsIndex()
+        to_generate = []
         for m in project.modules:
             with error_context(m):
-                self.gen_for_module(m)
+                to_generate += self.gen_for_module(m)
+        self.gen_for_targets(to_generate)
         # Commit solutions; this must be done after processing all modules
         # because of inter-module dependencies and references.
         for m in project.modules:
@@ -796,12 +826,20 @@ class VSToolsetBase(Toolset):
         return self.Solution(self, module, module["%s.solutionfile" % self.name])
 
     def gen_for_module(self, module):
+        """
+        Creates the solution for the module and adds all its projects to it.
+
+        Returns list of (target, project) pairs for the natively supported
+        targets, whose project files still need to be generated by
+        gen_for_targets().
+        """
         # Note that we need to create the solution object even if we're not
         # generating the solution file, to make projects included in this
         # solution part of the global projects tree.
         module.generate_solution = module["%s.generate-solution" % self.name]
         module.solution = self.create_solution(module)
 
+        to_generate = []
         for t in module.targets.itervalues():
             with error_context(t):
                 prj = self.get_project_object(t)
@@ -823,15 +861,34 @@ class VSToolsetBase(Toolset):
                                 prj.projectfile, prj.version, self.version)
 
                 if self.is_natively_supported(t):
-                    self.gen_for_target(t, prj)
+                    to_generate.append((t, prj))
 
                 module.solution.add_project(prj)
 
+        return to_generate
+
+
+    def gen_for_targets(self, to_generate):
+        """
+        Generates project files for the given (target, project) pairs.
+
+        This only reads the model and the projects already added to the
+        solutions, so it is done by worker processes if enabled, see
+        :mod:`bkl.parallel`. Output files are still written in the order of
+        *to_generate*.
+        """
+        bkl.parallel.map_in_workers(self._gen_for_target_in_context, to_generate)
+
+    def _gen_for_target_in_context(self, target_and_project):
+        target, project = target_and_project
+        with error_context(target):
+            self.gen_for_target(target, project)
+
 
     def is_natively_supported(self, target):
         return is_program(target) or is_library(target) or is_dll(target)
 
-    @memoized
+    @memoized(scope=CACHE_SCOPE_TOOLSET)
     def get_project_paths_info(self, target, project):
         filename = project.projectfile.as_native_path_for_output(target)
         return bkl.expr.PathAnchorsInfo(
@@ -840,7 +897,7 @@ class VSToolsetBase(Toolset):
                             builddir=self.get_builddir_for(target).as_native_path_for_output(target),
                             model=target)
 
-    @memoized
+    @memoized(scope=CACHE_SCOPE_TOOLSET)
     def get_project_object(self, target):
         if self.is_natively_supported(target):
             proj = self.Project(target.name,
@@ -863,7 +920,7 @@ class VSToolsetBase(Toolset):
         # See which configurations this target is explicitly disabled in.
         # Notice that we must check _all_ configurations visible in the solution,
         # not just the ones used by this target.
-        all_global_configs = (ConfigurationProxy(target, x)
+        all_global_configs = (target.get_configuration_proxy(x)
                               for x in target.project.configurations.itervalues())
         proj.disabled_configurations = [x.config for x in all_global_configs
                                         if not x.should_build()]
@@ -956,7 +1013,7 @@ class VSToolsetBase(Toolset):
         dir_usage = self._project_dirs_usage(target.project)
         return dir_usage[builddir] > 1
 
-    @memoized
+    @memoized(scope=CACHE_SCOPE_TOOLSET)
     def _project_dirs_usage(self, project):
         """
         Returns a map with keys being names of directories where project files
@@ -996,17 +1053,16 @@ class VSToolsetBase(Toolset):
         """
         configs = target.configurations
         archs = self.get_archs(target)
-        for cfg in target.configurations:
-            for cfg, arch in self._order_configs_and_archs(configs, archs):
-                p = self.ARCHS_MAPPING[arch]
-                cfg.vs_platform = p
-                cfg.vs_name = "%s|%s" % (cfg.name, p)
-                cfg._visitor.mapping["arch"] = arch
-                yield cfg
+        for cfg, arch in self._order_configs_and_archs(configs, archs):
+            cfg = target.get_configuration_proxy(cfg.config, arch)
+            p = self.ARCHS_MAPPING[arch]
+            cfg.vs_platform = p
+            cfg.vs_name = "%s|%s" % (cfg.name, p)
+            yield cfg
 
 # Internal helper functions:
 
-@memoized
+@memoized(scope=CACHE_SCOPE_TOOLSET)
 def _get_matching_project_config(cfg, prj):
     """
     Returns best match project configuration for given solution configuration.
@@ -1078,7 +1134,7 @@ def _get_matching_project_config(cfg, prj):
             return ret
 
 
-@memoized
+@memoized(scope=CACHE_SCOPE_TOOLSET)
 def _get_matching_project_platform(platform, prj):
     """
     Returns best matching platform in the project or None if none found.
@@ -28,7 +28,7 @@ Keep track of properties for extensions or model parts.
 Also define standard, always available, properties.
 """
 
-import expr, api, utils
+import expr, api, utils, plugins
 from vartypes import IdType, EnumType, ListType, PathType, StringType, BoolType, TheAnyType
 from api import Property
 
@@ -264,6 +264,7 @@ class PropertiesDict(utils.OrderedDict):
     def __init__(self, scope):
         super(PropertiesDict, self).__init__()
         self.scope = scope
+        self._buckets = {}
 
     def add(self, prop, as_inherited=False):
         if prop.name in self:
@@ -282,6 +283,23 @@ class PropertiesDict(utils.OrderedDict):
         else:
             prop._add_scope(self.scope)
         self[prop.name] = prop
+        self._buckets.clear()
+
+    def for_toolset(self, toolset):
+        """
+        Returns list of properties relevant to *toolset*, i.e. those that are
+        not specific to some other toolsets. If *toolset* is :const:`None`,
+        returns all properties.
+        """
+        if toolset is None:
+            return self.values()
+        try:
+            return self._buckets[toolset]
+        except KeyError:
+            bucket = [p for p in self.itervalues()
+                      if not p.toolsets or toolset in p.toolsets]
+            self._buckets[toolset] = bucket
+            return bucket
 
 def _fill_prop_dict(props, scope):
     d = PropertiesDict(scope)
@@ -298,29 +316,61 @@ def _propagate_inheritables(props, into):
         if p.inheritable:
             into.add(p, as_inherited=True)
 
-def _collect_properties_from_others(variable_name):
+def _add_properties_from(ext, toolset, variable_name, into):
     """
-    Yields properties from "external" source -- i.e. not defined on the model
-    part type (e.g. target type) itself, but in toolset.
+    Adds properties from "external" source -- i.e. not defined on the model
+    part type (e.g. target type) itself, but in toolset *ext* (or custom
+    step, in which case *toolset* is :const:`None`) -- to *into*.
     """
-    for toolset in api.Toolset.all():
-        for p in toolset.all_properties(variable_name):
-            p._add_toolset(toolset.name)
-            yield p
-    for step in api.CustomStep.all():
-        for p in step.all_properties(variable_name):
-            yield p
+    for p in ext.all_properties(variable_name):
+        if toolset is not None:
+            p._add_toolset(toolset)
+        into.add(p)
+
+
+# Predicates selecting records of bkl.plugins.load_properties() that may
+# contribute properties to the given scope, directly or by inheritance:
+
+def _feeds_project(r):
+    return r[0] == api.Property.SCOPE_PROJECT
+
+def _feeds_module(r):
+    return (r[0] == api.Property.SCOPE_MODULE or
+            (r[4] and r[0] not in (api.Property.SCOPE_PROJECT, api.Property.SCOPE_SETTING)))
+
+def _feeds_target(target_type):
+    scope = target_type.name
+    return lambda r: (r[0] == api.Property.SCOPE_TARGET or r[0] == scope or
+                      (r[4] and r[0] == api.Property.SCOPE_FILE))
+
+def _feeds_file(r):
+    return r[0] == api.Property.SCOPE_FILE
+
+def _feeds_setting(r):
+    return r[0] == api.Property.SCOPE_SETTING
 
 
 class PropertiesRegistry(object):
     """
     Registry of existing properties.
+
+    Only properties of already loaded plugins are included, but looking up a
+    property loads the plugin providing it (see :mod:`bkl.plugins`) and so
+    does enumerating them.
     """
     def __init__(self):
+        #: Incremented every time the set of known properties changes, so
+        #: that cached lookup results can be discarded.
+        self.generation = 0
+        # (scope, toolset) combinations for which all plugins were loaded:
+        self._enumerated = set()
         self._init_vars()
 
     def _init_vars(self):
         self._initialized = False
+        # toolsets and custom steps whose properties were already added, as
+        # (extension, toolset name or None) pairs:
+        self._merged = []
         self.all_targets = None
         self.all_files = None
         self.modules = None
@@ -328,23 +378,51 @@ class PropertiesRegistry(object):
         self.settings = None
         self.target_types = {}
 
+    def _lookup(self, props_attr, name, predicate):
+        if not self._initialized:
+            self._init_props()
+        prop = getattr(self, props_attr).get(name, None)
+        if prop is None and plugins.load_properties(predicate, name):
+            prop = getattr(self, props_attr).get(name, None)
+        return prop
+
+    def _load_all_for(self, key, predicate, toolset):
+        """
+        Loads all plugins with properties matching *predicate* that are used
+        by *toolset* (or any toolset, if :const:`None`) and initializes the
+        registry.
+        """
+        key = (key, toolset)
+        if key not in self._enumerated:
+            if toolset is None:
+                plugins.load_properties(predicate)
+            else:
+                plugins.load_properties(lambda r: (r[3] is None or r[3] == toolset) and predicate(r))
+            self._enumerated.add(key)
+        if not self._initialized:
+            self._init_props()
+
+    def _target_type_props(self, target_type):
+        try:
+            return self.target_types[target_type]
+        except KeyError:
+            # the target type's plugin was imported directly, not loaded:
+            self.update()
+            return self.target_types[target_type]
+
     def get_project_prop(self, name):
         """
         Returns property *name* on module level if such property exists, or
         :const:`None` otherwise.
         """
-        if not self._initialized:
-            self._init_props()
-        return self.project.get(name, None)
+        return self._lookup("project", name, _feeds_project)
 
     def get_module_prop(self, name):
         """
         Returns property *name* on module level if such property exists, or
         :const:`None` otherwise.
         """
-        if not self._initialized:
-            self._init_props()
-        return self.modules.get(name, None)
+        return self._lookup("modules", name, _feeds_module)
 
     def get_target_prop(self, target_type, name):
         """
@@ -353,105 +431,134 @@ class PropertiesRegistry(object):
         """
         if not self._initialized:
             self._init_props()
-        if name in self.all_targets:
-            return self.all_targets[name]
-        else:
-            return self.target_types[target_type].get(name, None)
+        prop = self.all_targets.get(name, None)
+        if prop is None:
+            prop = self._target_type_props(target_type).get(name, None)
+            if prop is None and plugins.load_properties(_feeds_target(target_type), name):
+                return self.get_target_prop(target_type, name)
+        return prop
 
     def get_file_prop(self, name):
         """
         Returns property *name* on source file level if such property exists, or
         :const:`None` otherwise.
         """
-        if not self._initialized:
-            self._init_props()
-        return self.all_files.get(name, None)
+        return self._lookup("all_files", name, _feeds_file)
 
     def get_setting_prop(self, name):
         """
         Returns property *name* of a Setting object if such property exists, or
         :const:`None` otherwise.
         """
-        if not self._initialized:
-            self._init_props()
-        return self.settings.get(name, None)
+        return self._lookup("settings", name, _feeds_setting)
 
-    def enum_project_props(self):
-        if not self._initialized:
-            self._init_props()
-        for p in self.project.itervalues():
+    # The enum_xxx_props() methods take optional *toolset* argument: if
+    # given, only properties relevant for this toolset are enumerated and
+    # plugins providing properties only for other toolsets aren't loaded.
+
+    def enum_project_props(self, toolset=None):
+        self._load_all_for(api.Property.SCOPE_PROJECT, _feeds_project, toolset)
+        for p in self.project.for_toolset(toolset):
             yield p
 
-    def enum_module_props(self):
-        if not self._initialized:
-            self._init_props()
-        for p in self.modules.itervalues():
+    def enum_module_props(self, toolset=None):
+        self._load_all_for(api.Property.SCOPE_MODULE, _feeds_module, toolset)
+        for p in self.modules.for_toolset(toolset):
             yield p
 
-    def enum_target_props(self, target_type):
-        if not self._initialized:
-            self._init_props()
-        for p in self.target_types[target_type].itervalues():
+    def enum_target_props(self, target_type, toolset=None):
+        self._load_all_for(target_type.name, _feeds_target(target_type), toolset)
+        for p in self._target_type_props(target_type).for_toolset(toolset):
             yield p
-        for p in self.all_targets.itervalues():
+        for p in self.all_targets.for_toolset(toolset):
             yield p
 
-    def enum_file_props(self):
-        if not self._initialized:
-            self._init_props()
-        for p in self.all_files.itervalues():
+    def enum_file_props(self, toolset=None):
+        self._load_all_for(api.Property.SCOPE_FILE, _feeds_file, toolset)
+        for p in self.all_files.for_toolset(toolset):
             yield p
 
-    def enum_setting_props(self):
-        if not self._initialized:
-            self._init_props()
-        for p in self.settings.itervalues():
+    def enum_setting_props(self, toolset=None):
+        self._load_all_for(api.Property.SCOPE_SETTING, _feeds_setting, toolset)
+        for p in self.settings.for_toolset(toolset):
             yield p
 
     def _init_props(self):
         assert not self._initialized
-
-        # Project:
         self.project = _fill_prop_dict(std_project_props(), api.Property.SCOPE_PROJECT)
-        for p in _collect_properties_from_others("properties_project"):
-            self.project.add(p)
-
-        # Modules:
         self.modules = _fill_prop_dict(std_module_props(), api.Property.SCOPE_MODULE)
-        for p in _collect_properties_from_others("properties_module"):
-            self.modules.add(p)
+        self.all_targets = _fill_prop_dict(std_target_props(), api.Property.SCOPE_TARGET)
+        self.all_files = _fill_prop_dict(std_file_props(), api.Property.SCOPE_FILE)
+        self.settings = _fill_prop_dict(std_setting_props(), api.Property.SCOPE_SETTING)
+        self._merge_extensions()
+        self._initialized = True
+
+    def _merge_extensions(self):
+        """
+        Adds properties of extensions that were loaded since the last call to
+        the existing dictionaries. Returns true if there were any.
+        """
+        merged = set(ext for ext, _ in self._merged)
+        new = [(t, t.name) for t in api.Toolset.all_loaded() if t not in merged] + \
+              [(s, None) for s in api.CustomStep.all_loaded() if s not in merged]
+        new_target_types = [t for t in api.TargetType.all_loaded() if t not in self.target_types]
+        if not new and not new_target_types:
+            return False
+
+        # Note that the properties of the new extensions are appended after
+        # the already merged ones, so the order of properties follows the
+        # order in which the extensions were loaded and may differ from the
+        # order after force_rescan().
+
+        for ext, toolset in new:
+            _add_properties_from(ext, toolset, "properties_project", self.project)
+        for ext, toolset in new:
+            _add_properties_from(ext, toolset, "properties_module", self.modules)
 
         # All targets:
-        self.all_targets = _fill_prop_dict(std_target_props(), api.Property.SCOPE_TARGET)
-        for p in _collect_properties_from_others("properties_target"):
-            self.all_targets.add(p)
+        for ext, toolset in new:
+            _add_properties_from(ext, toolset, "properties_target", self.all_targets)
         _propagate_inheritables(self.all_targets, self.modules)
 
         # Specific target types:
-        for target_type in api.TargetType.all():
-            props = _fill_prop_dict(target_type.all_properties(), target_type.name)
-            for p in _collect_properties_from_others("properties_%s" % target_type):
-                props.add(p)
-            self.target_types[target_type] = props
+        for target_type in api.TargetType.all_loaded():
+            if target_type in self.target_types:
+                props = self.target_types[target_type]
+                sources = new
+            else:
+                props = _fill_prop_dict(target_type.all_properties(), target_type.name)
+                self.target_types[target_type] = props
+                sources = self._merged + new
+            for ext, toolset in sources:
+                _add_properties_from(ext, toolset, "properties_%s" % target_type, props)
             _propagate_inheritables(props, self.modules)
 
         # File types:
-        self.all_files = _fill_prop_dict(std_file_props(), api.Property.SCOPE_FILE)
-        for p in _collect_properties_from_others("properties_file"):
-            self.all_files.add(p)
+        for ext, toolset in new:
+            _add_properties_from(ext, toolset, "properties_file", self.all_files)
         _propagate_inheritables(self.all_files, self.all_targets)
         _propagate_inheritables(self.all_files, self.modules)
 
         # Settings:
-        self.settings = _fill_prop_dict(std_setting_props(), api.Property.SCOPE_SETTING)
-        for p in _collect_properties_from_others("properties_setting"):
-            self.settings.add(p)
+        for ext, toolset in new:
+            _add_properties_from(ext, toolset, "properties_setting", self.settings)
 
-        self._initialized = True
+        self._merged += new
+        return True
+
+    def update(self):
+        """
+        Makes properties of newly loaded extensions (e.g. from a plugin)
+        known. Unlike :meth:`force_rescan()`, this only adds the new
+        properties to the existing ones.
+        """
+        if self._initialized and self._merge_extensions():
+            self.generation += 1
 
     def force_rescan(self):
         """Force re-scanning of properties"""
         self._init_vars()
+        self.generation += 1
 
 
 registry = PropertiesRegistry()
@@ -26,78 +26,18 @@
 Misc. helpers for other Bakefile code.
 """
 
-import copy
 import functools
 import collections
 
 
-class OrderedDict(dict):
+class OrderedDict(collections.OrderedDict):
     """
     This is specialization of dictionary that preserves order of insertion
     when enumerating keys or items.
-    """
-    # TODO-PY26: replace this class with collections.OrderedDict() from Python 2.7/3.1
-
-    # These must be overriden in derived class:
-    def __init__(self, data=None):
-        dict.__init__(self)
-        self.order = []
-        if data:
-            self.update(data)
-
-    def __setitem__(self, key, value):
-        if not self.has_key(key):
-            self.order.append(key)
-        dict.__setitem__(self, key, value)
-    def __delitem__(self, key):
-        self.order.remove(key)
-        dict.__delitem__(self, key)
-
-    def __iter__(self):
-        return iter(self.order)
 
-    def __deepcopy__(self, memo):
-        c = OrderedDict()
-        for k,v in self.iteritems():
-            c[k] = copy.deepcopy(v, memo)
-        return c
-
-    def __copy__(self):
-        c = OrderedDict()
-        c.update(self.iteritems())
-        c.order = self.order[:]
-        return c
-
-    copy = __copy__
-
-    # The rest is implemented using above methods:
-    def update(self, other):
-        if isinstance(other, dict):
-            for k, v in other.iteritems():
-                self[k] = v
-        else:
-            for k, v in other:
-                self[k] = v
-
-    def iterkeys(self):
-        return self.__iter__()
-    def iteritems(self):
-        for k in self.iterkeys():
-           yield (k, self[k])
-    def itervalues(self):
-        for k in self.iterkeys():
-           yield self[k]
-
-    def keys(self):
-        return list(self.iterkeys())
-    def items(self):
-        return list(self.iteritems())
-    def values(self):
-        return list(self.itervalues())
-
-    def __reduce__(self):
-        "Return state information for pickling"
-        return self.__class__, (self.items(),), {"order": self.order}
+    Removal of keys is done in constant time, so it is fine to delete items
+    from large dictionaries (e.g. disabled targets from a module).
+    """
 
 
 class OrderedSet(collections.MutableSet):
@@ -144,29 +84,119 @@ def filter_duplicates(it):
             yield x
 
 
-class memoized(object):
+#: Scope of memoized results valid for the entire run of Bakefile, i.e. until
+#: processing of the input file is finished.
+CACHE_SCOPE_RUN = "run"
+#: Scope of memoized results valid only while generating for single toolset.
+CACHE_SCOPE_TOOLSET = "toolset"
+#: Scope of memoized results that don't depend on the project being
+#: processed, e.g. parsed input files, and so are kept when processing
+#: several projects in one process (see :mod:`bkl.batch`). Call
+#: :func:`reset_caches` if the input files may have changed since.
+CACHE_SCOPE_SESSION = "session"
+
+# all Memoized instances, to allow resetting them:
+_all_caches = []
+
+
+class Memoized(object):
     """
-    Decorator that caches a function's return value each time it is called.  If
-    called later with the same arguments, the cached value is returned, and not
-    re-evaluated.
+    Function or method wrapper caching its return values; don't use directly,
+    but with the :func:`memoized` decorator.
 
-    See http://wiki.python.org/moin/PythonDecoratorLibrary#Memoize
+    Unlike plain memoization, the cached values are only kept for the
+    duration of the given *scope* (see :func:`reset_caches`), can be limited
+    to at most *maxsize* least recently used values and if *weak_keys* is
+    set, the first argument (i.e. ``self`` for methods) is only referenced
+    weakly, so that caching doesn't keep the objects alive. *maxsize* then
+    applies to values cached for every such object separately.
+
+    .. attribute:: hits
+    .. attribute:: misses
+
+       Number of cache hits and misses since the last :func:`reset_cache_stats`
+       call.
+
+    .. attribute:: peak_size
+
+       Maximal number of values cached at the same time.
     """
-    def __init__(self, func):
+    def __init__(self, func, scope=CACHE_SCOPE_RUN, maxsize=None, weak_keys=False):
         self.func = func
-        self.cache = {}
+        self.name = "%s.%s" % (func.__module__, func.__name__)
+        self.scope = scope
+        self.maxsize = maxsize
+        self.weak_keys = weak_keys
+        self.hits = self.misses = self.peak_size = 0
+        self.clear()
+        _all_caches.append(self)
+
+    def clear(self):
+        """Removes all cached values."""
+        if self.maxsize is not None and not self.weak_keys:
+            self.cache = collections.OrderedDict()
+        else:
+            self.cache = {}
+        self.size = 0
+
+    def _subcache_for(self, obj):
+        # With weak keys, self.cache maps id(obj) to a (weak reference to obj,
+        # cache for the rest of arguments) pair; the entry is removed when obj
+        # is destroyed.
+        key = id(obj)
+        try:
+            return self.cache[key][1]
+        except KeyError:
+            pass
+        import weakref
+        subcache = {} if self.maxsize is None else collections.OrderedDict()
+        cache = self.cache
+        def on_destroyed(ref):
+            entry = cache.get(key)
+            if entry is not None and entry[0] is ref:
+                del cache[key]
+                if cache is self.cache:
+                    self.size -= len(entry[1])
+        try:
+            ref = weakref.ref(obj, on_destroyed)
+        except TypeError:
+            raise TypeError("%s: first argument of type %s can't be weakly referenced" %
+                            (self.name, type(obj).__name__))
+        cache[key] = (ref, subcache)
+        return subcache
 
     def __call__(self, *args):
+        if self.weak_keys:
+            # Unlike unhashable arguments below, a first argument that can't
+            # be weakly referenced is a bug in the caller, so let it throw.
+            cache = self._subcache_for(args[0])
+            key = args[1:]
+        else:
+            cache = self.cache
+            key = args
         try:
-            return self.cache[args]
+            value = cache[key]
         except KeyError:
+            self.misses += 1
             value = self.func(*args)
-            self.cache[args] = value
+            cache[key] = value
+            self.size += 1
+            if self.maxsize is not None and len(cache) > self.maxsize:
+                cache.popitem(last=False)
+                self.size -= 1
+            if self.size > self.peak_size:
+                self.peak_size = self.size
             return value
         except TypeError:
             # uncachable -- for instance, passing a list as an argument.
             # Better to not cache than to blow up entirely.
             return self.func(*args)
+        self.hits += 1
+        if self.maxsize is not None:
+            # mark as most recently used:
+            del cache[key]
+            cache[key] = value
+        return value
 
     def __repr__(self):
         """Return the function's docstring."""
@@ -177,6 +207,86 @@ class memoized(object):
         return functools.partial(self.__call__, obj)
 
 
+def memoized(func=None, scope=CACHE_SCOPE_RUN, maxsize=None, weak_keys=False):
+    """
+    Decorator that caches a function's return value each time it is called.  If
+    called later with the same arguments, the cached value is returned, and not
+    re-evaluated.
+
+    Can be used either as ``@memoized`` or with arguments, e.g.
+    ``@memoized(scope=CACHE_SCOPE_TOOLSET, maxsize=1000)``; see
+    :class:`Memoized` for their meaning.
+
+    See http://wiki.python.org/moin/PythonDecoratorLibrary#Memoize
+    """
+    if func is None:
+        return lambda f: Memoized(f, scope, maxsize, weak_keys)
+    return Memoized(func, scope, maxsize, weak_keys)
+
+
+class CacheStats(object):
+    """
+    Statistics of a cache not implemented with :func:`memoized`, typically
+    one kept by every instance of some class. They are included in
+    :func:`cache_stats` output under the given *name*.
+
+    Unlike with :class:`Memoized`, ``size`` is the size of the most recently
+    updated cache instance.
+    """
+    def __init__(self, name, scope=CACHE_SCOPE_RUN):
+        self.name = name
+        self.scope = scope
+        self.hits = 0
+        self.misses = 0
+        self.size = 0
+        self.peak_size = 0
+        _all_caches.append(self)
+
+    def clear(self):
+        # The values are owned by the instances, there's nothing to discard.
+        pass
+
+    def update_size(self, size):
+        """Records the current size of the cache that was just updated."""
+        self.size = size
+        if size > self.peak_size:
+            self.peak_size = size
+
+
+def reset_caches(scope=None):
+    """
+    Discards values cached by all :func:`memoized` functions with given
+    *scope* or all of them if *scope* is :const:`None`. Statistics are kept.
+    """
+    for c in _all_caches:
+        if scope is None or c.scope == scope:
+            c.clear()
+
+
+def reset_cache_stats():
+    """
+    Resets hits, misses and peak size counters of all :func:`memoized`
+    functions.
+    """
+    for c in _all_caches:
+        c.hits = c.misses = 0
+        c.peak_size = c.size
+
+
+def cache_stats():
+    """
+    Returns statistics of all :func:`memoized` functions and
+    :class:`CacheStats` instances as list of dictionaries with ``name``,
+    ``scope``, ``hits``, ``misses``, ``hit_rate`` (between 0 and 1),
+    ``size`` (current number of cached values) and ``peak_size`` keys.
+    """
+    return [{"name": c.name, "scope": c.scope,
+             "hits": c.hits, "misses": c.misses,
+             "hit_rate": float(c.hits) / (c.hits + c.misses) if c.hits else 0.0,
+             "size": c.size, "peak_size": c.peak_size}
+            for c in _all_caches]
+
+
 class memoized_property(object):
     """
     Decorator for lazily evaluated properties.
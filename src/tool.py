@@ -80,7 +80,8 @@ class BklOptionParser(OptionParser):
         import bkl.version
         return "bakefile %s" % bkl.version.get_version()
 
-parser = BklOptionParser(version="bakefile")
+parser = BklOptionParser(version="bakefile",
+                         usage="%prog [options] FILE.bkl... | @LISTFILE...")
 parser.add_option(
         "-v", "--verbose",
         action="store_true", dest="verbose", default=False,
@@ -102,6 +103,29 @@ parser.add_option(
         action="append", dest="toolsets",
         metavar="TOOLSET",
         help="only generate files for the given toolset (may be specified more than once)")
+parser.add_option(
+        "-j", "--jobs",
+        action="store", type="int", dest="jobs", default=1,
+        metavar="N",
+        help="use up to N worker processes for independent parts of the work, e.g. projects given as separate arguments")
+parser.add_option(
+        "", "--export-build-graph",
+        action="store", dest="export_build_graph", default=None,
+        metavar="FILE",
+        help="save build graph of makefile toolsets into FILE (as JSON if it has .json extension, in binary form otherwise)")
+parser.add_option(
+        "", "--analyze-graph",
+        action="store_true", dest="analyze_graph", default=False,
+        help="print analysis of the shape of makefile toolsets' build graphs instead of generating output")
+parser.add_option(
+        "", "--timing-file",
+        action="store", dest="timing_file", default=None,
+        metavar="FILE",
+        help="use build times from FILE as costs of build graph nodes with --analyze-graph")
+parser.add_option(
+        "", "--timing-report",
+        action="store_true", dest="timing_report", default=False,
+        help="print summary of build timing logs given as arguments instead of processing a .bkl file")
 
 debug_group = OptionGroup(parser, "Debug Options")
 debug_group.add_option(
@@ -121,8 +145,12 @@ parser.add_option_group(debug_group)
 
 options, args = parser.parse_args(sys.argv[1:])
 
-if len(args) != 1:
-    sys.stderr.write("incorrect number of arguments, exactly 1 .bkl required\n")
+if options.timing_report:
+    if not args:
+        sys.stderr.write("--timing-report requires at least one timing log\n")
+        sys.exit(3)
+elif not args:
+    sys.stderr.write("incorrect number of arguments, at least 1 .bkl required\n")
     sys.exit(3)
 
 if options.debug:
@@ -133,6 +161,14 @@ else:
     log_level = logging.WARNING
 logger.setLevel(log_level)
 
+if options.jobs < 1:
+    sys.stderr.write("--jobs requires a positive number\n")
+    sys.exit(3)
+
+if options.timing_file and not options.analyze_graph:
+    sys.stderr.write("--timing-file can only be used with --analyze-graph\n")
+    sys.exit(3)
+
 if options.diff_only and options.force:
     sys.stderr.write("--diff-only and --force option can't be used together\n")
     sys.exit(3)
@@ -143,23 +179,70 @@ import bkl.error
 from bkl.interpreter import Interpreter
 import bkl.dumper
 import bkl.io
+import bkl.parallel
+import bkl.buildgraph
+import bkl.batch
 
 try:
     start_time = time()
     bkl.io.dry_run = options.dry_run
     bkl.io.diff_only = options.diff_only
     bkl.io.force_output = options.force
-    if options.dump:
-        intr = bkl.dumper.DumpingInterpreter()
-    elif options.dump_toolset:
-        intr = bkl.dumper.DumpingInterpreter(options.dump_toolset)
-    else:
-        intr = Interpreter()
-    if options.toolsets:
-        intr.limit_toolsets(options.toolsets)
-    intr.process_file(args[0])
+    bkl.parallel.jobs = options.jobs
+    if options.timing_report:
+        records = []
+        for log in args:
+            records += bkl.buildgraph.read_timing_records(log)
+        print bkl.buildgraph.TimingReport(records).format_report()
+        sys.exit(0)
+    inputs = bkl.batch.expand_arguments(args)
+    if not inputs:
+        sys.stderr.write("no input files given\n")
+        sys.exit(3)
+    if options.export_build_graph and len(inputs) > 1:
+        sys.stderr.write("--export-build-graph can only be used with a single input file\n")
+        sys.exit(3)
+
+    timings = None
+    if options.timing_file:
+        timings = bkl.buildgraph.load_timings(options.timing_file)
+    build_graph = None
+    if options.export_build_graph:
+        build_graph = bkl.buildgraph.BuildGraph()
+
+    def make_interpreter():
+        if options.analyze_graph:
+            intr = bkl.buildgraph.GraphAnalyzingInterpreter(timings)
+        elif options.dump:
+            intr = bkl.dumper.DumpingInterpreter()
+        elif options.dump_toolset:
+            intr = bkl.dumper.DumpingInterpreter(options.dump_toolset)
+        else:
+            intr = Interpreter()
+        if options.toolsets:
+            intr.limit_toolsets(options.toolsets)
+        intr.build_graph = build_graph
+        return intr
+
+    # Interpreters printing to stdout must run in order in this process.
+    prints_output = options.analyze_graph or options.dump or options.dump_toolset
+    batch = bkl.batch.BatchProcessor(make_interpreter,
+                                     use_workers=not prints_output,
+                                     reraise=options.debug)
+    status = batch.process(inputs)
+    if len(inputs) > 1:
+        for filename, file_status in batch.results:
+            logger.info("%s: %s", filename, "failed" if file_status else "ok")
+        failed = batch.failed_files()
+        if failed:
+            logging.error("processing of %d of %d files failed: %s",
+                          len(failed), len(inputs), " ".join(failed))
+    if build_graph is not None and status == 0:
+        build_graph.save(options.export_build_graph)
     logger.info("created files: %d, updated files: %d (time: %.1fs)",
                 bkl.io.num_created, bkl.io.num_modified, time() - start_time)
+    if status:
+        sys.exit(status)
 
 except KeyboardInterrupt:
     if options.debug:
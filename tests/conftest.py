@@ -27,8 +27,12 @@ def pytest_configure(config):
     import sys, os.path
 
     tests_path = os.path.dirname(__file__)
-    bkl_path = os.path.normpath(os.path.join(tests_path, '..', 'src'))
-    sys.path = [bkl_path, tests_path] + sys.path
+    root_path = os.path.normpath(os.path.join(tests_path, '..'))
+    bkl_path = os.path.join(root_path, 'src')
+    sys.path = [bkl_path, tests_path, root_path] + sys.path
+
+    # don't use or modify the user's persistent caches
+    os.environ["BAKEFILE_CACHE_DIR"] = ""
 
     import logging
     log_level = logging.DEBUG if config.getvalue("debug") else logging.WARNING
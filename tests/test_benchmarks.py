@@ -0,0 +1,71 @@
+#
+#  This file is part of Bakefile (http://bakefile.org)
+#
+#  Copyright (C) 2008-2013 Vaclav Slavik
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to
+#  deal in the Software without restriction, including without limitation the
+#  rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+#  sell copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in
+#  all copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+#  FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS
+#  IN THE SOFTWARE.
+#
+
+"""
+Tests of the benchmarking tools in the benchmarks/ directory.
+"""
+
+from benchmarks.generator import PRESETS
+from benchmarks.runner import run_benchmark, compare_results
+
+
+def test_benchmark_project(tmpdir):
+    """
+    Checks that the generated synthetic project is valid and can be processed
+    for all toolsets.
+    """
+    results = run_benchmark(PRESETS["tiny"], workdir=str(tmpdir))
+    phases = [p["phase"] for p in results["phases"]]
+    assert phases[:3] == ["parse", "build", "finalize"]
+    assert "generate:gnu" in phases
+    assert "generate:vs2022" in phases
+    passes = [p["pass"] for p in results["passes"]]
+    assert "normalize_vars" in passes
+    assert "simplify_exprs" in passes
+    assert tmpdir.join("main.bkl").check()
+    assert not tmpdir.join("GNUmakefile").check()
+
+
+def test_benchmark_comparison():
+    baseline = {"params": {}, "phases": [
+                    {"phase": "parse", "time": 1.0, "peak_memory": 1000},
+                    {"phase": "build", "time": 1.0, "peak_memory": 1000},
+                ]}
+    results = {"params": {}, "phases": [
+                    {"phase": "parse", "time": 1.1, "peak_memory": 1000},
+                    {"phase": "build", "time": 2.0, "peak_memory": 1500},
+                ]}
+    assert compare_results(baseline, baseline, 0.2) == []
+    regressions = compare_results(results, baseline, 0.2)
+    assert len(regressions) == 2
+    assert regressions[0].startswith("build: time")
+    assert regressions[1] == "process peak memory 1500kB, baseline 1000kB"
+
+
+def test_expressions_benchmark():
+    from benchmarks.expressions import run_benchmark as run_expr_benchmark
+    results = run_expr_benchmark(size=10, repeat=1, number=1)
+    phases = [p["phase"] for p in results["phases"]]
+    assert "list/rewrite" in phases
+    assert "nested_if/walk" in phases
@@ -27,10 +27,13 @@ Misc tests of Bakefile's internals' correctness.
 """
 
 import os.path
+import pytest
 
 import bkl.interpreter
+import bkl.model
 import bkl.dumper
 import bkl.io
+import bkl.error
 
 from bkl.expr import BoolValueExpr, ListExpr, LiteralExpr, ConcatExpr, NullExpr
 
@@ -101,3 +104,685 @@ def test_list_expr_iterator():
     null = NullExpr()
     assert not null
     assert len(null) == 0
+
+
+def test_variables_resolution_cache():
+    i = InterpreterForTestSuite()
+    i.process_file(os.path.join(projects_dir, 'submodules', 'main.bkl'))
+    module = i.model.top_module
+    target = module.targets["main"]
+    assert target.resolve_variable("foo") is None
+    assert target["deps"].as_py() == ["common"]
+
+    # adding a variable to a parent scope must be reflected in children:
+    module.add_variable(bkl.model.Variable("foo", LiteralExpr("module")))
+    assert target.resolve_variable("foo") is module.variables["foo"]
+    target.add_variable(bkl.model.Variable("foo", LiteralExpr("target")))
+    assert target["foo"].as_py() == "target"
+    assert module["foo"].as_py() == "module"
+
+    # ...including scopes further down than direct children:
+    assert target.resolve_variable("bar") is None
+    i.model.add_variable(bkl.model.Variable("bar", LiteralExpr("project")))
+    assert target["bar"].as_py() == "project"
+
+
+def test_expr_compiler():
+    from bkl.expr import BoolExpr, IfExpr, PlaceholderExpr, ExprCompiler
+    from bkl.error import NonConstError
+    import pytest
+
+    config = PlaceholderExpr("config")
+    is_debug = BoolExpr(BoolExpr.EQUAL, config, LiteralExpr("Debug"))
+    e = ListExpr([LiteralExpr("foo"),
+                  IfExpr(is_debug, LiteralExpr("debug"), LiteralExpr("release")),
+                  ConcatExpr([LiteralExpr("x"), NullExpr(), LiteralExpr("y")])])
+
+    c = ExprCompiler()
+    f = c.compile(e)
+    assert c.compile(e) is f
+    assert f({"config": "Debug"}) == ["foo", "debug", "xy"]
+    assert f({"config": "Release"}) == ["foo", "release", "xy"]
+    with pytest.raises(NonConstError):
+        f({})
+
+    # comparisons are done in the same way as by as_py(), symbolically if
+    # the values aren't known:
+    same = BoolExpr(BoolExpr.EQUAL, PlaceholderExpr("foo"), PlaceholderExpr("foo"))
+    assert same.as_py() == True
+    assert c.evaluate(same) == True
+    differ = BoolExpr(BoolExpr.NOT_EQUAL, PlaceholderExpr("foo"), PlaceholderExpr("foo"))
+    assert c.evaluate(differ) == False
+    with pytest.raises(NonConstError):
+        c.evaluate(is_debug)
+
+
+def test_cond_analyzer():
+    from bkl.expr import BoolExpr, IfExpr, PlaceholderExpr, CondAnalyzer
+    from bkl.interpreter.simplify import simplify
+
+    def eq(var, value):
+        return BoolExpr(BoolExpr.EQUAL, PlaceholderExpr(var), LiteralExpr(value))
+    def and_(a, b):
+        return BoolExpr(BoolExpr.AND, a, b)
+    def or_(a, b):
+        return BoolExpr(BoolExpr.OR, a, b)
+    def not_(a):
+        return BoolExpr(BoolExpr.NOT, a)
+
+    debug = eq("config", "Debug")
+    release = eq("config", "Release")
+    x64 = eq("arch", "x86_64")
+
+    a = CondAnalyzer()
+    assert a.is_always_false(and_(debug, release))
+    assert a.is_always_true(or_(debug, not_(debug)))
+    assert not a.is_always_true(or_(debug, release))
+    assert a.implies(debug, not_(release))
+    assert a.implies(and_(debug, x64), or_(x64, release))
+    assert not a.implies(debug, x64)
+    assert a.are_equivalent(and_(debug, x64), and_(eq("arch", "x86_64"), eq("config", "Debug")))
+    assert a.are_equivalent(not_(or_(debug, x64)), and_(not_(x64), not_(debug)))
+    assert a.are_equivalent(and_(not_(debug), release), release)
+    assert a.are_equivalent(or_(debug, and_(not_(debug), release)), or_(release, debug))
+
+    # nested conditions made unreachable by the outer one are removed:
+    e = IfExpr(debug,
+               IfExpr(release, LiteralExpr("never"), LiteralExpr("debug")),
+               LiteralExpr("other"))
+    s = simplify(e)
+    assert isinstance(s, IfExpr)
+    assert s.cond is debug
+    assert s.value_yes.as_py() == "debug"
+    assert simplify(and_(debug, and_(x64, release))).as_py() == False
+
+
+def test_pass_manager():
+    from bkl.interpreter.passes import PassManager
+    i = InterpreterForTestSuite()
+    i.process_file(os.path.join(projects_dir, 'submodules', 'main.bkl'))
+    model = i.model
+    all_vars = list(model.all_variables())
+
+    calls = []
+    pm = PassManager(model)
+    pm.add("a", lambda var, part: calls.append(("a", var)))
+    pm.add("b", lambda var, part: calls.append(("b", var)))
+    pm.add_model_pass("m", lambda m: calls.append(("m", m)))
+    pm.add("c", lambda var, part: calls.append(("c", var)), barrier=True)
+    pm.run()
+
+    # "a" and "b" are fused into a single traversal, "c" must wait for "m":
+    assert len(calls) == 3 * len(all_vars) + 1
+    m_index = calls.index(("m", model))
+    assert m_index == 2 * len(all_vars)
+    assert set(v for n, v in calls[:m_index] if n == "a") == set(all_vars)
+    assert [v for n, v in calls[m_index+1:]] == all_vars
+    for n, v in calls[:m_index]:
+        if n == "b":
+            assert calls.index(("a", v)) < calls.index(("b", v))
+    assert pm.timings.keys() == ["a", "b", "m", "c"]
+
+
+def test_deep_expressions_visiting():
+    from bkl.expr import (Visitor, RewritingVisitor, BoolExpr, IfExpr,
+                          PlaceholderExpr, ListExpr)
+
+    def make_deep(depth, leaf):
+        e = leaf
+        for i in range(depth):
+            cond = BoolExpr(BoolExpr.EQUAL, PlaceholderExpr("config"), LiteralExpr("c%d" % i))
+            e = IfExpr(cond, ListExpr([LiteralExpr("x"), e]), NullExpr())
+        return e
+
+    # much deeper than Python's recursion limit:
+    e = make_deep(5000, LiteralExpr("leaf"))
+    assert RewritingVisitor().visit(e) is e
+
+    class LeafRewriter(RewritingVisitor):
+        def literal(self, e):
+            return LiteralExpr("new") if e.value == "leaf" else e
+    e2 = LeafRewriter().visit(e)
+    assert e2 is not e
+    assert e2.value_no is e.value_no
+    assert e2.cond is e.cond
+    while isinstance(e2, IfExpr):
+        e2 = e2.value_yes.items[1]
+    assert e2.value == "new"
+
+    class LiteralsCollector(Visitor):
+        def __init__(self):
+            self.found = []
+        def literal(self, e):
+            self.found.append(e.value)
+        bool_value = null = reference = placeholder = Visitor.noop
+        list = concat = path = bool = if_ = Visitor.visit_children
+    c = LiteralsCollector()
+    c.visit(make_deep(3, LiteralExpr("leaf")))
+    assert c.found == ["c2", "x", "c1", "x", "c0", "x", "leaf"]
+    c = LiteralsCollector()
+    c.visit(e)
+    assert len(c.found) == 10001
+
+
+def test_plugins_manifest_is_up_to_date():
+    import bkl.plugins
+    manifest = os.path.join(os.path.dirname(bkl.plugins.__file__), "_manifest.py")
+    with open(manifest) as f:
+        assert f.read() == bkl.plugins.generate_manifest(), \
+               "plugins manifest is out of date, run \"make manifest\""
+
+
+LAZY_PLUGINS_SCRIPT = """
+import sys
+import bkl.api, bkl.props
+def loaded(name):
+    return sys.modules.get("bkl.plugins." + name) is not None
+assert not loaded("gnu") and not loaded("vs201x")
+assert "vs2010" in bkl.api.Toolset.all_names()
+assert bkl.api.Toolset.get("gnu").name == "gnu"
+assert loaded("gnu") and not loaded("vs201x")
+assert bkl.props.get_module_prop("vs2010.solutionfile") is not None
+assert loaded("vs201x") and not loaded("vs200x")
+vs2008 = bkl.api.Toolset.get("vs2008")
+assert vs2008 is bkl.api.Toolset.get("vs2008")
+assert vs2008 in list(bkl.api.Toolset.all_loaded())
+assert bkl.props.registry.get_module_prop("vs2008.solutionfile") is not None
+assert list(bkl.props.registry.enum_module_props("vs2008"))
+"""
+
+def test_lazy_plugins_loading():
+    import subprocess, sys
+    import bkl
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.path.dirname(os.path.dirname(bkl.__file__))
+    subprocess.check_call([sys.executable, "-c", LAZY_PLUGINS_SCRIPT], env=env)
+
+
+def test_properties_buckets():
+    from bkl.api import Property
+    from bkl.props import PropertiesDict
+    from bkl.vartypes import StringType
+    d = PropertiesDict(Property.SCOPE_MODULE)
+    for name, toolset in [("a", None), ("b", "gnu"), ("c", "vs2010"), ("d", None)]:
+        p = Property(name, StringType())
+        if toolset:
+            p._add_toolset(toolset)
+        d.add(p)
+    assert [p.name for p in d.for_toolset("gnu")] == ["a", "b", "d"]
+    assert [p.name for p in d.for_toolset("vs2010")] == ["a", "c", "d"]
+    assert [p.name for p in d.for_toolset(None)] == ["a", "b", "c", "d"]
+    d.add(Property("e", StringType()))
+    assert [p.name for p in d.for_toolset("gnu")] == ["a", "b", "d", "e"]
+
+
+INCREMENTAL_PROPS_SCRIPT = """
+import bkl.props, bkl.plugins
+from bkl.props import registry
+assert registry.get_module_prop("my_plugin_prop") is None
+modules, generation = registry.modules, registry.generation
+bkl.plugins.load_from_file(%r)
+registry.update()
+assert registry.modules is modules
+assert registry.generation == generation + 1
+assert registry.get_module_prop("my_plugin_prop") is not None
+"""
+
+INCREMENTAL_PROPS_PLUGIN = """
+from bkl.api import CustomStep, Property
+from bkl.vartypes import StringType
+class MyStep(CustomStep):
+    name = "my_step"
+    properties_module = [Property("my_plugin_prop", StringType())]
+"""
+
+def test_incremental_properties_update(tmpdir):
+    import subprocess, sys
+    import bkl
+    plugin = tmpdir.join("my_plugin.py")
+    plugin.write(INCREMENTAL_PROPS_PLUGIN)
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.path.dirname(os.path.dirname(bkl.__file__))
+    subprocess.check_call([sys.executable, "-c", INCREMENTAL_PROPS_SCRIPT % str(plugin)], env=env)
+
+
+def test_memoized_scopes_and_bounds():
+    from bkl.utils import memoized, reset_caches, CACHE_SCOPE_TOOLSET
+    calls = []
+
+    @memoized(scope=CACHE_SCOPE_TOOLSET, maxsize=2)
+    def square(x):
+        calls.append(x)
+        return x * x
+
+    assert [square(i) for i in (1, 2, 1, 3, 1, 2)] == [1, 4, 1, 9, 1, 4]
+    # 2 was evicted as the least recently used value when 3 was added:
+    assert calls == [1, 2, 3, 2]
+    assert (square.hits, square.misses, square.size) == (2, 4, 2)
+
+    reset_caches("no such scope")
+    square(1)
+    assert calls == [1, 2, 3, 2]
+    reset_caches(CACHE_SCOPE_TOOLSET)
+    assert square.size == 0
+    square(1)
+    assert calls == [1, 2, 3, 2, 1]
+
+
+def test_memoized_weak_keys():
+    import gc, weakref
+    from bkl.utils import memoized
+
+    class Obj(object):
+        @memoized(weak_keys=True)
+        def get(self, x):
+            return [x]
+
+    o = Obj()
+    assert o.get(1) is o.get(1)
+    assert Obj.__dict__["get"].size == 1
+    ref = weakref.ref(o)
+    del o
+    gc.collect()
+    assert ref() is None
+    assert Obj.__dict__["get"].size == 0
+
+    @memoized(weak_keys=True)
+    def first(items):
+        return items[0]
+    with pytest.raises(TypeError):
+        first([1, 2])
+
+
+def test_map_in_workers(tmpdir, monkeypatch):
+    import bkl.parallel
+    if not hasattr(os, "fork"):
+        pytest.skip("worker processes require fork()")
+    monkeypatch.setattr(bkl.parallel, "jobs", 3)
+    pids = set()
+
+    def work(i):
+        if i == 4:
+            raise bkl.error.Error("failed on %d" % i)
+        f = bkl.io.OutputFile(str(tmpdir.join("out%d" % i)), bkl.io.EOL_WINDOWS)
+        f.write("item %d\n" % i)
+        f.commit()
+        pids.add(os.getpid())
+        return i * i
+
+    created = bkl.io.num_created
+    assert bkl.parallel.map_in_workers(work, range(4)) == [0, 1, 4, 9]
+    # the work was done by the workers, but the files written by this process:
+    assert not pids
+    assert bkl.io.num_created == created + 4
+    assert tmpdir.join("out3").read("rb") == "item 3\r\n"
+
+    with pytest.raises(bkl.error.Error) as e:
+        bkl.parallel.map_in_workers(work, range(5, 3, -1))
+    assert "failed on 4" in str(e.value)
+
+
+def test_map_in_workers_redo(tmpdir, monkeypatch, caplog):
+    import bkl.parallel
+    from bkl.parser.ast import Position
+    if not hasattr(os, "fork"):
+        pytest.skip("worker processes require fork()")
+    monkeypatch.setattr(bkl.parallel, "jobs", 3)
+    monkeypatch.setattr(bkl.io, "_all_written_files", {})
+
+    # messages are logged in the order of items and only once, even if the
+    # item is redone by the main process:
+    def warn(i):
+        bkl.error.warning("warning %d", i)
+        if i == 1 and bkl.parallel._in_worker:
+            raise bkl.error.Error("failed in worker")
+        return i
+    assert bkl.parallel.map_in_workers(warn, range(3)) == [0, 1, 2]
+    assert [r.getMessage() for r in caplog.records] == ["warning 0", "warning 1", "warning 2"]
+
+    # conflicts between items' files are reported in the item's context:
+    class Item(object):
+        def __init__(self, line):
+            self.source_pos = Position("test.bkl", line)
+        def __str__(self):
+            return "item at line %d" % self.source_pos.line
+    def write(item):
+        with bkl.error.error_context(item):
+            f = bkl.io.OutputFile(str(tmpdir.join("same")), bkl.io.EOL_UNIX,
+                                  creator="writer", create_for=item)
+            f.commit()
+    with pytest.raises(bkl.error.Error) as e:
+        bkl.parallel.map_in_workers(write, [Item(1), Item(2)])
+    assert "for item at line 1 and writer for item at line 2" in e.value.msg
+    assert e.value.pos.line == 2
+
+
+def test_external_projects_metadata_cache(tmpdir):
+    from bkl.plugins.external import (VSProjectMetadataCache,
+                                      VSExternalProject200x, VSExternalProject201x)
+    vcxproj = tmpdir.join("HelloWorldManual.vcxproj")
+    vcxproj.write(open(os.path.join(projects_dir, "externals", "HelloWorldManual.vcxproj"), "rb").read(), "wb")
+    vcproj = os.path.join(projects_dir, "externals", "xmlwrapp_vc9_xmlwrapp.vcproj")
+    cache_file = str(tmpdir.join("cache", "vsprojects.cache"))
+
+    cache = VSProjectMetadataCache(cache_file)
+    meta = cache.get(str(vcxproj), "vcxproj", VSExternalProject201x._read_metadata)
+    assert meta["ToolsVersion"] == "4.0"
+    assert meta["ProjectGuid"] == "{31DC1570-67C5-40FD-9130-C5F57BAEBA88}"
+    assert meta["ProjectName"] is None
+    assert meta["configurations"] == ["Debug", "Release"]
+    assert meta["platforms"] == ["Win32", "Win32"]
+    meta = cache.get(vcproj, "vcproj", VSExternalProject200x._read_metadata)
+    assert meta["attrs"]["Name"] == "xmlwrapp"
+    assert meta["configurations"] == ["Release", "Debug"]
+    assert meta["platforms"] == ["Win32"]
+    assert (cache.hits, cache.misses) == (0, 2)
+    cache.save()
+
+    def fail(data):
+        assert False, "cache entry not used"
+    cache = VSProjectMetadataCache(cache_file)
+    assert cache.get(vcproj, "vcproj", fail)["attrs"]["Name"] == "xmlwrapp"
+    # touching the file doesn't invalidate the entry, changing it does:
+    os.utime(str(vcxproj), (0, 0))
+    assert cache.get(str(vcxproj), "vcxproj", fail)["ToolsVersion"] == "4.0"
+    vcxproj.write(vcxproj.read("rb").replace('ToolsVersion="4.0"', 'ToolsVersion="14.0"'), "wb")
+    meta = cache.get(str(vcxproj), "vcxproj", VSExternalProject201x._read_metadata)
+    assert meta["ToolsVersion"] == "14.0"
+    assert (cache.hits, cache.misses) == (2, 1)
+
+    # in-memory cache doesn't hash the files:
+    cache = VSProjectMetadataCache(None)
+    cache.get(vcproj, "vcproj", VSExternalProject200x._read_metadata)
+    assert [e[2] for e in cache._entries.values()] == [None]
+
+    # metadata following the Microsoft.Cpp.props import are found too:
+    vcxproj.write(vcxproj.read("rb").replace("</Project>",
+        "<PropertyGroup><ProjectName>Renamed</ProjectName></PropertyGroup></Project>"), "wb")
+    meta = cache.get(str(vcxproj), "vcxproj", VSExternalProject201x._read_metadata)
+    assert meta["ProjectName"] == "Renamed"
+
+    with pytest.raises(IOError):
+        cache.get(str(tmpdir.join("missing.vcxproj")), "vcxproj", fail)
+
+
+def test_formatter_cache():
+    from bkl.expr import Formatter, PathAnchorsInfo, ANCHOR_TOP_SRCDIR
+    from bkl.expr import PathExpr, ReferenceExpr, SymbolicFormatter
+    class TestFormatter(Formatter):
+        def placeholder(self, e):
+            return "${%s}" % e.var
+
+    from bkl.parser.ast import Position
+    model = bkl.model.Project()
+    mod = bkl.model.Module(model, Position(projects_dir + "/test.bkl"))
+    mod.add_variable(bkl.model.Variable("foo", LiteralExpr("first")))
+    mod2 = bkl.model.Module(model, Position(projects_dir + "/test2.bkl"))
+    mod2.add_variable(bkl.model.Variable("foo", LiteralExpr("second")))
+
+    fmt = TestFormatter(PathAnchorsInfo("/", projects_dir + "/sub/Makefile", None, mod))
+    def make_path():
+        return PathExpr([LiteralExpr("dir"), LiteralExpr("file.c")], ANCHOR_TOP_SRCDIR)
+    stats = fmt._cache_stats
+    hits = stats.hits
+    assert fmt.format(make_path()) == "../dir/file.c"
+    # structurally equal expressions share the cached value
+    assert fmt.format(ConcatExpr([make_path(), LiteralExpr(".o")])) == "../dir/file.c.o"
+    assert fmt.format(make_path()) == "../dir/file.c"
+    assert stats.hits == hits + 2
+    # references to the same variable in different contexts don't
+    assert fmt.format(ReferenceExpr("foo", mod)) == "first"
+    assert fmt.format(ReferenceExpr("foo", mod2)) == "second"
+    assert stats.hits == hits + 2
+    assert not SymbolicFormatter.use_cache
+
+
+def test_paths_normalizer_skips_normalized_exprs():
+    from bkl.expr import (PathExpr, IfExpr, BoolExpr, PlaceholderExpr,
+                          ANCHOR_SRCDIR, ANCHOR_TOP_SRCDIR)
+    from bkl.interpreter.passes import PathsNormalizer
+    from bkl.parser.ast import Position
+    model = bkl.model.Project()
+    top = bkl.model.Module(model, Position(projects_dir + "/test.bkl"))
+    mod = bkl.model.Module(model, Position(projects_dir + "/sub/test.bkl"))
+
+    normalized = ListExpr([LiteralExpr("foo"),
+                           PathExpr([LiteralExpr("a.c")], ANCHOR_TOP_SRCDIR)])
+    assert not normalized.has_local_paths
+    local = PathExpr([LiteralExpr("b.c")], ANCHOR_SRCDIR, mod.source_file)
+    assert local.has_local_paths
+    cond = BoolExpr(BoolExpr.EQUAL, PlaceholderExpr("config"), LiteralExpr("Debug"))
+    e = IfExpr(cond, ListExpr([normalized, local]), NullExpr())
+    assert e.has_local_paths
+
+    norm = PathsNormalizer(model)
+    norm.set_context(mod)
+    assert norm.visit(normalized) is normalized
+    e2 = norm.visit(e)
+    assert not e2.has_local_paths
+    assert e2.value_yes.items[0] is normalized
+    assert str(e2.value_yes.items[1]) == "@top_srcdir/sub/b.c"
+    assert norm.visit(e2) is e2
+
+
+def test_makefiles_generated_in_workers(tmpdir, monkeypatch):
+    import bkl.parallel
+    if not hasattr(os, "fork"):
+        pytest.skip("worker processes require fork()")
+
+    def generate(jobs, filename):
+        monkeypatch.setattr(bkl.parallel, "jobs", jobs)
+        monkeypatch.setattr(bkl.io, "_all_written_files", {})
+        i = bkl.interpreter.Interpreter()
+        i.limit_toolsets(["gnu"])
+        error = None
+        bkl.io.capture_output()
+        try:
+            i.process_file(filename)
+        except bkl.error.Error as e:
+            error = str(e)
+        finally:
+            captured = bkl.io.end_capture_output()
+        return ([(filename, text) for filename, eol, charset, text, creator, create_for in captured],
+                error)
+
+    submodules = os.path.join(projects_dir, 'submodules', 'main.bkl')
+    serial = generate(1, submodules)
+    assert len(serial[0]) == 3
+    assert generate(3, submodules) == serial
+
+    # errors in build graphs prevent writing any makefiles in both cases:
+    tmpdir.join("main.bkl").write("toolsets = gnu;\n"
+                                  "submodule sub/sub.bkl;\n"
+                                  "program a { sources { a.c } }\n")
+    tmpdir.join("sub", "sub.bkl").write("program b { sources { b.xyz } }\n", ensure=True)
+    serial = generate(1, str(tmpdir.join("main.bkl")))
+    assert serial[0] == []
+    assert "unknown file extension \".xyz\"" in serial[1]
+    assert generate(2, str(tmpdir.join("main.bkl"))) == serial
+
+
+def test_makefile_modules_graph():
+    from bkl.makefile import _ModulesGraph
+    i = InterpreterForTestSuite()
+    i.process_file(os.path.join(projects_dir, 'submodules', 'main.bkl'))
+    model = i.model
+    main, lib, child = model.modules
+    graph = _ModulesGraph(model)
+
+    common = model.get_target("common")
+    assert graph.submodules[main] == [lib, child]
+    assert graph.submodules[child] == []
+    assert graph.target_deps(model.get_target("child")) == [common]
+    assert graph.subtree_deps(main) == set([common])
+    assert graph.subtree_deps(lib) == set()
+    assert graph.child_containing(main, child) is child
+    assert graph.child_containing(main, main) is main
+    assert graph.child_containing(lib, child) is None
+
+
+def test_export_build_graph(tmpdir, monkeypatch):
+    import json, struct
+    import bkl.buildgraph
+    monkeypatch.setattr(bkl.io, "_all_written_files", {})
+    i = bkl.interpreter.Interpreter()
+    i.limit_toolsets(["gnu"])
+    i.build_graph = bkl.buildgraph.BuildGraph()
+    bkl.io.capture_output()
+    try:
+        i.process_file(os.path.join(projects_dir, 'submodules', 'main.bkl'))
+    finally:
+        bkl.io.end_capture_output()
+
+    nodes = i.build_graph.nodes
+    def main_node(target, config):
+        n, = [n for n in nodes if n.main and n.target == target and n.configuration == config]
+        return n
+    main = main_node("main", "Debug")
+    common = main_node("common", "Debug")
+    assert main.module == "main" and main.directory == "."
+    assert common.module == "main::libcommon" and common.directory == "lib"
+    assert common.id in main.deps
+    assert main_node("common", "Release").id not in main.deps
+    assert common.outputs == ["$(_builddir)libcommon.a"]
+    # object files are inputs of the library:
+    assert set(common.deps) == set(n.id for n in nodes
+                                   if n.target == "common" and not n.main and
+                                      n.configuration == "Debug")
+
+    i.build_graph.save(str(tmpdir.join("graph.json")))
+    data = json.load(tmpdir.join("graph.json").open())
+    assert data["version"] == bkl.buildgraph.BuildGraph.FORMAT_VERSION
+    assert data["nodes"][main.id] == main.as_dict()
+
+    i.build_graph.save(str(tmpdir.join("graph.bin")))
+    binary = tmpdir.join("graph.bin").read("rb")
+    assert binary.startswith("BKLGRAPH")
+    version, count = struct.unpack_from("<2I", binary, 8)
+    assert version == 1
+    pos = 16
+    strings = []
+    for x in range(count):
+        length, = struct.unpack_from("<I", binary, pos)
+        strings.append(binary[pos+4:pos+4+length])
+        pos += 4 + length
+    count, = struct.unpack_from("<I", binary, pos)
+    assert count == len(nodes)
+    rec = struct.unpack_from("<7I", binary, pos + 4)
+    assert [strings[x] for x in rec[:5]] == ["gnu", "main", ".", "main", "Debug"]
+
+
+def test_build_graph_analysis(tmpdir, capsys):
+    from bkl.buildgraph import (BuildGraphNode, GraphAnalysis,
+                                GraphAnalyzingInterpreter, load_timings)
+    def node(id, target, output, deps, main=False):
+        n = BuildGraphNode(id, "gnu", "main", ".", target, "Debug", None, main,
+                           [], [], ["$(_builddir)" + output])
+        n.deps = deps
+        return n
+    nodes = [node(0, "lib", "a.o", []),
+             node(1, "lib", "b.o", []),
+             node(2, "lib", "lib.a", [0, 1], main=True),
+             node(3, "app", "main.o", []),
+             node(4, "app", "app", [3, 2], main=True),
+             node(5, "test", "test", [2], main=True)]
+    model = bkl.model.Project()
+
+    a = GraphAnalysis(model, nodes)
+    assert a.depth == 3
+    assert a.widths() == [3, 1, 2]
+    cost, path = a.critical_path()
+    assert cost == 3
+    assert [n.id for n in path] == [0, 2, 4]
+    assert [(c, n.id) for c, n in a.fan_in()] == [(2, 2), (1, 0), (1, 1), (1, 3)]
+    assert a.longest_targets_chain() == ["lib", "app"]
+
+    timings = tmpdir.join("timings")
+    timings.write("# comment\n"
+                  "lib a.o 1.5\n"
+                  "main lib b.o 100 110\n"
+                  "main lib b.o 110 125\n"
+                  "app main.o 20\n")
+    a = GraphAnalysis(model, nodes, load_timings(str(timings)))
+    cost, path = a.critical_path()
+    assert cost == 25
+    assert [n.id for n in path] == [1, 2, 4]
+
+    nodes[0].deps = [4]
+    with pytest.raises(bkl.error.Error):
+        GraphAnalysis(model, nodes)
+
+    i = GraphAnalyzingInterpreter()
+    i.limit_toolsets(["gnu"])
+    i.process_file(os.path.join(projects_dir, 'submodules', 'main.bkl'))
+    out = capsys.readouterr()[0]
+    assert "build graph of toolset gnu, configuration Debug:" in out
+    assert "longest chain of targets (2): common -> child" in out
+    assert "main::child waits for main::libcommon (0 of its 2 nodes not needed" in out
+
+
+def test_timing_report(tmpdir):
+    from bkl.buildgraph import TimingReport, read_timing_records
+    log = tmpdir.join("bkl-timing.log")
+    log.write("main hello hello.o 10 13\n"
+              "main hello hello 13 14\n"
+              "main::sub foo foo.o 10 12\n"
+              "main::sub foo libfoo.a 12 12.5\n"
+              "main::sub foo libfoo.a 12.5 13\n"
+              "main gen gen 9 9.5\n")
+    r = TimingReport(read_timing_records(str(log)))
+    assert r.total_time() == 7.5
+    assert r.wall_time() == 5
+    assert r.by_module() == [(4.5, 3, "main"), (3.0, 3, "main::sub")]
+    assert r.by_file_type() == [(5.0, 2, "o"), (1.5, 2, "(no extension)"), (1.0, 2, "a")]
+    assert r.by_target() == [(4.0, 2, "main::hello"), (3.0, 3, "main::sub::foo"),
+                             (0.5, 1, "main::gen")]
+    assert "main::sub::foo: 3.00s, 40.0% (3 records)" in r.format_report()
+
+    log.write("hello hello.o 3\n")
+    r = TimingReport(read_timing_records(str(log)))
+    assert r.wall_time() is None
+    with pytest.raises(bkl.error.Error):
+        log.write("main hello hello.o 10 x\n")
+        read_timing_records(str(log))
+
+
+def test_batch_processing(tmpdir, monkeypatch):
+    from bkl.batch import BatchProcessor, expand_arguments
+    import bkl.parser
+    lst = tmpdir.join("projects.lst")
+    lst.write("# comment\n"
+              "\n"
+              "one.bkl\n"
+              "sub/two.bkl\n")
+    assert expand_arguments(["first.bkl", "@" + str(lst), str(tmpdir.join("one.bkl"))]) == \
+           ["first.bkl", str(tmpdir.join("one.bkl")), str(tmpdir.join("sub", "two.bkl"))]
+
+    broken = tmpdir.join("broken.bkl")
+    broken.write("program foo {\n")
+    submodules = os.path.join(projects_dir, 'submodules', 'main.bkl')
+
+    def make_interpreter():
+        i = bkl.interpreter.Interpreter()
+        i.limit_toolsets(["gnu"])
+        return i
+
+    monkeypatch.setattr(bkl.io, "_all_written_files", {})
+    bkl.parser.parse_file.clear()
+    hits = bkl.parser.parse_file.hits
+    batch = BatchProcessor(make_interpreter)
+    bkl.io.capture_output()
+    try:
+        assert batch.process([submodules, str(broken)]) == 1
+        # parsed files are reused when processing the same project again:
+        monkeypatch.setattr(bkl.io, "_all_written_files", {})
+        assert batch.process([submodules]) == 0
+    finally:
+        bkl.io.end_capture_output()
+    assert batch.results == [(submodules, 0), (str(broken), 1), (submodules, 0)]
+    assert batch.failed_files() == [str(broken)]
+    assert bkl.parser.parse_file.hits - hits == 3
+
+    batch = BatchProcessor(make_interpreter, reraise=True)
+    with pytest.raises(bkl.error.Error):
+        batch.process([str(broken)])